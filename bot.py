@@ -1,23 +1,112 @@
 import datetime
 import json
 import logging
+import sys
 import traceback
 from typing import Dict
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 from discord.errors import CheckFailure
+from classes import current_guild, guild_configs
+from helpers.auto_defer import auto_defer, install as install_auto_defer
+from helpers.command_index import command_index
+from helpers.http_client import http_client
+from helpers.member_cache import flags as member_cache_flags, member_cache
+from helpers.metrics import command_name, instrument, metrics, serve as serve_metrics, stop_serving as stop_serving_metrics
 from helpers.response_embeds import EmbedStyle
-from helpers.db_handling_sdb import connection as db_connection
+from helpers.scheduler import scheduler
+from helpers.db_handling_sdb import DatabaseUnavailableError, connection as db_connection
+from helpers.startup import timeline
+from helpers.watchdog import watchdog
 
 log = logging.getLogger(__name__)
 
 secrets: Dict[str, str] = json.load(open("secrets.json"))
 config = json.load(open(secrets["config_file"]))
-bot = discord.Bot(
-    debug_guilds=[config["guild"]],
+
+
+class Kolkra(discord.AutoShardedBot):
+    """Keeps the /help command index in sync whenever extensions (cogs) are loaded, unloaded or reloaded.
+
+    Serves every guild in `guild_configs`. Each gateway event is handled as its guild's (see `classes.current_guild`),
+    so config lookups and database queries made while handling it resolve to that guild.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        parsers = self._connection.parsers  # The same dict the shards' websockets dispatch from
+        for event, parser in parsers.items():
+            parsers[event] = self.scoped(parser)
+
+    @staticmethod
+    def scoped(parser):
+        def parse(data):
+            if not isinstance(data, dict) or "guild_id" not in data:
+                return parser(data)
+            token = current_guild.set(int(data["guild_id"]))
+            try:
+                return parser(data)  # Handlers are scheduled as tasks in here, so they inherit the guild
+            finally:
+                current_guild.reset(token)
+
+        return parse
+
+    def load_extension(self, name, **kwargs):
+        result = super().load_extension(name, **kwargs)
+        command_index.rebuild(self)
+        return result
+
+    def unload_extension(self, name, **kwargs):
+        super().unload_extension(name, **kwargs)
+        command_index.rebuild(self)
+
+    def reload_extension(self, name, **kwargs):
+        try:
+            super().reload_extension(name, **kwargs)
+        finally:  # A failed reload rolls back to the old module, which may have different commands than the half-loaded one.
+            command_index.rebuild(self)
+
+    async def process_application_commands(self, interaction: discord.Interaction, auto_sync: bool = None):
+        if interaction.type not in (discord.InteractionType.application_command, discord.InteractionType.auto_complete):
+            return await super().process_application_commands(interaction, auto_sync)
+        kind = "autocomplete" if interaction.type == discord.InteractionType.auto_complete else "command"
+        with metrics.timed(interaction, kind, command_name(interaction)):
+            await super().process_application_commands(interaction, auto_sync)
+
+    async def close(self):
+        trim_member_cache.cancel()
+        await super().close()
+        await http_client.close()
+        await stop_serving_metrics()
+        watchdog.stop()
+        scheduler.stop()
+        await db_connection.ateardown()  # Also flushes the read cache
+
+    def restore_extension(self, name: str, lib, modules: dict):
+        """Puts an old extension module back after its replacement failed, the same way reload_extension rolls back a failed reload.
+
+        Args:
+            name (str): The extension name.
+            lib (ModuleType): The old extension module.
+            modules (dict): The old module and its submodules, as they were in sys.modules.
+        """
+        if name in self.extensions:
+            self.unload_extension(name)
+        lib.setup(self)
+        self._CogMixin__extensions[name] = lib  # py-cord keeps no public way to register an already imported extension.
+        sys.modules.update(modules)
+        command_index.rebuild(self)
+
+
+bot = Kolkra(
+    debug_guilds=guild_configs.ids,
+    shard_count=config.get("shard_count"),  # None lets Discord recommend one
     intents=discord.Intents(members=True, guilds=True, messages=True),
+    member_cache_flags=member_cache_flags,
+    chunk_guilds_at_startup=False,  # Members are cached as they join or interact instead, see helpers.member_cache
 )
-guild = lambda: bot.get_guild(config["guild"])
+instrument()
+install_auto_defer()  # Slow handlers get deferred before Discord gives up on them, see helpers.auto_defer
 
 
 @bot.slash_command(description="Check the bot's status.")
@@ -39,20 +128,12 @@ async def help(
     command=discord.Option(
         str,
         description="The command to get help for.",
-        autocomplete=discord.utils.basic_autocomplete(
-            lambda ctx: [
-                cmd.qualified_name
-                for cmd in bot.walk_application_commands()
-                if type(cmd) != discord.SlashCommandGroup
-            ]
-        ),
+        autocomplete=lambda actx: command_index.complete(actx.value),
         default=None,
     ),
 ):
     """You really need help with using the /help command? You just used it. Have an Easter egg: 🥚"""
-    try:
-        command = bot.get_application_command(command)
-    except AttributeError:
+    if not (embed := command_index.embed(command)):
         await ctx.send_response(
             embed=EmbedStyle.Info.value.embed(
                 title="About Kolkra",
@@ -61,13 +142,7 @@ async def help(
             ephemeral=True,
         )
     else:
-        await ctx.send_response(
-            embed=EmbedStyle.Info.value.embed(
-                title=f"Command info: {command.mention}",
-                description=command.callback.__doc__,
-            ),
-            ephemeral=True,
-        )
+        await ctx.send_response(embed=embed, ephemeral=True)
 
 
 @bot.event
@@ -79,9 +154,32 @@ async def on_login():
 async def on_ready():
     global last_ready_time
     last_ready_time = datetime.datetime.now()
+    timeline.ready()
+    watchdog.start()
+    if "metrics_port" in config:
+        await serve_metrics(config["metrics_port"])
+    command_index.rebuild(bot)  # Commands have IDs (and working mentions) once they're synced.
+    if not trim_member_cache.is_running():
+        trim_member_cache.start()
+    try:
+        await scheduler.start(bot)
+    except Exception:
+        log.exception("Failed to load scheduled jobs")
     log.info("Ready!")
 
 
+@bot.listen()
+async def on_interaction(interaction: discord.Interaction):
+    member_cache.seen(interaction.user.id)
+    auto_defer.watch(interaction)
+
+
+@tasks.loop(hours=1)
+async def trim_member_cache():
+    for server in bot.guilds:
+        log.info("Dropped %d inactive members of %s from the cache, %d left", member_cache.trim(server), server, len(server.members))
+
+
 @bot.event
 async def on_error(event, *args, **kwargs):
     log.exception(f'Uncaught exception in event "{event}"!')
@@ -115,6 +213,15 @@ async def on_application_command_error(
                 description="An argument could not be parsed successfully.",
             )
         )
+    elif isinstance(getattr(error, "original", None), DatabaseUnavailableError):
+        await ctx.respond(
+            embed=EmbedStyle.Wait.value.embed(
+                title="Database unreachable",
+                description="The database is down or restarting, and there's no cached copy of what you asked for. Try again in a bit.",
+            ),
+            ephemeral=True,
+        )
+        log.warning(f'"{ctx.command}" failed: {error.original}')
     elif isinstance(error, CheckFailure):
         await ctx.respond(
             embed=EmbedStyle.AccessDenied.value.embed(
@@ -1,15 +1,154 @@
 import asyncio
+import collections
+import contextlib
+import contextvars
 import datetime
 import json
+import logging
 from dataclasses import dataclass, field
-from typing import Callable, Dict
+from typing import Any, Callable, Coroutine, Dict, Hashable, List, Set, Tuple
 
 import discord
 
+log = logging.getLogger(__name__)
+
 secrets: Dict[str, str] = json.load(open("secrets.json"))
 config = json.load(open(secrets['config_file']))
 
 
+def merge(base: dict, overrides: dict) -> dict:
+    """Layers one config over another, merging nested sections (like "captcha") key by key."""
+    merged = dict(base)
+    for key, value in overrides.items():
+        merged[key] = merge(base[key], value) if isinstance(value, dict) and isinstance(base.get(key), dict) else value
+    return merged
+
+
+class GuildConfigs:
+    """Per-guild settings, so one process can serve several guilds.
+
+    The top-level config belongs to the home guild. Partner guilds are listed under "guilds" by ID, each layered over the top-level config,
+    so a partner only has to override what differs (its roles, channels...). Each guild keeps its data in its own database ("database").
+    """
+
+    def __init__(self, config: dict):
+        self.home: int = config["guild"]
+        home = {key: value for key, value in config.items() if key != "guilds"}
+        home.setdefault("database", "bar")
+        self.configs: Dict[int, dict] = {self.home: home}
+        for guild_id, overrides in config.get("guilds", {}).items():
+            self.configs[int(guild_id)] = merge(home, {"database": f"guild_{guild_id}"} | overrides) | {"guild": int(guild_id)}
+
+    def __getitem__(self, guild_id: int) -> dict:
+        return self.configs[guild_id]
+
+    def __contains__(self, guild_id: int) -> bool:
+        return guild_id in self.configs
+
+    def get(self, guild_id: int) -> dict | None:
+        return self.configs.get(guild_id)
+
+    @property
+    def ids(self) -> List[int]:
+        return list(self.configs)
+
+    def current(self) -> dict:
+        """The config of the guild the running code is handling (see `current_guild`), or the home guild's."""
+        return self.configs.get(current_guild.get(), self.configs[self.home])
+
+    @contextlib.contextmanager
+    def use(self, guild_id: int):
+        """Handles the code in the block as the given guild's, e.g. for background work that belongs to a guild."""
+        token = current_guild.set(guild_id)
+        try:
+            yield self.current()
+        finally:
+            current_guild.reset(token)
+
+
+# The guild the running code is handling. Set for every gateway event that belongs to a guild, and inherited by the tasks it starts.
+current_guild: contextvars.ContextVar[int] = contextvars.ContextVar("current_guild", default=config["guild"])
+guild_configs = GuildConfigs(config)
+
+
+ANY = object()  # Key for waiters that want to re-check on every state change
+
+
+class ObservableState:
+    """Keyed state that can be awaited without polling.
+
+    Setting a key wakes only the waiters on that key (and on `ANY`) whose predicate now holds, so waiting costs nothing until the state actually changes.
+    """
+
+    def __init__(self):
+        self.values: Dict[Hashable, Any] = {}
+        self.waiters: Dict[Hashable, List[Tuple[Callable[[Any], bool], asyncio.Future]]] = collections.defaultdict(list)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        return self.values.get(key, default)
+
+    def set(self, key: Hashable, value: Any):
+        self.values[key] = value
+        self.notify(key)
+
+    def delete(self, key: Hashable):
+        self.values.pop(key, None)
+        self.notify(key)
+
+    def notify(self, key: Hashable):
+        """Re-checks the waiters on a key. Call it after changing a value in place."""
+        for waiting_on in (key, ANY):
+            if waiting_on not in self.waiters:
+                continue
+            value = self.values.get(waiting_on)
+            remaining = []
+            for predicate, future in self.waiters[waiting_on]:
+                if future.done():
+                    continue
+                try:
+                    ready = predicate(value)
+                except Exception as e:  # The waiter gets its own error, writers and other waiters carry on
+                    future.set_exception(e)
+                    continue
+                if ready:
+                    future.set_result(value)
+                else:
+                    remaining.append((predicate, future))
+            if remaining:
+                self.waiters[waiting_on] = remaining
+            else:
+                del self.waiters[waiting_on]
+
+    async def wait(self, key: Hashable, predicate: Callable[[Any], bool] = bool, timeout: float = None) -> bool:
+        """Waits until the value of a key satisfies a predicate.
+
+        Args:
+            key (Hashable): The key to watch, or `ANY` to re-check after every change.
+            predicate (Callable[[Any], bool], optional): Checks the value (None if unset). Defaults to truthiness.
+            timeout (float, optional): Seconds to wait at most. Defaults to waiting forever.
+
+        Returns:
+            bool: Whether the predicate held before timing out.
+        """
+        if predicate(self.values.get(key)):
+            return True
+        future = asyncio.get_running_loop().create_future()
+        self.waiters[key].append((predicate, future))
+        try:
+            await asyncio.wait_for(future, timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            if key in self.waiters:
+                self.waiters[key] = [waiter for waiter in self.waiters[key] if waiter[1] is not future]
+                if not self.waiters[key]:
+                    del self.waiters[key]
+
+
+state = ObservableState()
+
+
 async def wait_for(
     condition: Callable[..., bool],
     timeout: float = None,
@@ -17,20 +156,45 @@ async def wait_for(
     *args,
     **kwargs,
 ) -> bool:
-    if timeout:
-        stop_time = datetime.datetime.now() + datetime.timedelta(seconds=timeout)
+    """Compatibility wrapper around `state.wait`: waits until `condition(*args, **kwargs)` is true.
+
+    The condition is re-checked on every change to `state`, and also every `poll_interval` seconds in case it depends on something `state` doesn't track.
+    Pass poll_interval=None to rely on notifications alone, or better, use `state.wait` directly.
+    """
+    check = lambda _: condition(*args, **kwargs)
+    if poll_interval is None:
+        return await state.wait(ANY, check, timeout or None)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout if timeout else None
     while True:
-        if condition(*args, **kwargs):
+        wait = poll_interval if deadline is None else min(poll_interval, max(deadline - loop.time(), 0))
+        if await state.wait(ANY, check, wait):
             return True
-        elif timeout:
-            if datetime.datetime.now() > stop_time:
-                return False
-        await asyncio.sleep(poll_interval)
+        if deadline is not None and loop.time() >= deadline:
+            return False
 
 
 clean = discord.utils.escape_markdown
 
 
 async def delay(duration: float, coroutine, **kwargs):
+    """Runs a coroutine after a short in-memory delay. Anything longer, or that should survive a restart, belongs in `helpers.scheduler`."""
     await asyncio.sleep(duration)
-    await coroutine(**kwargs)
\ No newline at end of file
+    await coroutine(**kwargs)
+
+
+background_tasks: Set[asyncio.Task] = set()  # The event loop only keeps weak references to tasks, so unawaited ones are kept alive here
+
+
+def background(coroutine: Coroutine, name: str = None) -> asyncio.Task:
+    """Starts a task nobody is going to await. It's kept alive until it's done, and logged if it fails."""
+    task = asyncio.create_task(coroutine, name=name)
+    background_tasks.add(task)
+    task.add_done_callback(_finished)
+    return task
+
+
+def _finished(task: asyncio.Task):
+    background_tasks.discard(task)
+    if not task.cancelled() and (error := task.exception()):
+        log.error("Background task %s failed", task.get_name(), exc_info=error)
@@ -1,7 +1,21 @@
+import base64
+import dataclasses
+import datetime
+import gzip
+import json
 import logging
 import os
+import tempfile
+import zlib
 import discord
 from helpers.command_checks import is_admin_or_dev
+from helpers.db_handling_sdb import connection, restoring, ser
+from helpers.http_client import http_client
+from helpers.lan_servers import lan_servers
+from helpers.paginator import ResourcePages
+from helpers.profile_index import profile_index
+from helpers.response_embeds import EmbedStyle
+from cogs.profile import PlayerProfile
 
 
 from classes import *
@@ -9,14 +23,179 @@ from classes import *
 
 log = logging.getLogger(__name__)
 
+requires = ["cogs.profile"]
+
+page_size = 500  # Rows fetched or written per database round trip
+progress_every = 5000  # Rows between progress message edits
+spool_size = 8 * 1024 * 1024  # Exports bigger than this go to a temporary file instead of memory
+
+
+def imported_datetime(value) -> datetime.datetime | None:
+    """A datetime from an export: an ISO string, or exactly the shape jsonpickle gives datetimes. Anything else raises ValueError."""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return datetime.datetime.fromisoformat(value)
+    if (
+        isinstance(value, dict)
+        and value.keys() == {"py/object", "__reduce__"}
+        and value["py/object"] == "datetime.datetime"
+        and isinstance(reduce := value["__reduce__"], list)
+        and len(reduce) == 2
+        and reduce[0] == {"py/type": "datetime.datetime"}
+        and isinstance(reduce[1], list)
+        and len(reduce[1]) == 1
+        and isinstance(reduce[1][0], str)
+    ):
+        state = base64.b64decode(reduce[1][0], validate=True)  # The pickled state, decoded by hand instead of by jsonpickle
+        if len(state) != 10:
+            raise ValueError(f"Not a datetime: {value!r}")
+        try:
+            return datetime.datetime(state)
+        except (TypeError, ValueError) as e:  # datetime takes bytes it can't read for a year, and raises TypeError
+            raise ValueError(f"Not a datetime: {value!r}") from e
+    raise ValueError(f"Not a datetime: {value!r}")
+
+
+def imported_profile(record: dict) -> PlayerProfile:
+    """Builds a profile from an export record, without decoding it with jsonpickle: import files are untrusted,
+    and jsonpickle calls whatever a payload names. Raises ValueError for anything but the fields of a profile."""
+    if record.get("py/object") != "cogs.profile.PlayerProfile":
+        raise ValueError("Not a player profile")
+    fields = {field.name for field in dataclasses.fields(PlayerProfile)}
+    values = {key: value for key, value in record.items() if key != "py/object"}
+    if unknown := values.keys() - fields:
+        raise ValueError(f"Unknown fields {unknown}")
+    for key in ("created_at", "updated_at"):
+        if key in values:
+            values[key] = imported_datetime(values[key])
+    if values.get("created_at") is None:
+        values.pop("created_at", None)
+    if not isinstance(values.get("id"), str) or not values["id"].startswith("PlayerProfile:"):
+        raise ValueError("Bad ID")
+    if not isinstance(values.get("owner_id"), int) or isinstance(values["owner_id"], bool):
+        raise ValueError("Bad owner ID")
+    for key in ("friend_code", "main_lan_server", "xtag", "ign"):
+        if not isinstance(values.get(key), (str, type(None))):
+            raise ValueError(f"Bad {key}")
+    token = restoring.set(True)  # Keep the exported updated_at
+    try:
+        return PlayerProfile(**values)
+    finally:
+        restoring.reset(token)
+
 
 class AdminCog(discord.Cog):
     def __init__(self, bot: discord.Bot):
         self.bot = bot
 
     root = discord.SlashCommandGroup(
-        name="admin", description="Administrative stuff.", checks=[is_admin_or_dev]
+        name="admin", description="Administrative stuff.", checks=[is_admin_or_dev], guild_ids=[guild_configs.home]
     )
+    profiles = root.create_subgroup("profiles", "Back up and migrate player profiles.")
+
+    @profiles.command(name="list", description="Browse every player profile.")
+    async def list_profiles(self, ctx: discord.ApplicationContext):
+        """Lists player profiles 10 at a time, with buttons to flip through the pages."""
+        view = ResourcePages(
+            PlayerProfile,
+            lambda profile: " | ".join(
+                [f"<@{profile.owner_id}>"]
+                + [f"{label}: `{value}`" for label, value in (("FC", profile.friend_code), ("IGN", profile.ign), ("XTag", profile.xtag)) if value]
+            ),
+            ctx.author.id,
+            title="Player profiles",
+        )
+        await ctx.send_response(embed=await view.show(0), view=view, ephemeral=True)
+
+    @profiles.command(name="export", description="Download every player profile as a gzipped JSON lines file.")
+    async def export_profiles(self, ctx: discord.ApplicationContext):
+        """Streams the player profile table page by page into a gzip-compressed JSONL file, one raw record per line."""
+        await ctx.defer(ephemeral=True)
+        rows = 0
+        with tempfile.SpooledTemporaryFile(spool_size) as file:
+            with gzip.GzipFile(fileobj=file, mode="wb") as archive:
+                async for page in connection.stream_table("PlayerProfile", page_size):
+                    archive.write("".join(json.dumps(row) + "\n" for row in page).encode())
+                    rows += len(page)
+            file.seek(0)
+            await ctx.send_followup(
+                embed=EmbedStyle.Ok.value.embed(title="Export complete", description=f"Exported {rows} player profiles."),
+                file=discord.File(file, filename=f"profiles-{datetime.date.today()}.jsonl.gz"),
+                ephemeral=True,
+            )
+
+    @profiles.command(name="import", description="Import player profiles from an export file.")
+    async def import_profiles(
+        self,
+        ctx: discord.ApplicationContext,
+        file: discord.Option(discord.Attachment, description="A file made by /admin profiles export (.jsonl.gz or plain .jsonl)."),
+    ):
+        """Reads an export file as it downloads and upserts its profiles in batches. Profiles with the same ID are overwritten.
+        Args:
+            file (Attachment): The export file. Gzipped unless its name doesn't end in .gz.
+        """
+        await ctx.defer(ephemeral=True)
+        progress = await ctx.send_followup(
+            embed=EmbedStyle.Wait.value.embed(title="Importing profiles", description="Starting..."), ephemeral=True
+        )
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS) if file.filename.endswith(".gz") else None
+        buffer, batch = b"", []
+        imported = skipped = 0
+
+        async def flush():
+            nonlocal imported, batch
+            await connection.upsert_raw([ser(profile) for profile in batch])
+            for profile in batch:
+                profile_index.add(profile)
+                lan_servers.track(profile.owner_id, profile.main_lan_server)
+            if (imported + len(batch)) // progress_every > imported // progress_every:
+                await progress.edit(
+                    embed=EmbedStyle.Wait.value.embed(
+                        title="Importing profiles", description=f"{imported + len(batch)} imported so far, {skipped} skipped."
+                    )
+                )
+            imported += len(batch)
+            batch = []
+
+        def parse(line: bytes):
+            nonlocal skipped
+            if not line.strip():
+                return
+            try:
+                record = json.loads(line)
+            except ValueError:
+                skipped += 1
+                return
+            try:
+                batch.append(imported_profile(record if isinstance(record, dict) else {}))
+            except ValueError:
+                skipped += 1
+
+        try:
+            async with http_client.session.get(file.url) as response:
+                response.raise_for_status()
+                async for chunk in response.content.iter_chunked(64 * 1024):
+                    buffer += decompressor.decompress(chunk) if decompressor else chunk
+                    *lines, buffer = buffer.split(b"\n")
+                    for line in lines:
+                        parse(line)
+                        if len(batch) >= page_size:
+                            await flush()
+            for line in (buffer + (decompressor.flush() if decompressor else b"")).split(b"\n"):
+                parse(line)
+            await flush()
+        except Exception as e:
+            log.exception("Profile import failed")
+            return await progress.edit(
+                embed=EmbedStyle.Error.value.embed(
+                    title="Import failed",
+                    description=f"{imported} profiles were imported before the error, {skipped} skipped.\n`{e}`",
+                )
+            )
+        await progress.edit(
+            embed=EmbedStyle.Ok.value.embed(title="Import complete", description=f"Imported {imported} player profiles, skipped {skipped} invalid lines.")
+        )
 
 
 def setup(bot: discord.Bot):
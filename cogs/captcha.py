@@ -1,21 +1,70 @@
+import asyncio
 import datetime
+import functools
+import io
 import logging
 import random
 from dataclasses import dataclass
 import discord
 import discord.ext.commands as cmd
-from captcha.audio import AudioCaptcha
-from captcha.image import ImageCaptcha
-from classes import config
+from classes import background, guild_configs
 from helpers.command_checks import is_admin_or_dev
+from helpers.outbound import Priority, outbound
 from helpers.response_embeds import EmbedStyle
 
-audio = AudioCaptcha()
-image = ImageCaptcha()
 log = logging.getLogger(__name__)
-unverified_role = lambda bot: bot.get_guild(config["guild"]).get_role(
-    config["captcha"]["unverified_role"]
-)  # Using a lambda becase this will return None before the bot is authenticated with Discord.
+
+
+@functools.cache
+def image():
+    """The shared CAPTCHA image generator. Built on first use, since the captcha library pulls in PIL and loads fonts."""
+    from captcha.image import ImageCaptcha
+
+    return ImageCaptcha()
+
+
+@functools.cache
+def audio():
+    """The shared audio CAPTCHA generator, built on first use."""
+    from captcha.audio import AudioCaptcha
+
+    return AudioCaptcha()
+
+
+pool_size = 8
+challenge_pool: list[tuple[str, bytes]] = []  # Pregenerated (answer, PNG image) pairs, ready to send.
+refilling = False
+
+
+def new_challenge() -> tuple[str, bytes]:
+    chars = "".join(
+        [random.choice("1234567890QWERTYUIOPASDFGHJKLZXCVBNM") for _ in range(5)]
+    )
+    return chars, image().generate(chars, format="png").getvalue()
+
+
+async def fill_pool():
+    """Tops up the challenge pool in a worker thread, since image generation blocks."""
+    global refilling
+    if refilling:
+        return
+    refilling = True
+    try:
+        while len(challenge_pool) < pool_size:
+            challenge_pool.append(await asyncio.to_thread(new_challenge))
+    finally:
+        refilling = False
+
+
+async def take_challenge() -> tuple[str, bytes]:
+    """Takes a pregenerated challenge from the pool and refills it in the background. Generates one on the spot if the pool ran dry."""
+    background(fill_pool(), "captcha pool refill")
+    if challenge_pool:
+        return challenge_pool.pop()
+    return await asyncio.to_thread(new_challenge)
+
+
+unverified_role = lambda guild: guild.get_role(guild_configs[guild.id]["captcha"]["unverified_role"])
 
 
 class StartView(discord.ui.View):
@@ -35,7 +84,7 @@ class StartView(discord.ui.View):
                 ),
                 ephemeral=True,
             )
-        elif not interaction.user.get_role(config["captcha"]["unverified_role"]):
+        elif not interaction.user.get_role(guild_configs[interaction.guild_id]["captcha"]["unverified_role"]):
             await interaction.response.send_message(
                 embed=EmbedStyle.Ok.value.embed(
                     title="Already verified",
@@ -53,26 +102,25 @@ class StartView(discord.ui.View):
                 ephemeral=True,
             )
         else:
-            # Generate a captcha image
-            chars = "".join(
-                [
-                    random.choice("1234567890QWERTYUIOPASDFGHJKLZXCVBNM")
-                    for _ in range(5)
-                ]
-            )
-            captcha = image.generate(chars, format="png")
+            # Get a captcha image
+            chars, captcha = await take_challenge()
             # Send the captcha image
             try:
-                await self.member.send(
-                    embed=EmbedStyle.Question.value.embed(
-                        title="Solve the CAPTCHA!",
-                        description="Please enter the text displayed in the attached CAPTCHA image.",
-                    )
-                    .add_field(
-                        name="Timeout",
-                        value=f"<t:{int(datetime.datetime.now().timestamp()) + 120}:R>",
+                # The interaction hasn't been responded to yet, so this DM gets the highest priority.
+                await outbound.send(
+                    Priority.INTERACTION,
+                    f"dm:{self.member.id}",
+                    lambda: self.member.send(
+                        embed=EmbedStyle.Question.value.embed(
+                            title="Solve the CAPTCHA!",
+                            description="Please enter the text displayed in the attached CAPTCHA image.",
+                        )
+                        .add_field(
+                            name="Timeout",
+                            value=f"<t:{int(datetime.datetime.now().timestamp()) + 120}:R>",
+                        ),
+                        file=discord.File(io.BytesIO(captcha), filename="captcha.png")
                     ),
-                    file=discord.File(captcha, filename="captcha.png")
                 )
             except discord.Forbidden:
                 await interaction.response.send_message(
@@ -110,20 +158,28 @@ class StartView(discord.ui.View):
                     )
                 if response.content.lower() == chars.lower():
                     await self.member.remove_roles(
-                        unverified_role(self.bot),
+                        unverified_role(self.member.guild),
                         reason="Verification passed",
                     )
-                    await self.member.send(
-                        embed=EmbedStyle.Ok.value.embed(
-                            description="You've passed verification! You're ready to fest now.",
-                        )
+                    await outbound.send(
+                        Priority.DM,
+                        f"dm:{self.member.id}",
+                        lambda: self.member.send(
+                            embed=EmbedStyle.Ok.value.embed(
+                                description="You've passed verification! You're ready to fest now.",
+                            )
+                        ),
                     )
                 else:
-                    await self.member.send(
-                        embed=EmbedStyle.Error.value.embed(
-                            title="Verification failed",
-                            description="You entered an incorrect response. You may try again when the current CAPTCHA times out.",
-                        )
+                    await outbound.send(
+                        Priority.DM,
+                        f"dm:{self.member.id}",
+                        lambda: self.member.send(
+                            embed=EmbedStyle.Error.value.embed(
+                                title="Verification failed",
+                                description="You entered an incorrect response. You may try again when the current CAPTCHA times out.",
+                            )
+                        ),
                     )
 
 
@@ -146,12 +202,14 @@ class CaptchaCog(discord.Cog):
         Args:
             member (discord.Member): The new member.
         """
+        if member.guild.id not in guild_configs:  # Not a guild the bot serves
+            return
         global prompt_generated
         prompt_generated.append(member.id)
         await member.add_roles(
-            unverified_role(self.bot), reason="Starting verification"
+            unverified_role(member.guild), reason="Starting verification"
         )
-        await self.bot.get_channel(config["captcha"]["verification_channel"]).send(
+        await self.bot.get_channel(guild_configs[member.guild.id]["captcha"]["verification_channel"]).send(
             member.mention,
             embed=EmbedStyle.Question.value.embed(
                 title="Verification required",
@@ -179,7 +237,7 @@ class CaptchaCog(discord.Cog):
     async def regenerate(self, ctx: discord.ApplicationContext):
         """Manually regenerate your verification prompt, in case of a bot restart."""
         global prompt_generated
-        if not ctx.author.get_role(config["captcha"]["unverified_role"]):
+        if not ctx.author.get_role(guild_configs[ctx.guild_id]["captcha"]["unverified_role"]):
             await ctx.send_response(
                 embed=EmbedStyle.Ok.value.embed(
                     title="Already verified",
@@ -205,3 +263,8 @@ class CaptchaCog(discord.Cog):
 def setup(bot: discord.Bot):
     bot.add_cog(CaptchaCog(bot))
     log.info("Cog initialized")
+
+
+async def asetup(bot: discord.Bot):
+    await fill_pool()
+    log.info("CAPTCHA pool primed with %d challenges", len(challenge_pool))
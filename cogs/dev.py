@@ -1,10 +1,21 @@
+import io
 import logging
 import os
 import sys
+import tempfile
+import tracemalloc
 import discord
 from classes import *
-from aiohttp import client
+from helpers.cog_loader import dependents, load_cogs
+from helpers.http_client import http_client
+from helpers.member_cache import member_cache
+from helpers.metrics import metrics
+from helpers.outbound import outbound
+from helpers.profiler import profile_loop
+from helpers.replay import Recorder
 from helpers.response_embeds import EmbedStyle
+from helpers.startup import timeline
+from helpers.watchdog import watchdog
 
 log = logging.getLogger(__name__)
 
@@ -13,14 +24,28 @@ async def is_owner(ctx: discord.ApplicationContext):
     return await ctx.bot.is_owner(ctx.user)
 
 
+async def git(*args: str) -> str:
+    """Runs a git command and returns its output."""
+    process = await asyncio.create_subprocess_exec(
+        "git", *args, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+    )
+    stdout, stderr = await process.communicate()
+    if process.returncode:
+        raise OSError(f"git {' '.join(args)} returned exit status {process.returncode}: {stderr.decode().strip()}")
+    return stdout.decode().strip()
+
+
 class DevCog(discord.Cog):
     def __init__(self, bot: discord.Bot):
         self.bot = bot
+        self.last_snapshot: tracemalloc.Snapshot = None  # For /dev memory
+        self.recording = False  # For /dev record, two recorders would restore each other's parsers
 
     root = discord.SlashCommandGroup(
         name="dev",
         description="Internal commands restricted to M1N3R only.",
         checks=[is_owner],
+        guild_ids=[guild_configs.home],
     )
 
     async def fetch_merge(self, ctx, commit_id):
@@ -45,17 +70,16 @@ class DevCog(discord.Cog):
         if (
             len(output) > 4000
         ):  # If the response is too long, upload it to Hastebin and return a link to the uploaded text.
-            async with client.ClientSession() as session:
-                async with session.post(
-                    "https://hastebin.com/documents",
-                    data=output,
-                    headers={
-                        "content-type": "text/plain",
-                        "Authorization": f"Bearer {secrets['hastebin_token']}",
-                    },
-                    raise_for_status=True,
-                ) as response:
-                    paste_id = (await response.json())["key"]
+            async with http_client.session.post(
+                "https://hastebin.com/documents",
+                data=output,
+                headers={
+                    "content-type": "text/plain",
+                    "Authorization": f"Bearer {secrets['hastebin_token']}",
+                },
+                raise_for_status=True,
+            ) as response:
+                paste_id = (await response.json())["key"]
             await ctx.send_followup(
                 embed=EmbedStyle.Ok.value.embed(
                     title="Output uploaded to Hastebin",
@@ -75,34 +99,223 @@ class DevCog(discord.Cog):
     @root.command(name="hot-update", description="Update cogs without a cold start.")
     async def hot_update(self, ctx: discord.ApplicationContext, commit_id: str):
         """Automatically update Kolkra's cogs (command modules) without taking her offline entirely. Updates to code/config info outside of cogs requires a full update.
+        Only cogs changed by the update (and cogs that require them) are reloaded, everything else stays live. If a cog's new version fails to load, its old version is kept.
         Args:
             commit_id (str): The commit ID to update to. The commit must be on the main branch.
         """
         await ctx.defer(ephemeral=True)
+        old_head = await git("rev-parse", "HEAD")
         await self.fetch_merge(ctx, commit_id)
-        # Unload the old cogs
-        for cog in list(self.bot.extensions.keys()):
-            self.bot.unload_extension(cog)
-        # Load in the new cogs
-        errors = {}
-        for cog in os.listdir("cogs"):
-            if cog.startswith("."):
-                continue
-            try:
-                self.bot.load_extension(f'cogs.{cog.removesuffix(".py")}')
-            except Exception as e:
-                errors[cog] = e
-        if errors:
-            error_list = "\n".join([f"- {k}: {v}" for k, v in errors.items()])
-            return await ctx.send_followup(
-                embed=EmbedStyle.Warning.value.embed(
-                    title="Cog reloading failed", description=error_list
+        changed = (await git("diff", "--name-only", old_head, "HEAD")).splitlines()
+        changed_cogs = {
+            f"cogs.{os.path.basename(path).removesuffix('.py')}"
+            for path in changed
+            if os.path.dirname(path) == "cogs"
+            and path.endswith(".py")
+            and not os.path.basename(path).startswith(".")
+        }
+        other_changes = [path for path in changed if os.path.dirname(path) != "cogs" or not path.endswith(".py")]
+        # Unload deleted cogs
+        removed = {name for name in changed_cogs if not os.path.exists(f"{name.replace('.', '/')}.py")}
+        for name in removed & set(self.bot.extensions):
+            self.bot.unload_extension(name)
+        # Reload changed cogs and their dependents, load new cogs
+        results = await load_cogs(
+            self.bot, (changed_cogs - removed) | dependents(self.bot, changed_cogs)
+        )
+        embed = (
+            EmbedStyle.Warning.value.embed(title="Cog reloading failed")
+            if any(result.error for result in results.values())
+            else EmbedStyle.Ok.value.embed(description="All changed cogs updated successfully." if results else "No cogs were changed.")
+        )
+        if results:
+            embed.add_field(
+                name="Cogs",
+                value="\n".join(
+                    f"- {name}: {result.error} ({'kept old version' if result.rolled_back else 'unloaded'})"
+                    if result.error
+                    else f"- {name}: {'reloaded' if result.reloaded else 'loaded'} in {result.seconds * 1000:.0f}ms"
+                    for name, result in results.items()
+                )[:1024],
+                inline=False,
+            )
+        if removed:
+            embed.add_field(name="Removed cogs", value="\n".join(f"- {name}" for name in removed), inline=False)
+        if other_changes:
+            embed.add_field(
+                name="Changes outside of cogs (full update required)",
+                value="\n".join(f"- `{path}`" for path in other_changes)[:1024],
+                inline=False,
+            )
+        return await ctx.send_followup(embed=embed)
+
+    @root.command(name="startup-report", description="Show where the last cold start spent its time.")
+    async def startup_report(self, ctx: discord.ApplicationContext):
+        """Shows the startup timeline of the running process: time to READY, how long each cog took to set up, and the slowest module imports."""
+        ms = lambda seconds: f"{seconds * 1000:.0f}ms"
+        embed = EmbedStyle.Info.value.embed(title="Startup report").add_field(
+            name="Time to READY",
+            value=ms(timeline.ready_after) if timeline.ready_after is not None else "Not ready yet",
+        )
+        embed.add_field(name="Modules imported", value=str(len(timeline.imports)))
+        embed.add_field(
+            name="Milestones",
+            value="\n".join(f"{label}: {ms(at)}" for label, at in timeline.marks) or "None",
+            inline=False,
+        )
+        embed.add_field(
+            name="Cog setup",
+            value="\n".join(
+                f"`{name}`: {ms(seconds)}"
+                for name, seconds in sorted(timeline.cogs.items(), key=lambda item: item[1], reverse=True)
+            ) or "None",
+            inline=False,
+        )
+        embed.add_field(
+            name="Slowest imports (excluding nested imports)",
+            value="\n".join(f"`{name}`: {ms(seconds)}" for name, seconds in timeline.slowest_imports(10)) or "None",
+            inline=False,
+        )
+        await ctx.send_response(embed=embed, ephemeral=True)
+
+    @root.command(name="http-pool", description="Show shared HTTP connection pool stats.")
+    async def http_pool(self, ctx: discord.ApplicationContext):
+        """Shows utilization stats for the HTTP connection pool shared by all cogs."""
+        embed = EmbedStyle.Info.value.embed(title="HTTP connection pool")
+        for name, value in http_client.stats().items():
+            embed.add_field(name=name, value=str(value))
+        await ctx.send_response(embed=embed, ephemeral=True)
+
+    @root.command(name="outbound", description="Show outbound message scheduler stats.")
+    async def outbound_stats(self, ctx: discord.ApplicationContext):
+        """Shows queue depths, queueing delays and rate limit waits of the outbound message scheduler."""
+        embed = EmbedStyle.Info.value.embed(title="Outbound scheduler")
+        for name, value in outbound.stats().items():
+            embed.add_field(name=name, value=value, inline=False)
+        await ctx.send_response(embed=embed, ephemeral=True)
+
+    @root.command(name="profile", description="Profile the event loop for a few seconds.")
+    async def profile(
+        self,
+        ctx: discord.ApplicationContext,
+        seconds: discord.Option(int, description="How long to profile for.", min_value=1, max_value=120, default=10),
+    ):
+        """Runs a sampling profiler on the event loop thread, then sends the hottest functions, the tasks that held the loop the longest, and flamegraph-ready collapsed stacks.
+        Args:
+            seconds (int, optional): How long to profile for. Defaults to 10.
+        """
+        await ctx.defer(ephemeral=True)
+        result = await profile_loop(seconds)
+        await ctx.send_followup(
+            embed=EmbedStyle.Ok.value.embed(
+                title="Profile complete",
+                description=f"Collected {result.samples} samples over {seconds}s.",
+            ),
+            files=[
+                discord.File(io.BytesIO(result.report().encode()), filename="profile.txt"),
+                discord.File(io.BytesIO(result.collapsed().encode()), filename="profile.collapsed"),
+            ],
+            ephemeral=True,
+        )
+
+    @root.command(name="record", description="Record gateway events to replay in a load test.")
+    async def record(
+        self,
+        ctx: discord.ApplicationContext,
+        seconds: discord.Option(int, description="How long to record for.", min_value=1, max_value=600, default=60),
+    ):
+        """Records every gateway event the bot receives for a while, then sends them as a stream loadtest.py can replay.
+        The recording holds interaction tokens, which stay valid for 15 minutes, so don't share it before then.
+        Args:
+            seconds (int, optional): How long to record for. Defaults to 60.
+        """
+        if self.recording:
+            return await ctx.send_response(embed=EmbedStyle.Error.value.embed(description="Already recording."), ephemeral=True)
+        await ctx.defer(ephemeral=True)
+        self.recording = True
+        try:
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, "gateway.jsonl.gz")
+                with Recorder(self.bot, path) as recorder:
+                    await asyncio.sleep(seconds)
+                await ctx.send_followup(
+                    embed=EmbedStyle.Ok.value.embed(
+                        title="Recording complete",
+                        description=f"Recorded {recorder.count} events over {seconds}s. Replay them with `python loadtest.py gateway.jsonl.gz`.",
+                    ),
+                    file=discord.File(path),
+                    ephemeral=True,
                 )
+        finally:
+            self.recording = False
+
+    @root.command(name="stats", description="Show interaction latency stats.")
+    async def stats(self, ctx: discord.ApplicationContext):
+        """Shows latency percentiles for the busiest commands, autocompletes, buttons and modals since the bot started."""
+        ms = lambda seconds: f"{seconds * 1000:.0f}ms"
+        embed = EmbedStyle.Info.value.embed(
+            title="Interaction latency",
+            description="Percentiles are estimated from histogram buckets. \"First response\" is what users wait on.",
+        )
+        for kind, name, total, first_response in metrics.summary()[:25]:
+            value = f"{total.count} calls\nTotal: p50 {ms(total.quantile(0.5))}, p99 {ms(total.quantile(0.99))}"
+            if first_response:
+                value += f"\nFirst response: p50 {ms(first_response.quantile(0.5))}, p99 {ms(first_response.quantile(0.99))}"
+            if deferred := metrics.histograms.get((kind, name, "auto_deferred")):
+                value += f"\nAuto-deferred {deferred.count} times, p50 after {ms(deferred.quantile(0.5))}"
+            embed.add_field(name=f"{name} ({kind})", value=value)
+        await ctx.send_response(embed=embed, ephemeral=True)
+
+    @root.command(name="lag", description="Show event loop lag and what has been blocking the loop.")
+    async def lag(self, ctx: discord.ApplicationContext):
+        """Shows event loop lag percentiles and the code sites that blocked the loop for the longest in total."""
+        ms = lambda seconds: f"{seconds * 1000:.0f}ms"
+        embed = EmbedStyle.Info.value.embed(
+            title="Event loop lag",
+            description=f"p50 {ms(watchdog.lag.quantile(0.5))}, p99 {ms(watchdog.lag.quantile(0.99))}, worst {ms(watchdog.worst_lag)}. "
+            f"Stalls over {ms(watchdog.threshold)} are listed below.",
+        )
+        for stall in watchdog.worst_sites():
+            embed.add_field(
+                name=stall.site[:256],
+                value=f"In `{stall.handler}`\n{stall.count} stalls, {ms(stall.total)} total, worst {ms(stall.worst)}",
+                inline=False,
             )
-        else:
-            return await ctx.send_followup(
-                embed=EmbedStyle.Ok.value.embed(description="All cogs updated successfully.")
+        await ctx.send_response(embed=embed, ephemeral=True)
+
+    @root.command(name="memory", description="Show memory usage, and what grew since the last call.")
+    async def memory(self, ctx: discord.ApplicationContext):
+        """The first call starts tracing allocations. Every later call shows the allocation sites that grew the most since the call before, and the biggest overall."""
+        embed = EmbedStyle.Info.value.embed(title="Memory usage")
+        try:
+            with open("/proc/self/status") as status:
+                rss = next(line.split(":", 1)[1].strip() for line in status if line.startswith("VmRSS:"))
+        except (OSError, StopIteration):
+            rss = "Unknown"
+        embed.add_field(name="Resident set size", value=rss)
+        server = self.bot.get_guild(current_guild.get())  # The guild the command was run in
+        embed.add_field(name="Cached members", value=f"{len(server.members)} of {server.member_count}" if server else "None")
+        embed.add_field(name="Recently active members", value=str(len(member_cache.last_seen)))
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            embed.description = "Started tracing allocations, run this again later to see what grew."
+            return await ctx.send_response(embed=embed, ephemeral=True)
+        snapshot = tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+        site = lambda stat: f"`{stat.traceback[0].filename.rsplit(os.sep, 2)[-1]}:{stat.traceback[0].lineno}`"
+        if self.last_snapshot:
+            growth = [stat for stat in snapshot.compare_to(self.last_snapshot, "lineno") if stat.size_diff > 0][:10]
+            embed.add_field(
+                name="Grew the most since last time",
+                value="\n".join(f"{site(stat)} {stat.size_diff / 1024:+.0f} KiB" for stat in growth)[:1024] or "Nothing",
+                inline=False,
             )
+        embed.add_field(
+            name="Biggest overall",
+            value="\n".join(f"{site(stat)} {stat.size / 1024:.0f} KiB" for stat in snapshot.statistics("lineno")[:10])[:1024],
+            inline=False,
+        )
+        self.last_snapshot = snapshot
+        await ctx.send_response(embed=embed, ephemeral=True)
 
     @root.command(name="restart")
     async def restart_bot(self, ctx: discord.ApplicationContext):
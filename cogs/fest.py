@@ -0,0 +1,162 @@
+import logging
+
+import discord
+from discord.ext import tasks
+
+from classes import *
+from helpers.command_checks import is_admin_or_dev
+from helpers.fest_tally import FestTally, metrics
+from helpers.response_embeds import EmbedStyle
+
+log = logging.getLogger(__name__)
+
+flush_interval = 10  # Seconds between database writes
+standings_interval = 15  # Seconds between standings message edits, at most
+
+
+class FestCog(discord.Cog):
+    def __init__(self, bot: discord.Bot) -> None:
+        self.bot = bot
+        self.tally: FestTally = None
+        self.shown_version = -1  # Tally version the standings message last showed
+        self.changing = asyncio.Lock()  # Held while a fest starts or ends, so two can't overlap
+
+    def cog_unload(self):
+        self.flusher.cancel()
+        self.standings_updater.cancel()
+        if self.tally:  # The reloaded cog recovers the tally from the database
+            background(self.tally.flush(), "fest tally flush")
+
+    root = discord.SlashCommandGroup(name="fest", description="Server Splatfests.", guild_ids=[guild_configs.home])
+
+    def standings_embed(self, final: bool = False) -> discord.Embed:
+        embed = EmbedStyle.Info.value.embed(title=f"{'Final results' if final else 'Standings'}: {self.tally.name}")
+        for place, (team, counts) in enumerate(self.tally.standings(), 1):
+            embed.add_field(
+                name=f"{place}. Team {team}",
+                value="\n".join(f"{label}: {counts[metric]}" for metric, label in metrics.items()),
+            )
+        return embed
+
+    def team_choices(self, actx: discord.AutocompleteContext):
+        return [team for team in (self.tally.teams if self.tally else []) if team.casefold().startswith(actx.value.casefold())]
+
+    async def running(self, ctx: discord.ApplicationContext, team: str = None) -> bool:
+        """Checks there's a fest going on (and that the team is in it), answering the user if not."""
+        if not self.tally:
+            await ctx.send_response("🫥 There's no Splatfest going on right now.", ephemeral=True)
+            return False
+        if team is not None and team not in self.tally.teams:
+            await ctx.send_response(f"🫥 There's no team {clean(team)} in this Splatfest.", ephemeral=True)
+            return False
+        return True
+
+    @root.command(name="start", description="Start a Splatfest and post its live standings here.", checks=[is_admin_or_dev])
+    async def start(
+        self,
+        ctx: discord.ApplicationContext,
+        name: discord.Option(str, description="The Splatfest's theme."),
+        teams: discord.Option(str, description="Team names, separated by commas."),
+    ):
+        """Starts a Splatfest. Its standings are posted in the current channel and kept up to date.
+        Args:
+            name (str): The Splatfest's theme.
+            teams (str): Team names, separated by commas.
+        """
+        if len(team_names := list(dict.fromkeys(team.strip() for team in teams.split(",") if team.strip()))) < 2:
+            return await ctx.send_response("🫥 A Splatfest needs at least two teams.", ephemeral=True)
+        async with self.changing:
+            if self.tally:
+                return await ctx.send_response(f"🫥 {self.tally.name} is still going on.", ephemeral=True)
+            self.tally = await FestTally.create(name, team_names, ctx.channel_id)
+        response = await ctx.send_response(embed=self.standings_embed())
+        message = await response.original_response()
+        self.tally.message_id = message.id
+        await self.tally.save({"message_id": message.id})
+        self.shown_version = self.tally.version
+
+    @root.command(name="pick", description="Join a team in the current Splatfest.")
+    async def pick(
+        self,
+        ctx: discord.ApplicationContext,
+        team: discord.Option(str, description="The team to join.", autocomplete=team_choices),
+    ):
+        """Joins a team in the current Splatfest. You can switch teams until it ends.
+        Args:
+            team (str): The team to join.
+        """
+        if not await self.running(ctx, team):
+            return
+        old = self.tally.pick(ctx.author.id, team)
+        await ctx.send_response(
+            f"✅ Switched from Team {clean(old)} to Team {clean(team)}!" if old and old != team else f"✅ You're on Team {clean(team)}!",
+            ephemeral=True,
+        )
+
+    @root.command(name="win", description="Record match wins for a team.", checks=[is_admin_or_dev])
+    async def win(
+        self,
+        ctx: discord.ApplicationContext,
+        team: discord.Option(str, description="The winning team.", autocomplete=team_choices),
+        amount: discord.Option(int, description="How many wins to add. Negative to correct a mistake.", default=1),
+    ):
+        """Adds match wins to a team's tally.
+        Args:
+            team (str): The winning team.
+            amount (int, optional): How many wins to add. Defaults to 1.
+        """
+        if not await self.running(ctx, team):
+            return
+        self.tally.add(team, "wins", amount)
+        await ctx.send_response(f"✅ Team {clean(team)} now has {self.tally.counts[team]['wins']} wins.", ephemeral=True)
+
+    @root.command(name="end", description="End the current Splatfest and post the final results.", checks=[is_admin_or_dev])
+    async def end(self, ctx: discord.ApplicationContext):
+        """Ends the current Splatfest, saves the final tally and posts the results."""
+        async with self.changing:
+            if not await self.running(ctx):
+                return
+            await self.tally.end()
+            embed = self.standings_embed(final=True)
+            self.tally = None
+        await ctx.send_response(embed=embed)
+
+    @tasks.loop(seconds=flush_interval)
+    async def flusher(self):
+        if self.tally:
+            try:
+                await self.tally.flush()
+            except Exception:
+                log.exception("Failed to flush the Splatfest tally, retrying next time")
+
+    @tasks.loop(seconds=standings_interval)
+    async def standings_updater(self):
+        """Edits the standings message if anything changed, so a burst of votes costs one edit instead of one per vote."""
+        if not self.tally or not self.tally.message_id or self.tally.version == self.shown_version:
+            return
+        version = self.tally.version
+        try:
+            await self.bot.get_partial_messageable(self.tally.channel_id).get_partial_message(self.tally.message_id).edit(
+                embed=self.standings_embed()
+            )
+        except discord.HTTPException:
+            log.warning("Failed to update the Splatfest standings message", exc_info=True)
+        else:
+            self.shown_version = version
+
+
+def setup(bot: discord.Bot):
+    cog = FestCog(bot)
+    bot.add_cog(cog)
+    cog.flusher.start()
+    cog.standings_updater.start()
+    log.info("Cog initialized")
+
+
+async def asetup(bot: discord.Bot):
+    cog: FestCog = bot.get_cog("FestCog")
+    if cog.tally:
+        return
+    if tally := await FestTally.load_active():
+        cog.tally = tally
+        log.info("Recovered Splatfest %s from its last flush", tally.name)
@@ -9,6 +9,7 @@ import discord.ext.commands as cmd
 from discord.ext import tasks
 
 from classes import *
+from helpers.outbound import Priority, outbound
 
 log = logging.getLogger(__name__)
 
@@ -230,8 +231,14 @@ class FunCog(discord.Cog):
             ["fortune", "-n", "128", "-s", "fortunes", "literature", "riddles"],
             stdout=subprocess.PIPE,
         ).stdout.decode("utf-8")
+        # Presence updates are low priority, and if several pile up only the latest one matters.
+        outbound.send_coalesced(
+            Priority.PRESENCE, "gateway:presence", "presence", message, self.change_presence
+        )
+
+    async def change_presence(self, messages: list[str]):
         try:
-            await self.bot.change_presence(activity=discord.Game(name=message))
+            await self.bot.change_presence(activity=discord.Game(name=messages[-1]))
         except Exception:
             log.info("Failed to change presence")
 
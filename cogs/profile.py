@@ -1,14 +1,25 @@
 from dataclasses import dataclass
+import asyncio
+import io
 import logging
+import re
 import discord
-from helpers.db_handling_sdb import connection, Resource
-from classes import config
+from discord.ext import tasks
+from helpers.db_handling_sdb import DatabaseUnavailableError, connection, deser, Resource
+from helpers.lan_servers import lan_servers
+from helpers.profile_cards import cards
+from helpers.profile_index import name_fields, profile_index
+from helpers.read_cache import StaleResults, read_cache
+from helpers.response_embeds import EmbedStyle
+from classes import background, current_guild, state
 
 log = logging.getLogger(__name__)
 
 
-@dataclass
+@dataclass(slots=True)
 class PlayerProfile(Resource):
+    shared = True  # A player's profile is the same in every guild
+
     owner_id: int  # The Discord user ID that owns this resource.
     friend_code: str = None
     main_lan_server: str = None
@@ -16,18 +27,39 @@ class PlayerProfile(Resource):
     ign: str = None
 
     def embed(self, bot: discord.Bot):
-        user = bot.get_guild(config["guild"]).get_member(self.owner_id)
-        embed = super().embed(
+        user = bot.get_guild(current_guild.get()).get_member(self.owner_id)  # Not every member is cached, see helpers.member_cache
+        server_status = lan_servers.status(self.main_lan_server)
+        embed = super(PlayerProfile, self).embed(
             {
                 "NSO Friend Code": self.friend_code,
-                "Main classic LAN play server": self.main_lan_server,
+                "Main classic LAN play server": f"{self.main_lan_server} ({server_status})" if server_status else self.main_lan_server,
                 "XLink Kai username": self.xtag,
                 "In-game name": self.ign,
             }
-        ).set_author(name=user.display_name, icon_url=user.display_avatar)
+        )
+        if user:
+            embed.set_author(name=user.display_name, icon_url=user.display_avatar)
+        else:
+            embed.description = f"<@{self.owner_id}>"
         embed.title = "Player Info"
         return embed
 
+    async def store(self):
+        await super(PlayerProfile, self).store()
+        profile_index.add(self)
+        lan_servers.track(self.owner_id, self.main_lan_server)
+
+
+def flag_stale(embed: discord.Embed, results: list) -> discord.Embed:
+    """Notes on an embed when it shows cached results, because the database is unreachable."""
+    if isinstance(results, StaleResults):
+        embed.add_field(
+            name="⚠️ Cached copy",
+            value=f"The database is unreachable right now, so this is how it looked <t:{int(results.as_of.timestamp())}:R>.",
+            inline=False,
+        )
+    return embed
+
 
 class ProfileEditor(discord.ui.Modal):
     user_id: int
@@ -91,6 +123,18 @@ class ProfileCog(discord.Cog):
     def __init__(self, bot: discord.Bot) -> None:
         self.bot = bot
 
+    def cog_unload(self):
+        self.prober.cancel()
+
+    @tasks.loop(minutes=5)
+    async def prober(self):
+        """Keeps the LAN play server statuses shown in profiles and lobby suggestions fresh."""
+        await lan_servers.probe_all()
+
+    @prober.before_loop
+    async def wait_for_index(self):
+        await state.wait("profile_index_built")  # The servers to probe are collected while indexing
+
     root = discord.SlashCommandGroup(name="profile")
 
     @root.command(
@@ -106,27 +150,157 @@ class ProfileCog(discord.Cog):
         ctx: discord.ApplicationContext,
         user: discord.Member = None,
         ephemeral: bool = False,
+        card: bool = False,
     ):
         """Find the player profile for either yourself or another user.
         Args:
             user (Member, optional): The user to look up. Defaults to yourself.
             ephemeral (bool, optional): Whether to hide the result from other users. Defaults to False.
+            card (bool, optional): Whether to show the profile as an image card. Defaults to False.
         """
         target = user or ctx.author
+        results = await connection.run_query(
+            PlayerProfile,
+            "SELECT * FROM PlayerProfile WHERE owner_id = $id",
+            id=target.id,
+        )
         try:
-            profile = (
-                await connection.run_query(
-                    PlayerProfile,
-                    "SELECT * FROM PlayerProfile WHERE owner_id = $id",
-                    id=target.id,
-                )
-            )[0]
+            profile = results[0]
         except IndexError:
             await ctx.send_response("🫥 Player profile not found.", ephemeral=True)
         else:
-            await ctx.send_response(embed=profile.embed(self.bot), ephemeral=ephemeral)
+            if not card:
+                return await ctx.send_response(embed=flag_stale(profile.embed(self.bot), results), ephemeral=ephemeral)
+            await ctx.defer(ephemeral=ephemeral)
+            image = await cards.card(profile, target)
+            await ctx.send_followup(
+                embed=flag_stale(profile.embed(self.bot), results).set_image(url="attachment://profile.png"),
+                file=discord.File(io.BytesIO(image), filename="profile.png"),
+                ephemeral=ephemeral,
+            )
+
+    def describe(self, owner_id: int) -> str:
+        member = self.bot.get_guild(current_guild.get()).get_member(owner_id)
+        return member.display_name if member else str(owner_id)
+
+    def complete(self, actx: discord.AutocompleteContext):
+        return [
+            discord.OptionChoice(name=f"{match.value} ({self.describe(match.owner_id)})"[:100], value=str(match.owner_id))
+            for match in profile_index.search(actx.value, 25)
+        ]
+
+    @root.command(name="lobby-server", description="Suggest the best classic LAN play server for a lobby.")
+    async def lobby_server(
+        self,
+        ctx: discord.ApplicationContext,
+        players: discord.Option(str, description="Mention the other players in the lobby."),
+    ):
+        """Suggests the online LAN play server the most players in a lobby already use, picking the fastest one on ties.
+        Args:
+            players (str): Mentions of the other players in the lobby. You're included automatically.
+        """
+        owner_ids = {ctx.author.id, *(int(user_id) for user_id in re.findall(r"<@!?(\d+)>", players))}
+        if not (ranked := lan_servers.best_server(owner_ids)):
+            return await ctx.send_response("🫥 No LAN play servers are known to be online right now.", ephemeral=True)
+        embed = EmbedStyle.Info.value.embed(
+            title="Suggested LAN play servers",
+            description="\n".join(
+                f"{'**' if i == 0 else ''}`{server}`{'**' if i == 0 else ''}: {status}, main server of {mains}/{len(owner_ids)} players"
+                for i, (server, mains, status) in enumerate(ranked[:10])
+            ),
+        ).set_footer(text="Latency is measured from the bot, not from you.")
+        await ctx.send_response(embed=embed)
+
+    @root.command(name="search", description="Find who an in-game name, XLink Kai username or friend code belongs to.")
+    async def search(
+        self,
+        ctx: discord.ApplicationContext,
+        query: discord.Option(str, description="The name or friend code to look for.", autocomplete=complete),
+        ephemeral: bool = True,
+    ):
+        """Looks up profiles by friend code (exact), or by in-game name or XLink Kai username (prefix or fuzzy match).
+        Args:
+            query (str): The name or friend code to look for. Picking an autocomplete suggestion shows that profile.
+            ephemeral (bool, optional): Whether to hide the result from other users. Defaults to True.
+        """
+        if query.isdigit() and int(query) in profile_index.entries:  # Picked from autocomplete
+            owner_ids = [int(query)]
+        else:
+            matches = profile_index.search(query)
+            owner_ids = [match.owner_id for match in matches]
+        if not owner_ids:
+            return await ctx.send_response("🫥 No matching profiles found.", ephemeral=True)
+        if len(owner_ids) > 1:
+            return await ctx.send_response(
+                embed=EmbedStyle.Info.value.embed(
+                    title=f"Profiles matching {query}"[:256],
+                    description="\n".join(
+                        f"<@{match.owner_id}>: {name_fields.get(match.field, 'Friend code')} `{match.value}`"
+                        for match in matches
+                    ),
+                ),
+                ephemeral=ephemeral,
+            )
+        results = await connection.run_query(PlayerProfile, "SELECT * FROM PlayerProfile WHERE owner_id = $id", id=owner_ids[0])
+        if not results:
+            if not isinstance(results, StaleResults):  # Deleted since it was indexed
+                profile_index.remove(owner_ids[0])
+                lan_servers.track(owner_ids[0], None)
+            return await ctx.send_response("🫥 Player profile not found.", ephemeral=True)
+        await ctx.send_response(embed=flag_stale(results[0].embed(self.bot), results), ephemeral=ephemeral)
 
 
 def setup(bot: discord.Bot):
-    bot.add_cog(ProfileCog(bot))
+    cog = ProfileCog(bot)
+    bot.add_cog(cog)
+    cog.prober.start()
     log.info("Cog initialized")
+
+
+async def asetup(bot: discord.Bot):
+    background(build_index(), "profile index build")
+    # Warm up the DB connection so the first profile command doesn't have to. Not fatal, the connection is retried on first use.
+    try:
+        await connection.client(connection.database("PlayerProfile"))
+    except Exception:
+        log.warning("Database warm-up failed, will retry on first use", exc_info=True)
+
+
+def index_page(page: list[dict]) -> set[int]:
+    """Indexes a page of raw profiles. Returns their owners."""
+    profiles = deser(list, page)
+    for profile in profiles:
+        profile_index.add(profile)
+        lan_servers.track(profile.owner_id, profile.main_lan_server)
+    return {profile.owner_id for profile in profiles}
+
+
+async def build_index(page_size: int = 500):
+    """Fills the profile search index from the local read cache first, so it's usable right away, then refreshes it from the database.
+    The table is streamed a page at a time, so the loop isn't held up by one huge result."""
+    profile_index.clear()
+    state.set("profile_index_built", False)
+    cached = await read_cache.table(connection.database("PlayerProfile"), "PlayerProfile")
+    cached_owners = set()
+    for i in range(0, len(cached), page_size):
+        cached_owners |= index_page(cached[i : i + page_size])
+        await asyncio.sleep(0)
+    if cached:
+        log.info("Indexed %d cached player profiles", len(profile_index))
+        state.set("profile_index_built", True)
+    seen, fresh = set(), True
+    try:
+        async for page in connection.stream_table("PlayerProfile", page_size):
+            seen |= index_page(page)
+            fresh &= not isinstance(page, StaleResults)
+            await asyncio.sleep(0)
+    except DatabaseUnavailableError:
+        fresh = False
+    if not fresh:
+        log.warning("Database unreachable, the profile index only has cached profiles for now")
+    else:
+        for owner_id in cached_owners - seen:  # Deleted since they were cached
+            profile_index.remove(owner_id)
+            lan_servers.track(owner_id, None)
+        log.info("Indexed %d player profiles", len(profile_index))
+    state.set("profile_index_built", True)
@@ -0,0 +1,105 @@
+import datetime
+import logging
+
+import discord
+
+from classes import *
+from helpers.command_checks import is_admin_or_dev
+from helpers.db_handling_sdb import connection, deser
+from helpers.response_embeds import EmbedStyle
+from helpers.strikes import half_life, ledger
+
+log = logging.getLogger(__name__)
+
+# (score, action) pairs, checked whenever a strike pushes a member's score across one of them.
+thresholds = [(3, "mute"), (5, "kick")]
+mute_duration = datetime.timedelta(days=1)
+
+
+class StrikesCog(discord.Cog):
+    def __init__(self, bot: discord.Bot) -> None:
+        self.bot = bot
+
+    def cog_unload(self):
+        ledger.stop()
+
+    root = discord.SlashCommandGroup(name="strikes", description="Moderation strikes.", checks=[is_admin_or_dev], guild_ids=[guild_configs.home])
+
+    @root.command(name="add", description="Give a member a strike.")
+    async def add(
+        self,
+        ctx: discord.ApplicationContext,
+        member: discord.Member,
+        reason: discord.Option(str, description="Why the member is getting a strike."),
+        points: discord.Option(float, description="How heavy the strike is.", min_value=0.5, max_value=10, default=1),
+        days: discord.Option(int, description="Days until the strike expires.", min_value=1, max_value=365, default=90),
+    ):
+        """Gives a member a strike, muting or kicking them if it takes their score over a threshold.
+        Args:
+            member (Member): The member to strike.
+            reason (str): Why the member is getting a strike.
+            points (float, optional): How heavy the strike is. Defaults to 1.
+            days (int, optional): Days until the strike expires. Defaults to 90.
+        """
+        strike, before, after = await ledger.add(member.id, ctx.author.id, points, reason, datetime.timedelta(days=days))
+        embed = EmbedStyle.Ok.value.embed(
+            title="Strike given",
+            description=f"{member.mention} got a {points:g} point strike: {clean(reason)}",
+        ).add_field(name="Score", value=f"{before:.2f} → {after:.2f}")
+        embed.set_footer(text=f"ID: {strike.id}")
+        if crossed := [action for score, action in thresholds if before < score <= after]:
+            action = crossed[-1]  # Only the harshest one
+            try:
+                if action == "kick":
+                    await member.kick(reason=f"Strike score reached {after:.2f}")
+                else:
+                    await member.timeout_for(mute_duration, reason=f"Strike score reached {after:.2f}")
+            except discord.HTTPException as e:
+                embed.add_field(name="Automatic action failed", value=f"Couldn't {action} them: {e}")
+            else:
+                embed.add_field(name="Automatic action", value="Kicked" if action == "kick" else f"Muted for {mute_duration.days} day(s)")
+        await ctx.send_response(embed=embed, ephemeral=True)
+
+    @root.command(name="view", description="Show a member's strikes and score.")
+    async def view(self, ctx: discord.ApplicationContext, member: discord.Member):
+        """Shows a member's active strikes and their current score.
+        Args:
+            member (Member): The member to look up.
+        """
+        embed = EmbedStyle.Info.value.embed(
+            title=f"Strikes of {member.display_name}",
+            description=f"Score: {ledger.score(member.id):.2f} (strikes lose half their weight every {half_life.days} days)",
+        )
+        for strike in ledger.member_strikes(member.id)[:25]:
+            embed.add_field(
+                name=f"{strike.points:g} points, expires <t:{int(strike.expires_at.timestamp())}:R>",
+                value=f"{clean(strike.reason)}\nBy <@{strike.moderator_id}> | `{strike.id}`",
+                inline=False,
+            )
+        await ctx.send_response(embed=embed, ephemeral=True)
+
+    @root.command(name="pardon", description="Take back a strike early.")
+    async def pardon(self, ctx: discord.ApplicationContext, strike_id: discord.Option(str, description="The strike's ID.")):
+        """Takes back an active strike, removing what's left of its weight from the member's score.
+        Args:
+            strike_id (str): The strike's ID, shown in /strikes view.
+        """
+        if not (strike := await ledger.pardon(strike_id)):
+            return await ctx.send_response("🫥 No active strike with that ID.", ephemeral=True)
+        await ctx.send_response(
+            f"✅ Pardoned <@{strike.member_id}>'s strike. Their score is now {ledger.score(strike.member_id):.2f}.",
+            ephemeral=True,
+        )
+
+
+def setup(bot: discord.Bot):
+    bot.add_cog(StrikesCog(bot))
+    log.info("Cog initialized")
+
+
+async def asetup(bot: discord.Bot):
+    if not ledger.strikes:  # Already loaded if this is a reload
+        async for page in connection.stream_table("Strike"):
+            ledger.load(deser(list, page))
+    ledger.start()
+    log.info("Tracking %d active strikes", len(ledger.strikes))
@@ -1,18 +1,16 @@
 import logging
 import discord
-import random
 from classes import *
-from helpers.command_arg_types import timestamp
+from helpers.command_arg_types import duration, parse_datetime, timestamp
+from helpers.db_handling_sdb import connection, deser
+from helpers.lan_ips import NoFreeAddressError, lan_ips
+from helpers.outbound import Priority, outbound
+from helpers.response_embeds import EmbedStyle
+from helpers.scheduler import ScheduledJob, scheduler
 
 log = logging.getLogger(__name__)
 
 
-def gen_lan_ip():
-    a = random.randint(0, 255)
-    b = random.randint(1, 254)
-    return gen_lan_ip() if a == 37 and b == 1 else (a, b)
-
-
 class ToolsCog(discord.Cog):
     def __init__(self, bot: discord.Bot) -> None:
         self.bot = bot
@@ -59,14 +57,62 @@ class ToolsCog(discord.Cog):
         )
 
     @root.command(
-        name="lan-ip", description="Generate a random, valid IP for classic LAN play."
+        name="lan-ip", description="Get a valid IP for classic LAN play that nobody else is using."
     )
     async def lan_ip(self, ctx: discord.ApplicationContext):
-        """Generates a random, valid console IP address for use in a classic LAN play setup."""
-        ip = gen_lan_ip()
-        await ctx.send_response(f"✅ `10.13.{ip[0]}.{ip[1]}`", ephemeral=True)
+        """Gives you a console IP address for use in a classic LAN play setup. It's yours alone for a while, and asking again gives you the same one."""
+        try:
+            ip = await lan_ips.lease(ctx.author.id)
+        except NoFreeAddressError:
+            return await ctx.send_response(
+                embed=EmbedStyle.Error.value.embed(description="Every LAN play address is taken right now. Try again later."),
+                ephemeral=True,
+            )
+        await ctx.send_response(f"✅ `{ip}`", ephemeral=True)
+
+    @root.command(name="remind", description="Get reminded of something later, even if the bot restarts in between.")
+    async def remind(
+        self,
+        ctx: discord.ApplicationContext,
+        after: duration(description="How long from now, e.g. 2h30m."),
+        text: discord.Option(str, description="What to remind you of.", max_length=1000),
+    ):
+        """DMs you a reminder after a while. If your DMs are closed, you're pinged in this channel instead.
+        Args:
+            after (duration): How long from now.
+            text (str): What to remind you of.
+        """
+        job = await scheduler.schedule("reminder", after, {"user": ctx.author.id, "channel": ctx.channel_id, "text": text})
+        await ctx.send_response(f"✅ I'll remind you <t:{int(job.run_at.timestamp())}:R>.", ephemeral=True)
+
+
+@scheduler.handler("reminder")
+async def send_reminder(bot: discord.Bot, job: ScheduledJob):
+    user_id, text = job.payload["user"], job.payload["text"]
+    embed = EmbedStyle.Reminder.value.embed(description=text, timestamp=job.created_at).set_footer(text="Set")
+    try:
+        user = bot.get_user(user_id) or await bot.fetch_user(user_id)
+        await outbound.send(Priority.DM, f"dm:{user_id}", lambda: user.send(embed=embed))
+    except discord.Forbidden:  # DMs closed
+        channel = bot.get_channel(job.payload["channel"]) or await bot.fetch_channel(job.payload["channel"])
+        await outbound.send(
+            Priority.WEBHOOK,
+            f"channel:{channel.id}",
+            lambda: channel.send(f"<@{user_id}>", embed=embed, allowed_mentions=discord.AllowedMentions(users=[discord.Object(user_id)])),
+        )
 
 
 def setup(bot: discord.Bot):
     bot.add_cog(ToolsCog(bot))
     log.info("Cog initialized")
+
+
+async def asetup(bot: discord.Bot):
+    # dateparser is slow to import and loads its language data on the first parse, so get that done before anyone autocompletes a timestamp.
+    await asyncio.to_thread(parse_datetime, "now")
+    if not lan_ips.leases:  # Already loaded if this is a reload
+        try:
+            async for page in connection.stream_table("LanLease"):
+                lan_ips.load(deser(list, page))
+        except Exception:
+            log.exception("Failed to load LAN IP leases, addresses leased before the restart may be handed out again")
@@ -2,20 +2,53 @@ import logging
 
 import discord
 import discord.ext.commands as cmd
-from aiohttp import client as aiohttp
+from discord.ext import tasks
 
 from classes import *
+from helpers.http_client import http_client
+from helpers.outbound import Priority, outbound
 
 log = logging.getLogger(__name__)
 
 # https://beebom.com/how-get-invisible-discord-name-and-avatar/
 invisible_username = "᲼᲼"
+join_avatar = "https://cdn.discordapp.com/attachments/1066917293935841340/1079624383410216970/Picsart_22-10-18_17-30-36-248.png"
+leave_avatar = "https://cdn.discordapp.com/attachments/1066917293935841340/1079624383804493864/Picsart_22-10-18_21-30-54-748.png"
+
+# Webhooks are heavily rate limited, so during join waves announcements get folded together:
+# if more than `aggregate_threshold` joins (or leaves) pile up within `aggregate_window` seconds, they're sent as one message.
+aggregate_threshold = 3
+aggregate_window = 5
+names_shown = 3  # How many names a folded message lists before "and N others".
+max_pending = 500
+
+
+def who(names: list[str], others: int = 0) -> str:
+    """'A, B and 3 others', or 'N members' if there are no names to show (e.g. only events that overflowed the queue)."""
+    if not names:
+        return f"{others} member{'s' if others > 1 else ''}"
+    if others:
+        return f"{', '.join(names)} and {others} other{'s' if others > 1 else ''}"
+    if len(names) > 1:
+        return f"{', '.join(names[:-1])} and {names[-1]}"
+    return names[0]
 
 
 class WelcomeCog(discord.Cog):
     def __init__(self, bot: discord.Bot) -> None:
         self.bot = bot
         self.log_channel = self.bot.get_channel(config["log_channel"])
+        self.pending: asyncio.Queue[tuple[str, str]] = asyncio.Queue(max_pending)  # (kind, name) pairs
+        self.overflow = {"join": 0, "leave": 0}  # Events that didn't fit in the queue, still counted as "others".
+
+    def cog_unload(self):
+        self.announcer.cancel()
+
+    def enqueue(self, kind: str, name: str):
+        try:
+            self.pending.put_nowait((kind, name))
+        except asyncio.QueueFull:
+            self.overflow[kind] += 1
 
     @cmd.Cog.listener()
     async def on_member_join(self, member: discord.Member):
@@ -24,11 +57,8 @@ class WelcomeCog(discord.Cog):
         Args:
                 member (discord.Member): The new member.
         """
-        await webhook.send(
-            content=f"<a:Booyah:847300266566746153> {member.mention} joined **Splatfest!**\nCheck out Anarchy Splatcast! <:splatfest:1024053687217295460> <:splatlove:1057108266062196827>",
-            username=invisible_username,
-            avatar_url="https://cdn.discordapp.com/attachments/1066917293935841340/1079624383410216970/Picsart_22-10-18_17-30-36-248.png",
-        )
+        if member.guild.id == guild_configs.home:  # The webhook and messages are Splatfest's own
+            self.enqueue("join", member.mention)
 
     @cmd.Cog.listener()
     async def on_member_remove(self, member: discord.Member):
@@ -37,22 +67,48 @@ class WelcomeCog(discord.Cog):
         Args:
                 member (discord.Member): The member that just left.
         """
-        await webhook.send(
-            content=f"<a:Ouch:847300319071043604> {member} just left **Splatfest...**\n<a:1member:803768545816084480> <:splatbroke:1057109111097004103>",
-            username=invisible_username,
-            avatar_url="https://cdn.discordapp.com/attachments/1066917293935841340/1079624383804493864/Picsart_22-10-18_21-30-54-748.png",
+        if member.guild.id == guild_configs.home:  # The webhook and messages are Splatfest's own
+            self.enqueue("leave", str(member))
+
+    @tasks.loop()
+    async def announcer(self):
+        """Sends queued announcements, then waits out the aggregation window so that anything arriving meanwhile gets batched."""
+        events = [await self.pending.get()]
+        while not self.pending.empty():
+            events.append(self.pending.get_nowait())
+        for kind in ("join", "leave"):
+            names = [name for event_kind, name in events if event_kind == kind]
+            others, self.overflow[kind] = self.overflow[kind], 0
+            try:
+                if len(names) + others > aggregate_threshold or others:  # Overflowed events have no names, they can only be folded
+                    await self.announce(kind, names[:names_shown], len(names) - len(names[:names_shown]) + others)
+                else:
+                    for name in names:
+                        await self.announce(kind, [name])
+            except Exception:
+                log.exception("Failed to send %s announcement", kind)
+        await asyncio.sleep(aggregate_window)
+
+    async def announce(self, kind: str, names: list[str], others: int = 0):
+        if kind == "join":
+            content = f"<a:Booyah:847300266566746153> {who(names, others)} joined **Splatfest!**\nCheck out Anarchy Splatcast! <:splatfest:1024053687217295460> <:splatlove:1057108266062196827>"
+            avatar_url = join_avatar
+        else:
+            content = f"<a:Ouch:847300319071043604> {who(names, others)} just left **Splatfest...**\n<a:1member:803768545816084480> <:splatbroke:1057109111097004103>"
+            avatar_url = leave_avatar
+        await outbound.send(
+            Priority.WEBHOOK,
+            "webhook:welcome",
+            lambda: webhook.send(content=content, username=invisible_username, avatar_url=avatar_url),
         )
 
 
 def setup(bot: discord.Bot):
-    bot.add_cog(WelcomeCog(bot))
+    cog = WelcomeCog(bot)
+    bot.add_cog(cog)
     global webhook
     webhook = discord.Webhook.from_url(
-        secrets["welcome_webhook"], session=aiohttp.ClientSession()
+        secrets["welcome_webhook"], session=http_client.session
     )
+    cog.announcer.start()
     log.info("Cog initialized")
-
-
-def teardown(bot: discord.Bot):
-    asyncio.get_event_loop().run_until_complete(webhook.session.close())
-    log.info("Cog closed")
@@ -0,0 +1,163 @@
+"""Defers interactions whose handlers are running late, before Discord's 3 second window closes on them.
+
+Every command, button and modal submit is checked on a timer. If its handler hasn't answered by its deadline, the bot defers it,
+and whatever the handler sends next goes out as a follow-up (or as an edit of the deferred response) instead.
+Handlers don't need to know: `send_response` just keeps working.
+
+Deadlines are learned per handler from how long it has taken to answer before (the "handler_response" latency histograms):
+- not enough history: wait until the last safe moment;
+- usually quick: defer once it's running clearly slower than usual;
+- usually too slow for the window: defer right away.
+Handlers that answer with a modal are never deferred, since Discord can't show a modal after a deferral.
+"""
+import asyncio
+import collections
+import functools
+import logging
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, Tuple
+
+import discord
+
+from helpers.metrics import Histogram, metrics
+
+log = logging.getLogger(__name__)
+
+window = 3.0  # Seconds Discord gives an interaction to be answered or deferred
+watched = (discord.InteractionType.application_command, discord.InteractionType.component, discord.InteractionType.modal_submit)
+
+
+@dataclass
+class Deferral:
+    task: asyncio.Task  # The deferral itself. Its result is whether it went through.
+    start: float  # When the handler started, like `metrics.pending`
+    kind: str
+    name: str
+    answered: bool = False  # Whether the handler has responded since
+
+
+class AutoDeferrer:
+    floor = 0.25  # Earliest a handler is deferred, so fast ones never are
+    slack = 2  # A handler counts as running late at this many times its usual p99
+    min_samples = 20  # Answers needed before a handler's own history is trusted
+    max_deferred = 1000  # Deferred interactions remembered, for redirecting their responses
+
+    def __init__(self):
+        self.deferred: collections.OrderedDict[int, Deferral] = collections.OrderedDict()  # interaction ID -> deferral
+        # (kind, name) -> how its handler answers: (last method, whether it has always answered publicly)
+        self.habits: Dict[Tuple[str, str], Tuple[str, bool]] = {}
+        self.round_trip = Histogram()  # Time our own deferrals took
+        self.originals: Dict[str, Callable] = {}  # Unrouted InteractionResponse methods
+
+    def margin(self) -> float:
+        """How long before the window closes a deferral has to be sent, to arrive in time."""
+        return max(0.5, self.round_trip.quantile(0.99))
+
+    def deadline(self, kind: str, name: str) -> float | None:
+        """Seconds after its handler started to defer an interaction at, or None to leave it alone."""
+        if self.habits.get((kind, name), ("",))[0] == "send_modal":
+            return None
+        latest = max(window - self.margin(), self.floor)
+        answered = metrics.histograms.get((kind, name, "handler_response"))
+        total = metrics.histograms.get((kind, name, "total"))
+        if total and total.count >= self.min_samples and (not answered or answered.count < total.count / 2):
+            return None  # Mostly doesn't answer at all, deferring would leave it "thinking" forever
+        if not answered or answered.count < self.min_samples:
+            return latest
+        if answered.quantile(0.9) > latest:
+            return self.floor
+        return min(latest, max(self.floor, answered.quantile(0.99) * self.slack))
+
+    def watch(self, interaction: discord.Interaction):
+        if interaction.type in watched:
+            asyncio.get_running_loop().call_later(self.floor, self.check, interaction)
+
+    def check(self, interaction: discord.Interaction):
+        if interaction.id in self.deferred or interaction.response.is_done() or not (entry := metrics.pending.get(interaction.id)):
+            return  # Answered, or the handler returned (or never started) without answering
+        start, kind, name = entry
+        if (deadline := self.deadline(kind, name)) is None:
+            return
+        if (wait := deadline - (time.perf_counter() - start)) > 0:
+            asyncio.get_running_loop().call_later(wait, self.check, interaction)
+            return
+        self.deferred[interaction.id] = Deferral(asyncio.create_task(self.defer(interaction, start, kind, name)), start, kind, name)
+        while len(self.deferred) > self.max_deferred:
+            self.deferred.popitem(last=False)
+
+    async def defer(self, interaction: discord.Interaction, start: float, kind: str, name: str) -> bool:
+        # Only handlers that have never answered privately are deferred publicly, a private answer must never go out in public.
+        method, public = self.habits.get((kind, name), (None, False))
+        # A button's handler may edit its message or send a new one, an invisible deferral allows for both.
+        invisible = kind == "component" or (kind == "modal" and method == "edit_message")
+        sent = time.perf_counter()
+        try:
+            await self.originals["defer"](interaction.response, ephemeral=not public, invisible=invisible)
+        except discord.InteractionResponded:
+            return False  # The handler got there first
+        except discord.HTTPException:
+            log.warning("Failed to auto-defer %s %s", kind, name, exc_info=True)
+            return False
+        self.round_trip.observe(time.perf_counter() - sent)
+        metrics.observe(kind, name, "auto_deferred", sent - start)
+        log.debug("Auto-deferred %s %s after %.2fs", kind, name, sent - start)
+        return True
+
+    def answered(self, interaction: discord.Interaction, method: str, kwargs: dict, deferral: Deferral = None):
+        """Learns from a handler's first response how long it takes and how it answers."""
+        if deferral:
+            if deferral.answered:
+                return
+            deferral.answered = True
+            start, kind, name = deferral.start, deferral.kind, deferral.name
+        elif interaction.response.is_done() or not (entry := metrics.pending.get(interaction.id)):
+            return
+        else:
+            start, kind, name = entry
+        metrics.observe(kind, name, "handler_response", time.perf_counter() - start)
+        _, public = self.habits.get((kind, name), (None, True))
+        self.habits[(kind, name)] = (method, public and not kwargs.get("ephemeral", False))
+
+    async def redirect(self, interaction: discord.Interaction, method: str, args: tuple, kwargs: dict):
+        """Sends a response the way it has to go after a deferral."""
+        kwargs = {key: value for key, value in kwargs.items() if value is not None}  # Webhooks take MISSING, not None
+        if method == "defer":
+            return None  # Already done
+        if method == "send_message":
+            await interaction.followup.send(*args, wait=True, **kwargs)
+            return interaction
+        if method == "edit_message":
+            return await interaction.edit_original_response(**kwargs)
+        log.warning("Can't send a %s for %s, it was auto-deferred", method, interaction.id)
+        raise discord.InteractionResponded(interaction)
+
+    def routed(self, method: str, original: Callable) -> Callable:
+        @functools.wraps(original)
+        async def wrapper(response: discord.InteractionResponse, *args, **kwargs):
+            interaction = response._parent
+            # No awaiting before the original is called, so a deferral can't sneak in between this check and the handler's response.
+            if not (deferral := self.deferred.get(interaction.id)) or not await asyncio.shield(deferral.task):
+                self.answered(interaction, method, kwargs)
+                return await original(response, *args, **kwargs)
+            self.answered(interaction, method, kwargs, deferral)
+            return await self.redirect(interaction, method, args, kwargs)
+
+        return wrapper
+
+
+auto_defer = AutoDeferrer()
+
+
+def install():
+    """Routes interaction responses through the auto-deferrer. Call after `metrics.instrument()`, so deferrals are timed as first responses."""
+    if getattr(discord.InteractionResponse, "_auto_deferred", False):
+        return
+    discord.InteractionResponse._auto_deferred = True
+    for method in ("defer", "send_message", "edit_message", "send_modal"):
+        original = auto_defer.originals[method] = getattr(discord.InteractionResponse, method)
+        setattr(discord.InteractionResponse, method, auto_defer.routed(method, original))
+    send_response = discord.ApplicationContext.send_response  # Refuses once the interaction is deferred, so it's let through for auto-deferred ones
+    discord.ApplicationContext.send_response = property(
+        lambda ctx: ctx.interaction.response.send_message if ctx.interaction.id in auto_defer.deferred else send_response.fget(ctx)
+    )
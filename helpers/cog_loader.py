@@ -0,0 +1,193 @@
+"""Loads cogs (extensions) with dependency ordering and concurrent async setup.
+
+Besides the usual `setup(bot)` entry point, a cog module may declare:
+- `requires`: extension names (e.g. `["cogs.profile"]`) whose async setup must finish before this cog's does.
+- `async def asetup(bot)`: slow setup work (DB warm-up, cache preloading...) that doesn't have to block other cogs.
+
+`setup` is still called for every cog one after the other, so it should stay quick.
+The `asetup`s run concurrently as soon as their dependencies are done, so loading takes as long as the slowest chain of cogs instead of all of them added up.
+A cog that fails (along with anything depending on it) is unloaded and reported, the rest load normally.
+Cogs that are already loaded get reloaded instead, and if the new version fails the old one is put back.
+Declare `requires` whenever a cog imports from another cog, so it gets reloaded along with it.
+"""
+import asyncio
+import logging
+import os
+import sys
+import time
+import traceback
+from dataclasses import dataclass
+from typing import Dict, Iterable, List
+
+import discord
+
+log = logging.getLogger(__name__)
+
+
+class DependencyError(Exception):
+    """A cog's dependency is missing, failed to load, or is part of a dependency cycle."""
+
+
+@dataclass
+class CogLoadResult:
+    name: str
+    seconds: float = 0.0  # Time spent in setup + asetup, not counting time spent waiting on dependencies.
+    error: Exception = None
+    reloaded: bool = False  # Whether this replaced an already loaded version.
+    rolled_back: bool = False  # Whether the old version was kept after the new one failed.
+
+
+def discover_cogs(path: str = "cogs") -> List[str]:
+    """Lists the extension names of every cog module in the given directory."""
+    return sorted(
+        f"{path}.{file.removesuffix('.py')}"
+        for file in os.listdir(path)
+        # Exclude incomplete modules (filenames starting with .), these modules are also gitignore'd.
+        if file.endswith(".py") and not file.startswith(".")
+    )
+
+
+def dependencies(bot: discord.Bot, name: str) -> List[str]:
+    return list(getattr(bot.extensions.get(name), "requires", ()))
+
+
+def dependents(bot: discord.Bot, names: Iterable[str]) -> set[str]:
+    """Returns every loaded extension that requires one of the given extensions, directly or indirectly."""
+    names = set(names)
+    found: set[str] = set()
+    pending = set(names)
+    while pending:
+        name = pending.pop()
+        for ext in bot.extensions:
+            if ext not in found and name in dependencies(bot, ext):
+                found.add(ext)
+                pending.add(ext)
+    return found - names
+
+
+def load_order(bot: discord.Bot, names: Iterable[str]) -> List[str]:
+    """Orders extensions so that (already loaded) dependencies come before the cogs requiring them."""
+    names = list(names)
+    order: List[str] = []
+
+    def visit(name: str, path: set[str]):
+        if name in order or name in path:
+            return
+        for dep in dependencies(bot, name):
+            if dep in names:
+                visit(dep, path | {name})
+        order.append(name)
+
+    for name in names:
+        visit(name, set())
+    return order
+
+
+def find_cycles(graph: Dict[str, List[str]]) -> set[str]:
+    """Returns every node that's part of (or depends on) a dependency cycle."""
+    state: Dict[str, int] = {}  # 1 = visiting, 2 = done
+    cyclic: set[str] = set()
+
+    def visit(node: str) -> bool:
+        if state.get(node) == 1:
+            return True
+        if state.get(node) == 2:
+            return node in cyclic
+        state[node] = 1
+        bad = False
+        for dep in graph.get(node, ()):
+            bad = visit(dep) or bad
+        state[node] = 2
+        if bad:
+            cyclic.add(node)
+        return bad
+
+    for node in graph:
+        visit(node)
+    return cyclic
+
+
+async def load_cogs(bot: discord.Bot, names: Iterable[str]) -> Dict[str, CogLoadResult]:
+    """Loads (or reloads) the given extensions, running their async setups concurrently in dependency order.
+
+    Returns:
+        Dict[str, CogLoadResult]: The timing and error (if any) of every extension.
+    """
+    results = {name: CogLoadResult(name) for name in load_order(bot, names)}
+    snapshots: Dict[str, tuple] = {}  # name -> (old module, old submodules) for rolling back reloads
+
+    # Imports hold the import lock and add_cog has to run on the loop thread anyway, so the sync part stays serial.
+    for result in results.values():
+        start = time.perf_counter()
+        try:
+            if result.name in bot.extensions:
+                result.reloaded = True
+                lib = bot.extensions[result.name]
+                snapshots[result.name] = (
+                    lib,
+                    {name: module for name, module in sys.modules.items() if name == lib.__name__ or name.startswith(f"{lib.__name__}.")},
+                )
+                bot.reload_extension(result.name)  # Rolls back by itself if the new version fails to import or set up.
+            else:
+                bot.load_extension(result.name)
+        except Exception as e:
+            result.error = e
+            result.rolled_back = result.name in snapshots
+            snapshots.pop(result.name, None)
+        result.seconds = time.perf_counter() - start
+
+    graph = {name: dependencies(bot, name) for name, result in results.items() if not result.error}
+    cyclic = find_cycles(graph)
+    tasks: Dict[str, asyncio.Task] = {}
+
+    async def run(result: CogLoadResult):
+        if result.name in cyclic:
+            raise DependencyError(f"{result.name} is part of a dependency cycle")
+        for dep in graph[result.name]:
+            if dep in tasks:
+                if not await tasks[dep]:
+                    raise DependencyError(f"Dependency {dep} failed to load")
+            elif dep not in bot.extensions:
+                raise DependencyError(f"Dependency {dep} is not loaded")
+        if asetup := getattr(bot.extensions[result.name], "asetup", None):
+            start = time.perf_counter()
+            await asetup(bot)
+            result.seconds += time.perf_counter() - start
+
+    async def run_isolated(result: CogLoadResult) -> bool:
+        try:
+            await run(result)
+        except Exception as e:
+            result.error = e
+            try:
+                if result.name in snapshots:
+                    bot.restore_extension(result.name, *snapshots[result.name])
+                    result.rolled_back = True
+                else:
+                    bot.unload_extension(result.name)
+            except Exception:
+                log.exception("Failed to unload %s after it failed to load", result.name)
+            return False
+        return True
+
+    for name in graph:
+        tasks[name] = asyncio.create_task(run_isolated(results[name]))
+    if tasks:
+        await asyncio.wait(tasks.values())
+
+    if failed := [result for result in results.values() if result.error]:
+        log.error(
+            "%d of %d cog(s) failed to load:\n%s",
+            len(failed),
+            len(results),
+            "\n".join(
+                f"{result.name}: {''.join(traceback.format_exception(result.error)).strip()}"
+                for result in failed
+            ),
+        )
+    log.info(
+        "Loaded %d cog(s), slowest was %s",
+        len(results) - len(failed),
+        max(results.values(), key=lambda result: result.seconds).name if results else None,
+    )
+    return results
@@ -1,15 +1,27 @@
 import datetime
 from typing import List
 
-import dateparser
 import discord
-from natural.date import compress as hr_duration
 from pytimeparse.timeparse import timeparse as duration_parse
 
+# dateparser and natural are slow to import, so they're only imported when first needed.
+
+
+def parse_datetime(value: str) -> datetime.datetime | None:
+    import dateparser
+
+    return dateparser.parse(value)
+
+
+def hr_duration(seconds: float) -> str:
+    from natural.date import compress
+
+    return compress(seconds)
+
 
 def timestamp_autocomplete(actx: discord.AutocompleteContext) -> List[str]:
     try:
-        return [dateparser.parse(actx.value).replace(microsecond=0).isoformat()]
+        return [parse_datetime(actx.value).replace(microsecond=0).isoformat()]
     except AttributeError:
         return [f'Invalid/unknown format: "{actx.value}"']
 
@@ -22,7 +34,7 @@ def duration_autocomplete(actx: discord.AutocompleteContext) -> List[str]:
 
 class TimestampConverter(discord.ext.commands.Converter):
     async def convert(self, ctx, argument):
-        if not (res := dateparser.parse(argument)):
+        if not (res := parse_datetime(argument)):
             raise discord.ext.commands.BadArgument(f'Invalid/unknown format: "{argument}"')
         return res.replace(microsecond=0)
 
@@ -1,7 +1,8 @@
 import discord
-from classes import config
+from classes import guild_configs
 
 async def is_admin_or_dev(ctx: discord.ApplicationContext):
-    return ctx.author.get_role(config["admin_role"]) or await ctx.bot.is_owner(
+    settings = guild_configs.get(ctx.guild_id)
+    return (settings and ctx.author.get_role(settings["admin_role"])) or await ctx.bot.is_owner(
         ctx.user
     )
\ No newline at end of file
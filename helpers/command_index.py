@@ -0,0 +1,99 @@
+import logging
+from typing import Dict, Iterator, List
+
+import discord
+
+from helpers.response_embeds import EmbedStyle
+
+log = logging.getLogger(__name__)
+
+MAX_CHOICES = 25  # Discord won't show more than 25 autocomplete choices.
+
+
+class _TrieNode:
+    __slots__ = ("children", "completions")
+
+    def __init__(self):
+        self.children: Dict[str, "_TrieNode"] = {}
+        self.completions: List[str] = []  # Kept sorted and capped at MAX_CHOICES.
+
+
+def walk_commands(bot: discord.Bot) -> Iterator[discord.ApplicationCommand]:
+    """Yields every invokable (non-group) application command added to the bot.
+
+    Walks the pending commands rather than the registered ones, so freshly loaded cogs are indexed before the next command sync.
+    """
+    for command in bot.pending_application_commands:
+        if isinstance(command, discord.SlashCommandGroup):
+            yield from (
+                sub
+                for sub in command.walk_commands()
+                if not isinstance(sub, discord.SlashCommandGroup)
+            )
+        else:
+            yield command
+
+
+def _mention(command: discord.ApplicationCommand) -> str:
+    try:
+        return command.mention
+    except AttributeError:  # Not synced yet (no ID), or not a slash command.
+        return f"/{command.qualified_name}"
+
+
+class CommandIndex:
+    """Prefix trie over qualified command names, plus the prebuilt /help embed for each command.
+
+    Every word boundary of a name is indexed, so typing "edit" completes to "profile edit" as well as anything starting with "edit".
+    Rebuilt whenever extensions are loaded/unloaded, lookups never touch the command tree.
+    """
+
+    def __init__(self):
+        self.root = _TrieNode()
+        self.embeds: Dict[str, discord.Embed] = {}
+
+    def rebuild(self, bot: discord.Bot):
+        root = _TrieNode()
+        embeds = {}
+        for command in walk_commands(bot):
+            name = command.qualified_name
+            embeds[name] = EmbedStyle.Info.value.embed(
+                title=f"Command info: {_mention(command)}",
+                description=command.callback.__doc__,
+            )
+            words = name.split(" ")
+            for i in range(len(words)):
+                self._insert(root, " ".join(words[i:]).lower(), name)
+        root.completions = sorted(embeds)[:MAX_CHOICES]  # Shown before anything is typed.
+        # Swap in atomically so autocomplete never sees a half-built index.
+        self.root, self.embeds = root, embeds
+        log.debug("Indexed %d commands", len(embeds))
+
+    @staticmethod
+    def _insert(root: _TrieNode, key: str, name: str):
+        node = root
+        for char in key:
+            node = node.children.setdefault(char, _TrieNode())
+            if name in node.completions:
+                continue
+            if len(node.completions) < MAX_CHOICES:
+                node.completions.append(name)
+                node.completions.sort()
+            elif name < node.completions[-1]:
+                node.completions[-1] = name
+                node.completions.sort()
+
+    def complete(self, prefix: str) -> List[str]:
+        """Returns up to 25 qualified command names matching the given prefix."""
+        node = self.root
+        for char in (prefix or "").lower():
+            if not (node := node.children.get(char)):
+                return []
+        return node.completions
+
+    def embed(self, name: str) -> discord.Embed | None:
+        """Returns the prebuilt help embed for a qualified command name, if it exists."""
+        return self.embeds.get(name)
+
+
+command_index = CommandIndex()
@@ -1,17 +1,19 @@
 import asyncio
+import contextvars
 import datetime
 import json
 import logging
 from dataclasses import dataclass, field
-from typing import TypeVar
+from typing import TYPE_CHECKING, Any, AsyncIterator, Awaitable, Callable, ClassVar, Dict, TypeVar
 
 import discord
-from jsonpickle import decode, encode
 from shortuuid import uuid
-from surrealdb import Surreal
-from surrealdb.ws import ConnectionState
 
-from classes import config, secrets
+from classes import background, guild_configs, secrets
+from helpers.read_cache import StaleResults, read_cache
+
+if TYPE_CHECKING:  # surrealdb and jsonpickle are imported on first use to keep them off the startup path.
+    from surrealdb import Surreal
 
 log = logging.getLogger(__name__)
 
@@ -28,59 +30,318 @@ class NoResultError(Exception):
         return f"Query {self.query} with params {self.params} returned {self.output}"
 
 
+@dataclass
+class DatabaseUnavailableError(Exception):
+    """The database couldn't be reached, and there was no cached copy to fall back on."""
+
+    database: str
+
+    def __str__(self):
+        return f"Database {self.database} is unreachable"
+
+
+def unreachable() -> tuple[type[Exception], ...]:
+    """The errors that mean the database is down or restarting, rather than that the query was wrong."""
+    from websockets.exceptions import WebSocketException  # surrealdb's transport
+
+    return OSError, TimeoutError, WebSocketException
+
+
+def cache_key(query: str, params: dict) -> str | None:
+    """What a query's results are cached under, or None if they aren't (anything but a SELECT may have written something)."""
+    if query.lstrip().upper().startswith("SELECT"):
+        return json.dumps([query, params], sort_keys=True, default=str)
+    return None
 
 
 R = TypeVar("R", bound='Resource')
 
+namespace = "foo"
+shared_tables: set[str] = set()  # Tables of shared Resources, which live in the home guild's database instead of each guild's
+
+
 class DatabaseConnection:
-    connection: Surreal
+    """SurrealDB access for every guild. A connection is bound to the database it USEs, so there's one per database, opened on first use.
+
+    When a database can't be reached, reads fall back to the local read cache (see helpers.read_cache), and writes are queued there
+    until it's back. Until the queue has been replayed, the database counts as offline, so later writes can't overtake queued ones.
+    """
+
+    timeout = 5  # Seconds before an unresponsive database counts as unreachable
 
     def __init__(self):
-        self.connection: Surreal = None
-
-    async def asetup(self):
-        log.info("Setting up SurrealDB database...")
-        self.connection = Surreal("ws://localhost:8000/rpc")
-        await self.connection.connect()
-        await self.connection.signin(
-            {"user": secrets["db_username"], "pass": secrets["db_password"]}
-        )
-        await self.connection.use("foo", "bar")
+        self.clients: Dict[str, "Surreal"] = {}  # database name -> connection
+        self.locks: Dict[str, asyncio.Lock] = {}  # database name -> lock held while (re)connecting
+        self.queue_locks: Dict[str, asyncio.Lock] = {}  # database name -> lock held while queueing a write, or while the last queued ones replay
+        self.offline: Dict[str, datetime.datetime] = {}  # database name -> when it became unreachable
+        self.recovering: Dict[str, asyncio.Task] = {}  # database name -> task waiting for it to come back
+
+    def database(self, table: str = None) -> str:
+        """The database a table (or a record, by ID) lives in: the home guild's for shared tables, otherwise the current guild's."""
+        if table and table.split(":", 1)[0] in shared_tables:
+            return guild_configs[guild_configs.home]["database"]
+        return guild_configs.current()["database"]
+
+    @property
+    def connection(self) -> "Surreal":
+        """The current guild's connection, or None if it isn't open yet."""
+        return self.clients.get(self.database())
+
+    async def asetup(self, database: str = None):
+        from surrealdb import Surreal
+
+        database = database or self.database()
+        log.info("Setting up SurrealDB database %s...", database)
+        client = Surreal("ws://localhost:8000/rpc")
+        try:
+            async with asyncio.timeout(self.timeout):  # Just connecting, the replay below can take as long as the backlog needs
+                await client.connect()
+                await client.signin(
+                    {"user": secrets["db_username"], "pass": secrets["db_password"]}
+                )
+                await client.use(namespace, database)
+            # Writes queued while it was unreachable go first, including any left over from an outage the last run didn't see the end of
+            if replayed := await self.replay_queued(database, client):
+                log.info("Replayed %d writes queued while %s was unreachable", replayed, database)
+        except BaseException:
+            await self.discard(client)
+            raise
+        self.clients[database] = client
         log.info("Database setup complete!")
 
+    @staticmethod
+    async def discard(client: "Surreal"):
+        """Closes a connection that's being given up on, whatever state it's in."""
+        try:
+            await client.close()
+        except Exception:
+            log.debug("Closing a discarded connection failed", exc_info=True)
+
     async def ateardown(self):
-        log.info("Closing SurrealDB database...")
-        await self.connection.close()
-        log.info("Database closed!")
+        log.info("Closing SurrealDB databases...")
+        for task in self.recovering.values():
+            task.cancel()
+        for client in self.clients.values():
+            await client.close()
+        self.clients.clear()
+        await read_cache.close()
+        log.info("Databases closed!")
+
+    async def client(self, database: str = None) -> "Surreal":
+        """The connection to a database (the current guild's by default), connecting or reconnecting it first if needed."""
+        from surrealdb.ws import ConnectionState
+
+        database = database or self.database()
+        if (client := self.clients.get(database)) and client.client_state == ConnectionState.CONNECTED:
+            return client
+        async with self.locks.setdefault(database, asyncio.Lock()):  # Concurrent first queries would each open a connection otherwise
+            if not (client := self.clients.get(database)) or client.client_state != ConnectionState.CONNECTED:
+                await self.asetup(database)
+        return self.clients[database]
+
+    async def attempt(self, database: str, operation: Callable[["Surreal"], Awaitable[Any]]) -> Any:
+        """Runs an operation on a database's connection.
+
+        Raises:
+            DatabaseUnavailableError: The database is unreachable, or still offline since it last was.
+        """
+        if database in self.offline:
+            raise DatabaseUnavailableError(database)
+        try:
+            client = await self.client(database)  # Connecting has its own timeout, see asetup
+            async with asyncio.timeout(self.timeout):
+                return await operation(client)
+        except unreachable() as e:
+            self.went_offline(database, e)
+            raise DatabaseUnavailableError(database) from e
+
+    def went_offline(self, database: str, error: Exception):
+        if client := self.clients.pop(database, None):  # Reconnect from scratch once it's back
+            background(self.discard(client))
+        if database not in self.offline:
+            log.warning("Database %s is unreachable (%r), serving cached reads and queueing writes until it's back", database, error)
+            self.offline[database] = datetime.datetime.now()
+            self.recovering[database] = asyncio.create_task(self.recover(database))
+
+    async def recover(self, database: str):
+        """Waits for a database to come back, then replays the writes queued meanwhile. Keeps trying until it works."""
+        delay, since = 1, self.offline[database]
+        while True:
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 10)
+            try:
+                client = await self.client(database)
+                await self.replay_queued(database, client)  # Writes queued while it was reconnecting
+                async with self.queue_locks.setdefault(database, asyncio.Lock()):
+                    await self.replay_queued(database, client)  # And any that were still being queued, none can be added now
+                    self.offline.pop(database)
+            except unreachable() as e:
+                log.debug("Database %s is still unreachable: %r", database, e)
+            except Exception:  # E.g. auth or namespace errors while the server is still starting up
+                log.exception("Reconnecting to database %s failed, retrying in %ds", database, delay)
+            else:
+                log.info("Database %s is back after %s", database, datetime.datetime.now() - since)
+                del self.recovering[database]
+                return
+            if client := self.clients.pop(database, None):
+                await self.discard(client)
+
+    async def replay_queued(self, database: str, client: "Surreal") -> int:
+        """Replays a database's queued writes in order, until there are none left. Returns how many were replayed."""
+        replayed = 0
+        while writes := await read_cache.pending(database):
+            for seq, op, record_id, data in writes:
+                table, key = record_id.split(":", 1)
+                try:
+                    async with asyncio.timeout(self.timeout):
+                        if op == "delete":
+                            await client.delete(record_id)
+                        else:  # Writes are idempotent, so one that went through before the connection dropped can be replayed
+                            await client.query(
+                                f"UPDATE type::thing($table, $key) {'CONTENT' if op == 'replace' else 'MERGE'} $data",
+                                {"table": table, "key": key, "data": {k: v for k, v in data.items() if k != "id"}},
+                            )
+                except unreachable():
+                    raise
+                except Exception:
+                    log.exception("Dropping the queued %s of %s, it failed to replay", op, record_id)
+                await read_cache.done(seq)
+                replayed += 1
+        return replayed
+
+    async def write(self, op: str, record_id: str, data: dict | None, operation: Callable[["Surreal"], Awaitable[Any]]) -> Any:
+        """Runs a write, or queues it if the database is unreachable. Returns None if it was queued."""
+        database = self.database(record_id)
+        while True:
+            try:
+                result = await self.attempt(database, operation)
+            except DatabaseUnavailableError:
+                async with self.queue_locks.setdefault(database, asyncio.Lock()):
+                    if database in self.offline:  # Recovery can't finish replaying while this is being queued, so it can't be left behind
+                        await read_cache.queue(database, op, record_id, data)
+                        log.info("Queued the %s of %s until %s is back", op, record_id, database)
+                        return None
+                continue  # It came back in the meantime
+            read_cache.apply(database, op, record_id, data)
+            return result
+
+    async def create(self, record_id: str, data: dict):
+        return await self.write("merge", record_id, data, lambda client: client.create(record_id, data=data))
+
+    async def update(self, record_id: str, data: dict):
+        return await self.write("merge", record_id, data, lambda client: client.update(record_id, data=data))
+
+    async def delete(self, record_id: str):
+        return await self.write("delete", record_id, None, lambda client: client.delete(record_id))
 
     async def get(self, obj_type: type[R], obj_id: str) -> R:
-        if not self.connection:
-            await self.asetup()
+        """Gets a record by ID. While the database is unreachable, this is its cached copy, or None if it was never read."""
         log.debug("Getting %s", obj_id)
-        obj = deser(obj_type, await self.connection.select(obj_id))
+        database = self.database(obj_id)
+        try:
+            record = await self.attempt(database, lambda client: client.select(obj_id))
+        except DatabaseUnavailableError:
+            record = await read_cache.record(database, obj_id)
+        else:
+            if record:
+                read_cache.snapshot(database, [record])
+        obj = deser(obj_type, record)
         log.debug("Found %s", obj)
         return obj
 
     async def run_query(self, obj_type: type[R], query: str, **params) -> list[R]:
-        if (
-            not self.connection
-        ) or self.connection.client_state != ConnectionState.CONNECTED:
-            await self.asetup()
-        log.debug("Running query %s with params %s", query, params)
-        output = await self.connection.query(query, params)
+        """Runs a query and deserializes its results. They're `StaleResults` if they came from the read cache."""
+        records = await self.run_raw_query(query, self.database(obj_type.__name__), **params)
+        results = deser(list, records)
+        return StaleResults(results, records.as_of) if isinstance(records, StaleResults) else results
+
+    async def run_raw_query(self, query: str, database: str = None, **params) -> list[dict]:
+        """Runs a query and returns the last statement's records as plain JSON, without deserializing them.
+
+        While the database is unreachable, SELECTs it has run before are answered from the read cache, as `StaleResults`.
+
+        Args:
+            query (str): The SurrealQL query.
+            database (str, optional): The database to run it on. Defaults to the current guild's.
+
+        Raises:
+            DatabaseUnavailableError: The database is unreachable, and the query isn't cached.
+        """
+        database = database or self.database()
+        log.debug("Running query %s on %s with params %s", query, database, params)
+        key = cache_key(query, params)
+        try:
+            output = await self.attempt(database, lambda client: client.query(query, params))
+        except DatabaseUnavailableError:
+            if key is None or (cached := await read_cache.recall(database, key)) is None:
+                raise
+            log.debug("Serving cached results as of %s", cached.as_of)
+            return cached
         try:
             results = output[-1]["result"]
         except (IndexError, KeyError) as e:
             raise NoResultError(query, params, output) from e
         else:
             log.debug("Found %s", results)
-            return deser(list, results)
+            if isinstance(results, list):
+                read_cache.snapshot(database, results, key)
+            return results
+
+    async def fetch_page(self, table: str, after: str = None, limit: int = 500) -> list[dict]:
+        """Fetches up to `limit` raw records of a table in ID order, starting after the record ID `after`.
+
+        This is keyset pagination (`WHERE id > after`), so every page costs the same no matter how deep into the table it is.
+        """
+        if after is None:
+            return await self.run_raw_query(
+                "SELECT * FROM type::table($table) ORDER BY id LIMIT $limit", self.database(table), table=table, limit=limit
+            )
+        return await self.run_raw_query(
+            "SELECT * FROM type::table($table) WHERE id > type::thing($table, $after) ORDER BY id LIMIT $limit",
+            self.database(table),
+            table=table,
+            after=after.split(":", 1)[1],
+            limit=limit,
+        )
+
+    async def stream_table(self, table: str, page_size: int = 500) -> AsyncIterator[list[dict]]:
+        """Yields a table's raw records a page at a time, in ID order."""
+        page = await self.fetch_page(table, limit=page_size)
+        while page:
+            yield page
+            if len(page) < page_size:
+                return
+            page = await self.fetch_page(table, page[-1]["id"], page_size)
+
+    async def upsert_raw(self, records: list[dict]):
+        """Writes raw records (as returned by run_raw_query) of one table in one transaction, replacing any existing records with the same IDs.
+
+        If the database is unreachable, they're queued to be written once it's back instead.
+        """
+        if not records:
+            return
+        database = self.database(records[0]["id"])
+        statements, params = ["BEGIN TRANSACTION;"], {}
+        for i, record in enumerate(records):
+            table, key = record["id"].split(":", 1)
+            statements.append(f"UPDATE type::thing($table{i}, $key{i}) CONTENT $record{i};")
+            params |= {f"table{i}": table, f"key{i}": key, f"record{i}": {k: v for k, v in record.items() if k != "id"}}
+        statements.append("COMMIT TRANSACTION;")
+        try:
+            await self.run_raw_query("\n".join(statements), database, **params)
+        except DatabaseUnavailableError:
+            for record in records:
+                await read_cache.queue(database, "replace", record["id"], record)
+            log.info("Queued %d records until %s is back", len(records), database)
+            return
+        for record in records:
+            read_cache.apply(database, "replace", record["id"], record)
 
 
 connection = DatabaseConnection()
 
 
-@dataclass
+@dataclass(slots=True)  # Slotted to keep instances small. Subclasses must be slotted too, and call super(Cls, self) rather than super().
 class Resource:
     id: str = field(
         default=None, kw_only=True
@@ -89,6 +350,12 @@ class Resource:
         default_factory=datetime.datetime.now, kw_only=True
     )
     updated_at: datetime.datetime = field(default=None, kw_only=True)
+    shared: ClassVar[bool] = False  # Whether records are shared by every guild (e.g. a player's own profile) rather than kept per guild
+
+    def __init_subclass__(cls, **kwargs):
+        super(Resource, cls).__init_subclass__(**kwargs)
+        if cls.shared:
+            shared_tables.add(cls.__name__)
 
     def __post_init__(self):
         if not self.id:
@@ -104,9 +371,9 @@ class Resource:
         return embed
 
     def __setattr__(self, name, value):
-        super().__setattr__(name, value)
+        object.__setattr__(self, name, value)
         if (
-            name != "updated_at"
+            name != "updated_at" and not restoring.get()
         ):  # prevent setting updated_at from causing a recursive loop
             self.updated_at = datetime.datetime.now()
 
@@ -116,17 +383,22 @@ class Resource:
         if old := await connection.get(self.__class__, self.id):
             old_ser = ser(old)
             differences = {k: v for k, v in ser(self).items() if v != old_ser[k]}
-            record = await connection.connection.update(self.id, data=differences)
+            record = await connection.update(self.id, differences)
             log.debug("Updated %s", record)
         else:
-            record = await connection.connection.create(self.id, data=ser(self))
+            record = await connection.create(self.id, ser(self))
             log.debug("Inserted %s", record)
 
 
 def ser(value: R):
+    from jsonpickle import encode
+
     return json.loads(encode(value))
 
 
+restoring = contextvars.ContextVar("restoring", default=False)  # Set while deserializing, so loading a record doesn't count as updating it
+
+
 def deser(obj_type: type[R], data: dict) -> R:
     """Deserializes data into a Resource.
     Args:
@@ -135,4 +407,10 @@ def deser(obj_type: type[R], data: dict) -> R:
     Returns:
         R: The final object.
     """
-    return decode(json.dumps(data))
+    from jsonpickle import decode
+
+    token = restoring.set(True)
+    try:
+        return decode(json.dumps(data))
+    finally:
+        restoring.reset(token)
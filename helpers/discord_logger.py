@@ -2,8 +2,10 @@ import discord
 import logging
 
 import asyncio
+import collections
 from classes import clean
 import datetime
+from helpers.outbound import Priority, outbound
 
 import textwrap
 
@@ -29,6 +31,9 @@ class DiscordLogHandler(logging.Handler):
 
         self.channel_id = channel_id
 
+        self.waiting = collections.deque(maxlen=1000)  # Embeds logged before the bot was ready, the oldest are dropped first
+        self.held: asyncio.Task = None  # Sends them on once the bot is ready
+
     def emit(self, record: logging.LogRecord) -> None:
         embed = discord.Embed(
             title=f"{record.levelname} at {record.module}:{record.lineno} in {record.funcName}",
@@ -52,6 +57,29 @@ class DiscordLogHandler(logging.Handler):
                 value=truncate_and_codeblock(record.exc_text, 1024),
             )
 
-        asyncio.get_event_loop().create_task(
-            self.bot.get_channel(self.channel_id).send(embed=embed)
-        )
+        try:
+            # Records can come from worker threads, the scheduler lives on the event loop.
+            self.bot.loop.call_soon_threadsafe(self.queue, embed)
+        except RuntimeError:  # Event loop closed
+            self.handleError(record)
+
+    def queue(self, embed: discord.Embed):
+        """Hands an embed to the outbound scheduler. Until the bot is ready they're held here instead,
+        so a burst of startup logs waiting for the bot can't take up the scheduler's slots."""
+        if not self.bot.is_ready():
+            self.waiting.append(embed)
+            if not self.held:
+                self.held = asyncio.create_task(self.hold_until_ready())
+            return
+        outbound.send_coalesced(Priority.LOG, f"channel:{self.channel_id}", f"log:{self.channel_id}", embed, self.send_embeds)
+
+    async def hold_until_ready(self):
+        await self.bot.wait_until_ready()
+        self.held = None
+        while self.waiting:
+            self.queue(self.waiting.popleft())
+
+    async def send_embeds(self, embeds: list[discord.Embed]):
+        """Sends queued log embeds, up to 10 per message."""
+        channel = self.bot.get_channel(self.channel_id) or await self.bot.fetch_channel(self.channel_id)
+        await channel.send(embeds=embeds)
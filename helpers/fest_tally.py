@@ -0,0 +1,101 @@
+"""Live tally of a server Splatfest: team picks and per-team counters like match wins.
+
+Votes and wins land in memory, and only what changed since the last flush gets written to the database, in one query every few seconds.
+After a crash the tally picks up from the last flush, so at most one flush interval of votes is lost.
+"""
+import collections
+import datetime
+import logging
+from typing import Dict, List, Tuple
+
+from shortuuid import uuid
+
+from helpers.db_handling_sdb import connection
+
+log = logging.getLogger(__name__)
+
+metrics = {"picks": "Members", "wins": "Wins"}  # Counter name -> display name
+
+
+class FestTally:
+    def __init__(self, record: dict):
+        """
+        Args:
+            record (dict): The raw Fest record, as stored by `create()`.
+        """
+        self.id: str = record["id"]
+        self.name: str = record["name"]
+        self.teams: List[str] = record["teams"]
+        self.channel_id: int = record.get("channel_id")
+        self.message_id: int = record.get("message_id")
+        self.counts: Dict[str, collections.Counter] = {
+            team: collections.Counter(record.get("counts", {}).get(team, {})) for team in self.teams
+        }
+        self.picks: Dict[int, str] = {int(user_id): team for user_id, team in record.get("picks", {}).items()}
+        self.dirty_counts: set[Tuple[str, str]] = set()  # (team, metric) changed since the last flush
+        self.dirty_picks: set[int] = set()
+        self.version = 0  # Bumped on every change, so the standings message is only edited when something changed
+
+    @classmethod
+    async def create(cls, name: str, teams: List[str], channel_id: int) -> "FestTally":
+        record = {
+            "id": f"Fest:{uuid()}",
+            "name": name,
+            "teams": teams,
+            "channel_id": channel_id,
+            "message_id": None,
+            "active": True,
+            "started_at": datetime.datetime.now().isoformat(),
+            "counts": {team: {} for team in teams},
+            "picks": {},
+        }
+        await connection.upsert_raw([record])
+        return cls(record)
+
+    @classmethod
+    async def load_active(cls) -> "FestTally | None":
+        """Recovers the running fest from its last flush, if there is one."""
+        records = await connection.run_raw_query("SELECT * FROM Fest WHERE active = true LIMIT 1")
+        return cls(records[0]) if records else None
+
+    def pick(self, user_id: int, team: str) -> str | None:
+        """Puts a member on a team, moving them off their old one. Returns the old team."""
+        if (old := self.picks.get(user_id)) == team:
+            return old
+        if old:
+            self.add(old, "picks", -1)
+        self.picks[user_id] = team
+        self.dirty_picks.add(user_id)
+        self.add(team, "picks")
+        return old
+
+    def add(self, team: str, metric: str, amount: int = 1):
+        self.counts[team][metric] += amount
+        self.dirty_counts.add((team, metric))
+        self.version += 1
+
+    def standings(self, metric: str = "wins") -> List[Tuple[str, collections.Counter]]:
+        return sorted(self.counts.items(), key=lambda item: item[1][metric], reverse=True)
+
+    async def flush(self):
+        """Writes the counters and picks that changed since the last flush. Safe to call when nothing changed."""
+        if not (self.dirty_counts or self.dirty_picks):
+            return
+        counts, self.dirty_counts = self.dirty_counts, set()
+        picks, self.dirty_picks = self.dirty_picks, set()
+        changes = {"counts": {}, "picks": {str(user_id): self.picks[user_id] for user_id in picks}}
+        for team, metric in counts:  # Totals rather than increments: only this process writes them, so a retried flush can't count twice
+            changes["counts"].setdefault(team, {})[metric] = self.counts[team][metric]
+        try:
+            await self.save(changes)
+        except Exception:
+            self.dirty_counts |= counts  # Try again next flush
+            self.dirty_picks |= picks
+            raise
+
+    async def save(self, changes: dict):
+        await connection.run_raw_query("UPDATE type::thing('Fest', $key) MERGE $changes", key=self.id.split(":", 1)[1], changes=changes)
+
+    async def end(self):
+        await self.flush()
+        await self.save({"active": False, "ended_at": datetime.datetime.now().isoformat()})
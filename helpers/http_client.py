@@ -0,0 +1,99 @@
+import collections
+import logging
+import time
+
+import aiohttp
+
+log = logging.getLogger(__name__)
+
+
+class HTTPClientManager:
+    """One pooled aiohttp session shared by the whole bot. Cogs borrow `http_client.session` instead of opening their own.
+
+    The session is created on first use (it has to be made on the running event loop) and closed when the bot closes.
+    """
+
+    def __init__(
+        self,
+        limit: int = 100,
+        limit_per_host: int = 10,
+        dns_cache_ttl: int = 300,
+        keepalive_timeout: float = 30,
+        timeout: aiohttp.ClientTimeout = aiohttp.ClientTimeout(total=30, connect=10),
+    ):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.dns_cache_ttl = dns_cache_ttl
+        self.keepalive_timeout = keepalive_timeout
+        self.timeout = timeout
+        self.counters = collections.Counter()
+        self.queued_seconds = 0.0  # Total time requests spent waiting for a free connection.
+        self._session: aiohttp.ClientSession = None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=self.limit,
+                    limit_per_host=self.limit_per_host,
+                    ttl_dns_cache=self.dns_cache_ttl,
+                    keepalive_timeout=self.keepalive_timeout,
+                ),
+                timeout=self.timeout,
+                trace_configs=[self._trace_config()],
+            )
+            log.info("HTTP session opened")
+        return self._session
+
+    async def close(self):
+        if self._session and not self._session.closed:
+            await self._session.close()
+            log.info("HTTP session closed")
+
+    def _trace_config(self) -> aiohttp.TraceConfig:
+        trace = aiohttp.TraceConfig()
+
+        def count(counter: str):
+            async def hook(session, context, params):
+                self.counters[counter] += 1
+
+            return hook
+
+        async def queued_start(session, context, params):
+            context.queued_at = time.perf_counter()
+
+        async def queued_end(session, context, params):
+            self.queued_seconds += time.perf_counter() - context.queued_at
+
+        trace.on_request_start.append(count("requests"))
+        trace.on_request_end.append(count("completed"))
+        trace.on_request_exception.append(count("failed"))
+        trace.on_connection_create_end.append(count("new_connections"))
+        trace.on_connection_reuseconn.append(count("reused_connections"))
+        trace.on_connection_queued_start.append(count("queued"))
+        trace.on_connection_queued_start.append(queued_start)
+        trace.on_connection_queued_end.append(queued_end)
+        trace.on_dns_cache_hit.append(count("dns_cache_hits"))
+        trace.on_dns_cache_miss.append(count("dns_cache_misses"))
+        return trace
+
+    def stats(self) -> dict[str, int | float]:
+        """Pool utilization stats since the bot started."""
+        counters = self.counters
+        return {
+            "Pool size": self.limit,
+            "Per-host limit": self.limit_per_host,
+            "Requests": counters["requests"],
+            "In flight": counters["requests"] - counters["completed"] - counters["failed"],
+            "Failed": counters["failed"],
+            "New connections": counters["new_connections"],
+            "Reused connections": counters["reused_connections"],
+            "Waited for a connection": counters["queued"],
+            "Time waiting for connections (s)": round(self.queued_seconds, 3),
+            "DNS cache hits": counters["dns_cache_hits"],
+            "DNS cache misses": counters["dns_cache_misses"],
+        }
+
+
+http_client = HTTPClientManager()
@@ -0,0 +1,98 @@
+"""Hands out classic LAN play IPs (10.13.a.b) so that no two players hold the same one.
+
+Every address has a bit in a bitmap of 64-bit words. Finding a free address skips whole full words at a time and remembers where it left off,
+so it's O(1) amortized. Each player keeps their address for `ttl` after they last asked for it, and leases are stored so they survive restarts.
+"""
+import datetime
+import heapq
+import logging
+from array import array
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Tuple
+
+from helpers.db_handling_sdb import Resource, connection
+
+log = logging.getLogger(__name__)
+
+size = 256 * 256  # 10.13.0.0 - 10.13.255.255
+full_word = (1 << 64) - 1
+reserved = {37 * 256 + 1}  # 10.13.37.1 is the relay server's own address
+
+
+class NoFreeAddressError(Exception):
+    """Every address is leased."""
+
+
+def address(index: int) -> str:
+    return f"10.13.{index >> 8}.{index & 255}"
+
+
+@dataclass(slots=True)
+class LanLease(Resource):
+    shared = True  # Every guild's players share the relay, so addresses must be unique across guilds
+
+    owner_id: int
+    index: int  # a * 256 + b for 10.13.a.b
+    expires_at: datetime.datetime
+
+
+class LanIPAllocator:
+    def __init__(self, ttl: datetime.timedelta = datetime.timedelta(hours=12)):
+        self.ttl = ttl
+        self.words = array("Q", [0]) * (size // 64)
+        self.hint = 0  # Word to start looking from, everything before it was full last time
+        self.leases: Dict[int, LanLease] = {}  # owner ID -> lease
+        self.expiry: List[Tuple[datetime.datetime, int]] = []  # Min-heap of (expiry, owner ID). Stale entries are skipped.
+        for index in range(size):
+            if index & 255 in (0, 255) or index in reserved:  # Network and broadcast addresses of each /24 aren't usable
+                self.mark(index)
+
+    def mark(self, index: int):
+        self.words[index >> 6] |= 1 << (index & 63)
+
+    def unmark(self, index: int):
+        self.words[index >> 6] &= ~(1 << (index & 63)) & full_word
+        self.hint = min(self.hint, index >> 6)
+
+    def find_free(self) -> int:
+        for offset in range(len(self.words)):
+            i = (self.hint + offset) % len(self.words)
+            if (word := self.words[i]) != full_word:
+                self.hint = i
+                return (i << 6) + ((~word & (word + 1)).bit_length() - 1)  # Lowest clear bit
+        raise NoFreeAddressError
+
+    def load(self, leases: Iterable[LanLease]):
+        """Takes over stored leases, e.g. on startup. Expired ones are freed on the next lease()."""
+        for lease in leases:
+            self.leases[lease.owner_id] = lease
+            self.mark(lease.index)
+            heapq.heappush(self.expiry, (lease.expires_at, lease.owner_id))
+
+    async def expire(self, now: datetime.datetime):
+        while self.expiry and self.expiry[0][0] <= now:
+            expires_at, owner_id = heapq.heappop(self.expiry)
+            if (lease := self.leases.get(owner_id)) and lease.expires_at == expires_at:
+                del self.leases[owner_id]
+                self.unmark(lease.index)
+                await connection.delete(lease.id)
+
+    async def lease(self, owner_id: int) -> str:
+        """Returns a player's address, leasing a new one if they have none. Asking again extends the lease.
+
+        Raises:
+            NoFreeAddressError: Every address is leased.
+        """
+        now = datetime.datetime.now()
+        await self.expire(now)
+        if not (lease := self.leases.get(owner_id)):
+            index = self.find_free()
+            self.mark(index)
+            lease = self.leases[owner_id] = LanLease(owner_id, index, now + self.ttl, id=f"LanLease:{owner_id}")
+        lease.expires_at = now + self.ttl
+        heapq.heappush(self.expiry, (lease.expires_at, owner_id))
+        await lease.store()
+        return address(lease.index)
+
+
+lan_ips = LanIPAllocator()
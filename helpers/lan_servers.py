@@ -0,0 +1,151 @@
+"""Keeps track of which classic LAN play servers are up and how far away they are.
+
+Relay servers answer `GET /info` over HTTP on their relay port with the number of players online, which doubles as a latency probe.
+The servers players list in their profiles are deduplicated, probed concurrently in the background (with a cap on parallel probes and a
+timeout per server), and the results are cached, so commands read statuses without ever waiting on a probe.
+Servers come from players, so only relay ports are probed, and only on public addresses (no localhost, private networks or cloud metadata).
+Both are parameters of `LanServerProber`, so tests can point one at local stand-in servers.
+"""
+import asyncio
+import collections
+import ipaddress
+import logging
+import socket
+import time
+from dataclasses import dataclass
+from typing import Callable, Collection, Dict, Iterable, List
+
+import aiohttp
+
+from helpers.http_client import http_client
+
+log = logging.getLogger(__name__)
+
+default_port = 11451
+relay_ports = {11451, 11452, 11453}  # The ports relay servers listen on, nothing else is probed
+
+
+def normalize_server(value: str, ports: Collection[int] = relay_ports) -> str | None:
+    """'JoinSG.net:11453 ' -> 'joinsg.net:11453'. Adds the default port if there's none. None if there's nothing to probe,
+    including servers on a port that isn't in `ports`."""
+    value = (value or "").strip().lower().removeprefix("http://").rstrip("/")
+    if not value or " " in value:
+        return None
+    host, _, port = value.rpartition(":") if ":" in value else (value, "", str(default_port))
+    return f"{host}:{port}" if host and port.isdigit() and int(port) in ports else None
+
+
+def is_public(address: ipaddress.IPv4Address | ipaddress.IPv6Address) -> bool:
+    return address.is_global
+
+
+async def public_address(
+    host: str, allow: Callable[[ipaddress.IPv4Address | ipaddress.IPv6Address], bool] = is_public, timeout: float = 3
+) -> str | None:
+    """Resolves a host to one of its addresses, or None if it doesn't resolve in time or any of its addresses isn't allowed."""
+    try:
+        async with asyncio.timeout(timeout):
+            infos = await asyncio.get_running_loop().getaddrinfo(host, None, type=socket.SOCK_STREAM)
+    except (OSError, UnicodeError, TimeoutError):
+        return None
+    addresses = {ipaddress.ip_address(info[4][0].split("%", 1)[0]) for info in infos}
+    if not addresses or not all(allow(address) for address in addresses):
+        return None
+    return str(min(addresses, key=lambda address: address.version))  # IPv4 first
+
+
+@dataclass
+class ServerStatus:
+    online: bool
+    latency: float = None  # Seconds
+    players: int = None
+    checked_at: float = 0
+
+    def __str__(self):
+        if not self.online:
+            return "🔴 Offline"
+        players = f", {self.players} online" if self.players is not None else ""
+        return f"🟢 {self.latency * 1000:.0f}ms{players}"
+
+
+class LanServerProber:
+    def __init__(
+        self,
+        max_parallel: int = 16,
+        timeout: float = 3,
+        ttl: float = 600,
+        ports: Collection[int] = relay_ports,
+        allow: Callable[[ipaddress.IPv4Address | ipaddress.IPv6Address], bool] = is_public,
+    ):
+        self.max_parallel = max_parallel
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.ttl = ttl  # Seconds a probe result is trusted for
+        self.ports = ports  # Ports that may be probed
+        self.allow = allow  # Whether an address may be probed
+        self.servers: Dict[int, str] = {}  # owner ID -> normalized server
+        self.statuses: Dict[str, ServerStatus] = {}
+
+    def track(self, owner_id: int, server: str):
+        """Records a player's main server (or forgets it, if it's empty)."""
+        if server := normalize_server(server, self.ports):
+            self.servers[owner_id] = server
+        else:
+            self.servers.pop(owner_id, None)
+
+    def status(self, server: str) -> ServerStatus | None:
+        """The cached status of a server, or None if it hasn't been probed recently."""
+        status = self.statuses.get(normalize_server(server, self.ports))
+        return status if status and time.monotonic() - status.checked_at < self.ttl else None
+
+    async def probe(self, server: str) -> ServerStatus:
+        host, _, port = (normalize_server(server, self.ports) or "").rpartition(":")
+        if not host or not (address := await public_address(host, self.allow, self.timeout.total)):
+            log.debug("Not probing %s, it isn't an allowed relay address", server)
+            return ServerStatus(False, checked_at=time.monotonic())
+        url_host = f"[{address}]" if ":" in address else address
+        start = time.perf_counter()
+        try:
+            # To the address that was checked, so the name can't resolve somewhere else by the time it's connected to
+            async with http_client.session.get(
+                f"http://{url_host}:{port}/info", headers={"Host": host}, timeout=self.timeout, allow_redirects=False
+            ) as response:
+                if response.status != 200:
+                    raise aiohttp.ClientResponseError(response.request_info, response.history, status=response.status)
+                info = await response.json(content_type=None)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+            return ServerStatus(False, checked_at=time.monotonic())
+        players = info.get("online") if isinstance(info, dict) else None
+        return ServerStatus(True, time.perf_counter() - start, players if isinstance(players, int) else None, time.monotonic())
+
+    async def probe_all(self, servers: Iterable[str] = None):
+        """Probes every tracked server (or the given ones) once, a few at a time."""
+        tracked = servers is None
+        servers = set(self.servers.values() if tracked else servers)
+        semaphore = asyncio.Semaphore(self.max_parallel)
+
+        async def probe(server: str):
+            async with semaphore:
+                self.statuses[server] = await self.probe(server)
+
+        await asyncio.gather(*(probe(server) for server in servers))
+        if tracked:
+            for server in set(self.statuses) - servers:
+                del self.statuses[server]  # Nobody uses it anymore
+        log.debug("Probed %d LAN play servers, %d online", len(servers), sum(status.online for status in self.statuses.values()))
+
+    def best_server(self, owner_ids: Iterable[int]) -> List[tuple[str, int, ServerStatus]]:
+        """Ranks the online servers for a lobby: the most players' main server first, then the lowest latency.
+
+        Returns:
+            list[tuple[str, int, ServerStatus]]: (server, players in the lobby who main it, status), best first.
+        """
+        mains = collections.Counter(self.servers[owner_id] for owner_id in owner_ids if owner_id in self.servers)
+        candidates = [
+            (server, mains[server], status)
+            for server in set(self.servers.values())
+            if (status := self.status(server)) and status.online
+        ]
+        return sorted(candidates, key=lambda candidate: (-candidate[1], candidate[2].latency))
+
+
+lan_servers = LanServerProber()
@@ -0,0 +1,52 @@
+"""Keeps the member cache down to the members the bot actually works with.
+
+py-cord caches every member of the guild by default. Instead, guilds aren't chunked at startup, members are cached as they join or interact,
+and a periodic trim drops everyone who isn't unverified, doesn't hold a staff role and hasn't interacted with the bot lately.
+Code that needs a member who may not be cached uses `interaction.user`/options, or falls back to fetching them.
+"""
+import logging
+import time
+from typing import Dict
+
+import discord
+
+from classes import guild_configs
+
+log = logging.getLogger(__name__)
+
+active_window = 6 * 60 * 60  # Seconds a member counts as an active player after their last interaction
+
+flags = discord.MemberCacheFlags(joined=True, interaction=True, voice=False)
+
+
+class MemberCachePolicy:
+    def __init__(self):
+        self.last_seen: Dict[int, float] = {}  # member ID -> monotonic time of their last interaction
+
+    def kept_roles(self, guild: discord.Guild) -> set[int]:
+        if not (settings := guild_configs.get(guild.id)):
+            return set()
+        return {settings["captcha"]["unverified_role"], settings["admin_role"]}
+
+    def seen(self, member_id: int):
+        self.last_seen[member_id] = time.monotonic()
+
+    def keep(self, member: discord.Member, now: float, kept_roles: set[int]) -> bool:
+        return (
+            now - self.last_seen.get(member.id, -active_window) < active_window
+            or any(role.id in kept_roles for role in member.roles)
+            or member.id == member.guild.me.id
+        )
+
+    def trim(self, guild: discord.Guild) -> int:
+        """Drops the members the bot has no use for from the guild's cache. Returns how many were dropped."""
+        now = time.monotonic()
+        self.last_seen = {member_id: at for member_id, at in self.last_seen.items() if now - at < active_window}
+        kept_roles = self.kept_roles(guild)
+        dropped = [member for member in guild.members if not self.keep(member, now, kept_roles)]
+        for member in dropped:
+            guild._remove_member(member)  # py-cord has no public way to evict a cached member
+        return len(dropped)
+
+
+member_cache = MemberCachePolicy()
@@ -0,0 +1,198 @@
+"""Latency histograms for every interaction the bot handles, exported in Prometheus' text format.
+
+Each interaction is timed twice: until its first response (what the user waits on, and what Discord's 3 second window applies to) and until its handler returns.
+Histograms have fixed buckets, so memory stays bounded no matter how many interactions come in.
+"""
+import bisect
+import collections
+import contextlib
+import functools
+import logging
+import time
+from typing import Dict, List, Tuple
+
+import discord
+
+log = logging.getLogger(__name__)
+
+buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)  # Upper bounds in seconds, plus +Inf
+
+
+class Histogram:
+    __slots__ = ("counts", "sum", "count", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0  # Largest value seen, so estimates never go past it
+
+    def observe(self, seconds: float):
+        self.counts[bisect.bisect_left(buckets, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q: float) -> float:
+        """Estimates a quantile by interpolating inside its bucket, like Prometheus' histogram_quantile.
+        The bucket is cut off at the largest value seen, so a coarse bucket can't make the estimate exceed it."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                if i == len(buckets):
+                    return self.max  # Past the last bucket, nothing to interpolate towards
+                lower = buckets[i - 1] if i else 0.0
+                return lower + (min(buckets[i], self.max) - lower) * (rank - seen) / count
+            seen += count
+        return self.max
+
+
+def command_name(interaction: discord.Interaction) -> str:
+    """The qualified name of the application command an interaction is for, subcommands included."""
+    parts = [interaction.data["name"]]
+    options = interaction.data.get("options", [])
+    while options and options[0].get("type") in (1, 2):  # Subcommand, subcommand group
+        parts.append(options[0]["name"])
+        options = options[0].get("options", [])
+    return " ".join(parts)
+
+
+class InteractionMetrics:
+    max_pending = 1000  # Interactions still waiting for their first response that are being tracked
+
+    def __init__(self):
+        self.histograms: Dict[Tuple[str, str, str], Histogram] = {}  # (kind, name, phase) -> histogram
+        # interaction ID -> (start time, kind, name), until the first response is sent.
+        self.pending: collections.OrderedDict[int, Tuple[float, str, str]] = collections.OrderedDict()
+
+    def observe(self, kind: str, name: str, phase: str, seconds: float):
+        if (key := (kind, name, phase)) not in self.histograms:
+            self.histograms[key] = Histogram()
+        self.histograms[key].observe(seconds)
+
+    def age(self, interaction: discord.Interaction) -> float | None:
+        """Seconds since a still unanswered interaction started being handled."""
+        if entry := self.pending.get(interaction.id):
+            return time.perf_counter() - entry[0]
+        return None
+
+    def responded(self, interaction: discord.Interaction):
+        if entry := self.pending.pop(interaction.id, None):
+            start, kind, name = entry
+            self.observe(kind, name, "first_response", time.perf_counter() - start)
+
+    @contextlib.contextmanager
+    def timed(self, interaction: discord.Interaction, kind: str, name: str):
+        """Times an interaction handler end to end, and its first response if it sends one."""
+        start = time.perf_counter()
+        self.pending[interaction.id] = (start, kind, name)
+        while len(self.pending) > self.max_pending:
+            self.pending.popitem(last=False)
+        try:
+            yield
+        finally:
+            self.observe(kind, name, "total", time.perf_counter() - start)
+            self.pending.pop(interaction.id, None)  # Never responded
+
+    def prometheus(self) -> str:
+        """Renders every histogram in the Prometheus text exposition format."""
+        escape = lambda value: value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        lines = [
+            "# HELP kolkra_interaction_seconds Time taken to handle interactions.",
+            "# TYPE kolkra_interaction_seconds histogram",
+        ]
+        for (kind, name, phase), histogram in sorted(self.histograms.items()):
+            labels = f'kind="{kind}",name="{escape(name)}",phase="{phase}"'
+            cumulative = 0
+            for bound, count in zip((*buckets, "+Inf"), histogram.counts):
+                cumulative += count
+                lines.append(f'kolkra_interaction_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"kolkra_interaction_seconds_sum{{{labels}}} {histogram.sum}")
+            lines.append(f"kolkra_interaction_seconds_count{{{labels}}} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> List[Tuple[str, str, Histogram, Histogram]]:
+        """(kind, name, total histogram, first response histogram) for every handler, busiest first."""
+        rows = [
+            (kind, name, histogram, self.histograms.get((kind, name, "first_response")))
+            for (kind, name, phase), histogram in self.histograms.items()
+            if phase == "total"
+        ]
+        return sorted(rows, key=lambda row: row[2].count, reverse=True)
+
+
+metrics = InteractionMetrics()
+
+
+def instrument():
+    """Hooks timing into py-cord's component/modal dispatch and interaction responses. Application commands and autocomplete are timed by the bot itself.
+
+    These are the only places py-cord exposes every component callback, modal callback and response, so they get wrapped once at startup.
+    """
+    if getattr(discord.InteractionResponse, "_timed", False):
+        return
+    discord.InteractionResponse._timed = True
+
+    def first_response(method):
+        @functools.wraps(method)
+        async def wrapper(self, *args, **kwargs):
+            result = await method(self, *args, **kwargs)
+            metrics.responded(self._parent)
+            return result
+
+        return wrapper
+
+    for method in ("defer", "send_message", "edit_message", "send_modal", "send_autocomplete_result"):
+        setattr(discord.InteractionResponse, method, first_response(getattr(discord.InteractionResponse, method)))
+
+    scheduled_task = discord.ui.View._scheduled_task
+
+    @functools.wraps(scheduled_task)
+    async def view_scheduled_task(self, item, interaction):
+        callback = getattr(item.callback, "func", item.callback)  # Decorated items wrap their callback in a partial
+        with metrics.timed(interaction, "component", f"{type(self).__name__}.{callback.__name__}"):
+            return await scheduled_task(self, item, interaction)
+
+    discord.ui.View._scheduled_task = view_scheduled_task
+
+    modal_dispatch = discord.ui.modal.ModalStore.dispatch
+
+    @functools.wraps(modal_dispatch)
+    async def dispatch(self, user_id, custom_id, interaction):
+        if (modal := self._modals.get((user_id, custom_id))) is None:
+            return await modal_dispatch(self, user_id, custom_id, interaction)
+        with metrics.timed(interaction, "modal", type(modal).__name__):
+            return await modal_dispatch(self, user_id, custom_id, interaction)
+
+    discord.ui.modal.ModalStore.dispatch = dispatch
+
+
+_server = None
+
+
+async def serve(port: int, host: str = "127.0.0.1"):
+    """Serves the metrics at http://host:port/metrics for Prometheus to scrape. Does nothing if already serving."""
+    global _server
+    if _server:
+        return
+    from aiohttp import web
+
+    async def handler(request):
+        return web.Response(text=metrics.prometheus(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handler)
+    _server = web.AppRunner(app)
+    await _server.setup()
+    await web.TCPSite(_server, host, port).start()
+    log.info("Serving metrics on http://%s:%d/metrics", host, port)
+
+
+async def stop_serving():
+    global _server
+    if _server:
+        await _server.cleanup()
+        _server = None
@@ -0,0 +1,205 @@
+"""Central scheduler for outbound Discord traffic that isn't an initial interaction response.
+
+Initial interaction responses aren't bound by the bot's global rate limit, so they never wait in here.
+Everything else (log embeds, welcome webhooks, CAPTCHA DMs, presence updates) is queued by priority class
+and paced with client-side token buckets per route plus one global bucket, so background traffic can't starve
+user-facing sends. Low-priority sends can be coalesced: e.g. log embeds queued for the same channel go out as one message.
+"""
+import asyncio
+import collections
+import enum
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List
+
+from classes import background
+
+log = logging.getLogger(__name__)
+
+
+class Priority(enum.IntEnum):
+    INTERACTION = 0  # Follow-ups and other work done on behalf of a user waiting on an interaction
+    DM = 1
+    WEBHOOK = 2
+    PRESENCE = 3
+    LOG = 4
+
+
+# (requests, per seconds) by route kind, on the conservative side of Discord's documented/observed limits.
+route_limits = {
+    "webhook": (5, 2),
+    "channel": (5, 5),
+    "dm": (5, 5),
+    "gateway": (5, 20),
+}
+default_route_limit = (5, 5)
+global_limit = (45, 1)  # Discord allows 50/s, keep some headroom
+
+
+@dataclass
+class Bucket:
+    rate: int
+    per: float
+    tokens: float = None
+    updated: float = field(default_factory=time.monotonic)
+
+    def __post_init__(self):
+        if self.tokens is None:
+            self.tokens = self.rate
+
+    def delay(self, now: float) -> float:
+        """Refills the bucket, then returns how long until a token is available (0 if one is available now)."""
+        self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate / self.per)
+        self.updated = now
+        return 0 if self.tokens >= 1 else (1 - self.tokens) * self.per / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+
+@dataclass
+class Job:
+    priority: Priority
+    route: str
+    run: Callable[[], Awaitable[Any]]
+    future: asyncio.Future
+    enqueued_at: float = field(default_factory=time.monotonic)
+    blocked_since: float = None  # When the job was first held back by a rate limit bucket
+    items: List[Any] = None  # Coalesced payloads, None for regular jobs
+
+
+class OutboundScheduler:
+    def __init__(self, concurrency: int = 4):
+        self.queues: Dict[Priority, collections.deque[Job]] = {priority: collections.deque() for priority in Priority}
+        self.buckets: Dict[str, Bucket] = {}
+        self.global_bucket = Bucket(*global_limit)
+        self.batches: Dict[str, Job] = {}  # coalesce key -> job still waiting in the queue
+        self.concurrency = concurrency
+        self.in_flight = 0
+        # Metrics
+        self.sent = collections.Counter()  # by priority name
+        self.coalesced = 0
+        self.queue_seconds = collections.Counter()  # time from enqueue to dispatch, by priority name
+        self.rate_limited_seconds = 0.0  # time jobs spent ready but held back by a bucket
+        self._wakeup: asyncio.Event = None
+        self._dispatcher: asyncio.Task = None
+
+    def bucket(self, route: str) -> Bucket:
+        if route not in self.buckets:
+            self.buckets[route] = Bucket(*route_limits.get(route.split(":")[0], default_route_limit))
+        return self.buckets[route]
+
+    def _enqueue(self, job: Job):
+        self.queues[job.priority].append(job)
+        if self._dispatcher is None or self._dispatcher.done():
+            self._wakeup = asyncio.Event()
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        self._wakeup.set()
+
+    def send(self, priority: Priority, route: str, run: Callable[[], Awaitable[Any]]) -> asyncio.Future:
+        """Queues a send. Await the returned future for its result (or exception).
+
+        Args:
+            priority (Priority): The priority class.
+            route (str): The rate limit route, "<kind>:<id>", e.g. "channel:1234" or "webhook:welcome".
+            run (Callable[[], Awaitable]): Makes the request when called, e.g. `lambda: channel.send(...)`.
+        """
+        job = Job(priority, route, run, asyncio.get_running_loop().create_future())
+        self._enqueue(job)
+        return job.future
+
+    def send_coalesced(
+        self,
+        priority: Priority,
+        route: str,
+        key: str,
+        item: Any,
+        flush: Callable[[List[Any]], Awaitable[Any]],
+        max_batch: int = 10,
+    ):
+        """Queues an item to be sent together with other items queued under the same key, up to max_batch at once.
+
+        Args:
+            key (str): Items with the same key are merged while they wait.
+            item (Any): The payload, e.g. an embed.
+            flush (Callable[[list], Awaitable]): Sends a list of payloads.
+        """
+        if (job := self.batches.get(key)) and len(job.items) < max_batch:
+            job.items.append(item)
+            self.coalesced += 1
+            return
+        job = Job(priority, route, None, asyncio.get_running_loop().create_future(), items=[item])
+        job.run = lambda: flush(job.items)
+        self.batches[key] = job
+        self._enqueue(job)
+
+    async def _dispatch(self):
+        while any(self.queues.values()) or self.in_flight:
+            self._wakeup.clear()
+            now = time.monotonic()
+            next_ready = None
+            for priority in Priority:
+                held_routes = set()  # Keep sends to the same route in order
+                # The last slot is kept for interaction work, so slow background sends can't hold up a waiting user.
+                slots = self.concurrency if priority == Priority.INTERACTION else max(1, self.concurrency - 1)
+                for job in list(self.queues[priority]):
+                    if self.in_flight >= slots:
+                        break
+                    if job.route in held_routes:
+                        continue
+                    wait = max(self.global_bucket.delay(now), self.bucket(job.route).delay(now))
+                    if wait:
+                        held_routes.add(job.route)
+                        job.blocked_since = job.blocked_since or now
+                        next_ready = min(next_ready or wait, wait)
+                        continue
+                    self.global_bucket.take()
+                    self.bucket(job.route).take()
+                    self.queues[priority].remove(job)
+                    self._start(job, now)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), next_ready)
+            except asyncio.TimeoutError:
+                pass
+
+    def _start(self, job: Job, now: float):
+        if job.items is not None:
+            # Nothing else can be merged into it once it's on its way.
+            self.batches = {key: batch for key, batch in self.batches.items() if batch is not job}
+        if job.blocked_since:
+            self.rate_limited_seconds += now - job.blocked_since
+        self.queue_seconds[job.priority.name] += now - job.enqueued_at
+        self.sent[job.priority.name] += 1
+        self.in_flight += 1
+        background(self._run(job))
+
+    async def _run(self, job: Job):
+        try:
+            result = await job.run()
+        except Exception as e:
+            if job.items is not None:  # Nobody awaits coalesced sends. Not logged any louder, or failed log sends would feed themselves.
+                log.debug("Coalesced send to %s failed", job.route, exc_info=True)
+            elif not job.future.done():
+                job.future.set_exception(e)
+        else:
+            if not job.future.done():
+                job.future.set_result(result)
+        finally:
+            self.in_flight -= 1
+            self._wakeup.set()
+
+    def stats(self) -> Dict[str, str]:
+        return {
+            "Queue depth": ", ".join(f"{priority.name}: {len(queue)}" for priority, queue in self.queues.items()),
+            "In flight": str(self.in_flight),
+            "Sent": ", ".join(f"{name}: {count}" for name, count in self.sent.items()) or "None",
+            "Average queue time": ", ".join(
+                f"{name}: {self.queue_seconds[name] / count * 1000:.0f}ms" for name, count in self.sent.items()
+            ) or "None",
+            "Time held by rate limits": f"{self.rate_limited_seconds:.1f}s",
+            "Coalesced sends": str(self.coalesced),
+        }
+
+
+outbound = OutboundScheduler()
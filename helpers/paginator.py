@@ -0,0 +1,97 @@
+"""Paginated browsing of any Resource table, one embed page at a time.
+
+Pages are fetched on demand with keyset pagination on the record ID, and the next page is fetched while the current one is being read.
+Recently viewed pages are kept rendered, so flipping back and forth doesn't hit the database again.
+"""
+import asyncio
+import collections
+import logging
+from typing import Callable, Dict, List, Tuple
+
+import discord
+
+from helpers.db_handling_sdb import R, connection, deser
+from helpers.response_embeds import EmbedStyle
+
+log = logging.getLogger(__name__)
+
+
+class ResourcePages(discord.ui.View):
+    cache_size = 10  # Rendered pages kept per view
+
+    def __init__(
+        self,
+        resource: type[R],
+        describe: Callable[[R], str],
+        user_id: int,
+        title: str = None,
+        page_size: int = 10,
+    ):
+        """
+        Args:
+            resource (type[Resource]): The resource type to list. Its table is named after the class.
+            describe (Callable[[Resource], str]): Renders one record as a line of the page.
+            user_id (int): The only user who can flip the pages.
+            title (str, optional): The embed title. Defaults to the resource name.
+            page_size (int, optional): Records per page. Defaults to 10.
+        """
+        super().__init__(timeout=300)
+        self.table = resource.__name__
+        self.describe = describe
+        self.user_id = user_id
+        self.title = title or self.table
+        self.page_size = page_size
+        self.page = 0
+        self.cursors: List[str] = [None]  # cursors[i] is the ID page i starts after
+        self.cache: collections.OrderedDict[int, Tuple[discord.Embed, bool]] = collections.OrderedDict()  # page -> (embed, has next page)
+        self.prefetching: Dict[int, asyncio.Task] = {}
+
+    async def fetch(self, index: int) -> Tuple[discord.Embed, bool]:
+        rows = await connection.fetch_page(self.table, self.cursors[index], self.page_size + 1)  # One extra tells if there's a next page
+        more = len(rows) > self.page_size
+        rows = rows[: self.page_size]
+        if more and len(self.cursors) == index + 1:
+            self.cursors.append(rows[-1]["id"])
+        embed = EmbedStyle.Info.value.embed(
+            title=self.title,
+            description="\n".join(self.describe(record) for record in deser(list, rows)) or "Nothing here.",
+        ).set_footer(text=f"Page {index + 1}")
+        return embed, more
+
+    async def get(self, index: int) -> Tuple[discord.Embed, bool]:
+        if index in self.cache:
+            self.cache.move_to_end(index)
+            return self.cache[index]
+        if task := self.prefetching.pop(index, None):
+            page = await task
+        else:
+            page = await self.fetch(index)
+        self.cache[index] = page
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return page
+
+    async def show(self, index: int) -> discord.Embed:
+        """Switches to a page and returns its embed, then starts fetching the page after it."""
+        embed, more = await self.get(index)
+        self.page = index
+        self.previous.disabled = index == 0
+        self.next.disabled = not more
+        if more and index + 1 not in self.cache and index + 1 not in self.prefetching:
+            self.prefetching[index + 1] = asyncio.create_task(self.fetch(index + 1))
+        return embed
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        return interaction.user.id == self.user_id
+
+    async def on_timeout(self):
+        for task in self.prefetching.values():
+            task.cancel()
+
+    @discord.ui.button(emoji="◀️", style=discord.ButtonStyle.secondary)
+    async def previous(self, button: discord.ui.Button, interaction: discord.Interaction):
+        await interaction.response.edit_message(embed=await self.show(self.page - 1), view=self)
+
+    @discord.ui.button(emoji="▶️", style=discord.ButtonStyle.secondary)
+    async def next(self, button: discord.ui.Button, interaction: discord.Interaction):
+        await interaction.response.edit_message(embed=await self.show(self.page + 1), view=self)
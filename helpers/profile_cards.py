@@ -0,0 +1,132 @@
+"""Profile cards: a player's profile rendered as an image.
+
+Rendering happens on worker threads (PIL does most of its work without holding the GIL), and cards are cached in memory and on disk
+under a key made from exactly what the card shows (the profile's fields, the owner's name and avatar), so a card is only ever rendered once per change.
+"""
+import asyncio
+import collections
+import concurrent.futures
+import hashlib
+import io
+import json
+import logging
+import os
+from typing import Dict
+
+import discord
+
+log = logging.getLogger(__name__)
+
+cache_dir = os.path.join("cache", "profile_cards")
+memory_size = 64  # Cards kept in memory
+disk_size = 1000  # Cards kept on disk
+card_version = 1  # Bump when the layout changes, so old cached cards aren't served
+size = (640, 200)
+avatar_size = 144
+
+pool = concurrent.futures.ThreadPoolExecutor(max_workers=2, thread_name_prefix="profile-card")
+
+
+def render(avatar: bytes, title: str, lines: Dict[str, str]) -> bytes:
+    """Draws a card. Blocks, so run it on the pool.
+
+    Args:
+        avatar (bytes): The avatar image, in any format PIL reads.
+        title (str): The big text at the top, e.g. the member's display name.
+        lines (dict[str, str]): Label -> value rows under the title. Empty values are left out.
+
+    Returns:
+        bytes: The card as a PNG.
+    """
+    from PIL import Image, ImageDraw, ImageFont
+
+    card = Image.new("RGB", size, (32, 34, 37))
+    draw = ImageDraw.Draw(card)
+    draw.rectangle((0, 0, 8, size[1]), fill=(104, 214, 56))  # Splatfest green accent
+    picture = Image.open(io.BytesIO(avatar)).convert("RGB").resize((avatar_size, avatar_size))
+    mask = Image.new("L", (avatar_size, avatar_size), 0)
+    ImageDraw.Draw(mask).ellipse((0, 0, avatar_size, avatar_size), fill=255)
+    top = (size[1] - avatar_size) // 2
+    card.paste(picture, (24 + 4, top), mask)
+    x = 24 + avatar_size + 32
+    draw.text((x, top), title, font=ImageFont.load_default(34), fill=(255, 255, 255))
+    y = top + 52
+    font = ImageFont.load_default(20)
+    for label, value in lines.items():
+        if value:
+            draw.text((x, y), f"{label}: {value}", font=font, fill=(200, 204, 208))
+            y += 28
+    out = io.BytesIO()
+    card.save(out, "PNG", optimize=True)
+    return out.getvalue()
+
+
+class CardCache:
+    def __init__(self):
+        self.memory: collections.OrderedDict[str, bytes] = collections.OrderedDict()
+        self.hits = collections.Counter()  # "memory", "disk", "rendered"
+
+    def path(self, key: str) -> str:
+        return os.path.join(cache_dir, f"{key}.png")
+
+    def remember(self, key: str, card: bytes):
+        self.memory[key] = card
+        self.memory.move_to_end(key)
+        while len(self.memory) > memory_size:
+            self.memory.popitem(last=False)
+
+    def read_disk(self, key: str) -> bytes | None:
+        try:
+            with open(self.path(key), "rb") as file:
+                card = file.read()
+            os.utime(self.path(key))  # Keeps the disk cache's eviction least recently used
+        except FileNotFoundError:
+            return None
+        return card
+
+    def write_disk(self, key: str, card: bytes):
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(self.path(key) + ".tmp", "wb") as file:
+            file.write(card)
+        os.replace(self.path(key) + ".tmp", self.path(key))
+        if len(files := os.listdir(cache_dir)) > disk_size:
+            files.sort(key=lambda name: os.path.getmtime(os.path.join(cache_dir, name)))
+            for name in files[: len(files) - disk_size]:
+                os.remove(os.path.join(cache_dir, name))
+
+    async def card(self, profile, member: discord.Member) -> bytes:
+        """A profile's card, rendered only if it isn't cached yet.
+
+        Args:
+            profile (PlayerProfile): The profile.
+            member (Member): The profile's owner, for their name and avatar.
+        """
+        avatar = member.display_avatar.with_size(256)
+        lines = {"In-game name": profile.ign, "Friend code": profile.friend_code, "XLink Kai": profile.xtag}
+        # Not keyed on updated_at: it changes without anything on the card changing, e.g. whenever a record is loaded.
+        key = hashlib.sha1(json.dumps([card_version, avatar.key, member.display_name, lines]).encode()).hexdigest()
+        if card := self.memory.get(key):
+            self.memory.move_to_end(key)
+            self.hits["memory"] += 1
+            return card
+        loop = asyncio.get_running_loop()
+        if card := await loop.run_in_executor(pool, self.read_disk, key):
+            self.hits["disk"] += 1
+        else:
+            card = await loop.run_in_executor(
+                pool,
+                render,
+                await avatar.read(),
+                member.display_name,
+                lines,
+            )
+            self.hits["rendered"] += 1
+            try:
+                await loop.run_in_executor(pool, self.write_disk, key, card)
+            except OSError:
+                log.warning("Couldn't write profile card to the disk cache", exc_info=True)
+        self.remember(key, card)
+        return card
+
+
+cards = CardCache()
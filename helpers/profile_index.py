@@ -0,0 +1,122 @@
+"""In-memory reverse lookup from in-game names, XLink Kai XTags and friend codes back to profile owners.
+
+Friend codes are matched exactly after stripping everything but digits. Names are matched by prefix first, then fuzzily by shared trigrams,
+so a misspelt or partial name from a lobby still finds its owner.
+"""
+import bisect
+import collections
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Set, Tuple
+
+name_fields = {"ign": "In-game name", "xtag": "XLink Kai username"}
+min_similarity = 0.3  # Trigram matches less similar than this are dropped
+
+
+def normalize_friend_code(value: str) -> str | None:
+    """'SW-1234-5678-9012' -> '123456789012', or None if it isn't a friend code."""
+    digits = re.sub(r"\D", "", value or "")
+    return digits if len(digits) == 12 else None
+
+
+def normalize_name(value: str) -> str:
+    return re.sub(r"\s+", " ", (value or "").casefold()).strip()
+
+
+def trigrams(name: str) -> Set[str]:
+    padded = f"  {name} "  # Padding gives short names and word starts some trigrams of their own
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+@dataclass
+class Match:
+    owner_id: int
+    field: str  # "friend_code", "ign" or "xtag"
+    value: str  # As the owner wrote it
+    score: float  # 1 for exact matches, less for prefix and fuzzy ones
+
+
+class ProfileIndex:
+    def __init__(self):
+        self.friend_codes: Dict[str, int] = {}
+        self.names: List[Tuple[str, int, str]] = []  # Sorted (normalized name, owner ID, field), for prefix search
+        self.grams: Dict[str, Set[Tuple[int, str]]] = collections.defaultdict(set)  # trigram -> (owner ID, field)
+        self.entries: Dict[int, Dict[str, str]] = {}  # owner ID -> field -> original value, to undo on update
+
+    def __len__(self):
+        return len(self.entries)
+
+    def clear(self):
+        self.friend_codes.clear()
+        self.names.clear()
+        self.grams.clear()
+        self.entries.clear()
+
+    def add(self, profile):
+        """Indexes a profile, replacing whatever was indexed for its owner before.
+
+        Args:
+            profile (PlayerProfile): The profile. Only `owner_id`, `friend_code`, `ign` and `xtag` are read.
+        """
+        self.remove(profile.owner_id)
+        entry = {}
+        if code := normalize_friend_code(profile.friend_code):
+            self.friend_codes[code] = profile.owner_id
+            entry["friend_code"] = profile.friend_code
+        for field in name_fields:
+            if not (name := normalize_name(getattr(profile, field))):
+                continue
+            bisect.insort(self.names, (name, profile.owner_id, field))
+            for gram in trigrams(name):
+                self.grams[gram].add((profile.owner_id, field))
+            entry[field] = getattr(profile, field)
+        if entry:
+            self.entries[profile.owner_id] = entry
+
+    def remove(self, owner_id: int):
+        if not (entry := self.entries.pop(owner_id, None)):
+            return
+        if (code := normalize_friend_code(entry.get("friend_code"))) and self.friend_codes.get(code) == owner_id:
+            del self.friend_codes[code]
+        for field in name_fields:
+            if field not in entry:
+                continue
+            name = normalize_name(entry[field])
+            if (i := bisect.bisect_left(self.names, (name, owner_id, field))) < len(self.names) and self.names[i] == (name, owner_id, field):
+                del self.names[i]
+            for gram in trigrams(name):
+                self.grams[gram].discard((owner_id, field))
+                if not self.grams[gram]:
+                    del self.grams[gram]
+
+    def search(self, query: str, limit: int = 10) -> List[Match]:
+        """Finds profiles by friend code, or by in-game name/XTag prefix or similarity. Best matches first, one per owner."""
+        if code := normalize_friend_code(query):
+            owner_id = self.friend_codes.get(code)
+            return [Match(owner_id, "friend_code", self.entries[owner_id]["friend_code"], 1)] if owner_id else []
+        if not (name := normalize_name(query)):
+            return []
+        scores: Dict[Tuple[int, str], float] = {}
+        i = bisect.bisect_left(self.names, (name,))
+        while i < len(self.names) and self.names[i][0].startswith(name) and len(scores) < limit:
+            indexed, owner_id, field = self.names[i]
+            scores[(owner_id, field)] = 1 if indexed == name else 0.99  # Prefix matches rank above any fuzzy one
+            i += 1
+        query_grams = trigrams(name)
+        shared = collections.Counter(key for gram in query_grams for key in self.grams.get(gram, ()))
+        for (owner_id, field), count in shared.items():
+            if (owner_id, field) in scores:
+                continue
+            value_grams = len(trigrams(normalize_name(self.entries[owner_id][field])))
+            similarity = count / (len(query_grams) + value_grams - count)  # Jaccard
+            if similarity >= min_similarity:
+                scores[(owner_id, field)] = similarity
+        matches, seen = [], set()
+        for (owner_id, field), score in sorted(scores.items(), key=lambda item: item[1], reverse=True):
+            if owner_id not in seen:
+                seen.add(owner_id)
+                matches.append(Match(owner_id, field, self.entries[owner_id][field], score))
+        return matches[:limit]
+
+
+profile_index = ProfileIndex()
@@ -0,0 +1,96 @@
+"""Low-overhead sampling profiler for the event loop thread.
+
+A helper thread grabs the loop thread's stack every few milliseconds, so the loop itself does no extra work (the sampler only takes the GIL briefly).
+Each sample is also attributed to the asyncio task that was running at the time, which shows which coroutines held the loop the longest.
+"""
+import asyncio
+import collections
+import io
+import os
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Counter, List, Tuple
+
+IDLE = "<idle>"  # The loop was waiting in select(), i.e. not busy
+
+
+def frame_label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+@dataclass
+class ProfileResult:
+    seconds: float
+    interval: float
+    samples: int = 0
+    stacks: Counter[Tuple[str, ...]] = field(default_factory=collections.Counter)  # root-first stacks
+    tasks: Counter[str] = field(default_factory=collections.Counter)  # samples per running task
+
+    def collapsed(self) -> str:
+        """Stacks in collapsed format ("root;child;leaf count"), ready for flamegraph.pl or speedscope."""
+        return "\n".join(f"{';'.join(stack)} {count}" for stack, count in self.stacks.most_common())
+
+    def hot_functions(self, count: int = 25) -> List[Tuple[str, int, int]]:
+        """The functions with the most samples as (function, self samples, total samples)."""
+        own = collections.Counter()
+        total = collections.Counter()
+        for stack, samples in self.stacks.items():
+            own[stack[-1]] += samples
+            for frame in set(stack):
+                total[frame] += samples
+        return [(frame, samples, total[frame]) for frame, samples in own.most_common(count) if frame != IDLE]
+
+    def report(self, count: int = 25) -> str:
+        idle = sum(samples for stack, samples in self.stacks.items() if stack[-1] == IDLE)
+        busy = max(self.samples - idle, 1)
+        per_sample = self.seconds / max(self.samples, 1)  # Real sampling period, sleep() overshoots the interval
+        ms = lambda samples: f"{samples * per_sample * 1000:.0f}ms"
+        out = io.StringIO()
+        out.write(f"{self.samples} samples over {self.seconds}s ({per_sample * 1000:.1f}ms apart), loop busy {(self.samples - idle) / max(self.samples, 1):.1%}\n\n")
+        out.write(f"Top {count} functions by self time\n")
+        out.write(f"{'self':>8} {'self %':>7} {'total':>8}  function\n")
+        for frame, own, total in self.hot_functions(count):
+            out.write(f"{ms(own):>8} {own / busy:>7.1%} {ms(total):>8}  {frame}\n")
+        out.write("\nTasks holding the loop\n")
+        out.write(f"{'time':>8} {'busy %':>7}  task\n")
+        for task, samples in self.tasks.most_common(count):
+            out.write(f"{ms(samples):>8} {samples / busy:>7.1%}  {task}\n")
+        return out.getvalue()
+
+
+def task_label(task: asyncio.Task) -> str:
+    coro = task.get_coro()
+    return f"{getattr(coro, '__qualname__', repr(coro))} [{task.get_name()}]"
+
+
+def sample(thread_id: int, loop: asyncio.AbstractEventLoop, seconds: float, interval: float) -> ProfileResult:
+    """Samples the given thread's stack. Blocks for `seconds`, so run it on another thread."""
+    result = ProfileResult(seconds, interval)
+    stop = time.monotonic() + seconds
+    while time.monotonic() < stop:
+        frame = sys._current_frames().get(thread_id)
+        task = asyncio.current_task(loop)  # Just a dict lookup, fine to do from another thread
+        stack = []
+        while frame is not None:
+            stack.append(frame_label(frame.f_code))
+            frame = frame.f_back
+        stack.reverse()
+        if stack:
+            if stack[-1].startswith(("select (selectors.py", "poll (selectors.py")):
+                stack.append(IDLE)
+            elif task is not None:
+                result.tasks[task_label(task)] += 1
+            else:
+                result.tasks["<callbacks outside of tasks>"] += 1
+            result.stacks[tuple(stack)] += 1
+            result.samples += 1
+        time.sleep(interval)
+    return result
+
+
+async def profile_loop(seconds: float, interval: float = 0.005) -> ProfileResult:
+    """Profiles the running event loop for the given number of seconds."""
+    loop = asyncio.get_running_loop()
+    return await asyncio.to_thread(sample, threading.get_ident(), loop, seconds, interval)
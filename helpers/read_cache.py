@@ -0,0 +1,191 @@
+"""A local SQLite copy of the records the bot reads, so it keeps working while SurrealDB is down (see `DatabaseConnection`).
+
+Every record a query returns is snapshotted here, as are the results of SELECT queries. While a database is unreachable, those queries
+are answered from here as `StaleResults`, which are plain lists that know how old they are. Writes are queued here in order, and
+replayed once the database is back. At startup, in-memory indexes can be filled from here before the database has even answered.
+
+sqlite3 blocks, so everything runs on a single worker thread, which also keeps writes in order. Snapshots don't wait for the disk.
+"""
+import asyncio
+import concurrent.futures
+import datetime
+import json
+import logging
+import os
+import sqlite3
+import time
+from typing import Any, Callable, List, Tuple
+
+log = logging.getLogger(__name__)
+
+path = os.path.join("cache", "records.sqlite3")
+max_age = datetime.timedelta(days=30)  # Snapshots that weren't refreshed for this long are pruned when the cache is opened
+max_queries = 10_000  # Cached SELECT results kept, the least recently refreshed are pruned first
+
+schema = """
+CREATE TABLE IF NOT EXISTS records (database TEXT, id TEXT, data TEXT, saved_at REAL, PRIMARY KEY (database, id));
+CREATE TABLE IF NOT EXISTS queries (database TEXT, key TEXT, results TEXT, saved_at REAL, PRIMARY KEY (database, key));
+CREATE TABLE IF NOT EXISTS writes (seq INTEGER PRIMARY KEY AUTOINCREMENT, database TEXT, op TEXT, id TEXT, data TEXT);
+"""
+
+
+class StaleResults(list):
+    """Query results served from the local cache because the database was unreachable."""
+
+    def __init__(self, results: list, as_of: datetime.datetime):
+        super().__init__(results)
+        self.as_of = as_of  # When they were last read from the database
+
+
+def is_record(value: Any) -> bool:
+    return isinstance(value, dict) and isinstance(value.get("id"), str)
+
+
+def dump(value: Any) -> str:
+    return json.dumps(value, default=str)
+
+
+class RecordCache:
+    def __init__(self, path: str = path):
+        self.path = path
+        self.executor = concurrent.futures.ThreadPoolExecutor(1, thread_name_prefix="record-cache")
+        self.db: sqlite3.Connection = None  # Only used from the worker thread
+
+    def open(self) -> sqlite3.Connection:
+        if not self.db:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self.db = sqlite3.connect(self.path)
+            self.db.executescript("PRAGMA journal_mode = WAL; PRAGMA synchronous = NORMAL;" + schema)
+            self.prune()
+        return self.db
+
+    async def run(self, func: Callable, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    def later(self, func: Callable, *args):
+        """Runs func on the worker without waiting for it. Failures are logged, a missed snapshot only makes the cache staler."""
+
+        def run():
+            try:
+                func(*args)
+            except Exception:
+                log.exception("Record cache %s failed", func.__name__)
+
+        self.executor.submit(run)
+
+    def prune(self):
+        cutoff = time.time() - max_age.total_seconds()
+        with self.db:
+            self.db.execute("DELETE FROM records WHERE saved_at < ?", (cutoff,))
+            self.db.execute("DELETE FROM queries WHERE saved_at < ?", (cutoff,))
+            self.db.execute("DELETE FROM queries WHERE rowid NOT IN (SELECT rowid FROM queries ORDER BY saved_at DESC LIMIT ?)", (max_queries,))
+
+    def save(self, database: str, results: list, key: str = None):
+        db, now = self.open(), time.time()
+        with db:
+            db.executemany(
+                "INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?)",
+                [(database, record["id"], dump(record), now) for record in results if is_record(record)],
+            )
+            if key is not None:
+                db.execute("INSERT OR REPLACE INTO queries VALUES (?, ?, ?, ?)", (database, key, dump(results), now))
+
+    def snapshot(self, database: str, results: list, key: str = None):
+        """Saves the records among a query's results, and the results themselves under `key` if given."""
+        self.later(self.save, database, results, key)
+
+    def _recall(self, database: str, key: str) -> StaleResults | None:
+        db = self.open()
+        if not (row := db.execute("SELECT results, saved_at FROM queries WHERE database = ? AND key = ?", (database, key)).fetchone()):
+            return None
+        results = json.loads(row[0])
+        ids = [result["id"] for result in results if is_record(result)]
+        current = {}
+        for i in range(0, len(ids), 500):  # Keeps under SQLite's variable limit
+            chunk = ids[i : i + 500]
+            current |= db.execute(
+                f"SELECT id, data FROM records WHERE database = ? AND id IN ({', '.join('?' * len(chunk))})", (database, *chunk)
+            ).fetchall()
+        latest = []  # Records as of their latest read or queued write, without the ones deleted since
+        for result in results:
+            if not is_record(result):
+                latest.append(result)
+            elif result["id"] in current:
+                latest.append(json.loads(current[result["id"]]))
+        return StaleResults(latest, datetime.datetime.fromtimestamp(row[1]))
+
+    async def recall(self, database: str, key: str) -> StaleResults | None:
+        """The cached results of a query, or None if it was never run."""
+        return await self.run(self._recall, database, key)
+
+    def _record(self, database: str, record_id: str) -> dict | None:
+        row = self.open().execute("SELECT data FROM records WHERE database = ? AND id = ?", (database, record_id)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    async def record(self, database: str, record_id: str) -> dict | None:
+        return await self.run(self._record, database, record_id)
+
+    def _table(self, database: str, table: str) -> List[dict]:
+        rows = self.open().execute(
+            "SELECT data FROM records WHERE database = ? AND id >= ? AND id < ? ORDER BY id", (database, f"{table}:", f"{table};")
+        )
+        return [json.loads(data) for data, in rows]
+
+    async def table(self, database: str, table: str) -> List[dict]:
+        """Every cached record of a table, in ID order."""
+        return await self.run(self._table, database, table)
+
+    def _apply(self, database: str, op: str, record_id: str, data: dict):
+        """Applies a write to the cached record. `op` is "merge", "replace" or "delete"."""
+        if op == "delete":
+            self.db.execute("DELETE FROM records WHERE database = ? AND id = ?", (database, record_id))
+            return
+        record = (self._record(database, record_id) or {}) if op == "merge" else {}
+        record |= data | {"id": record_id}
+        self.db.execute("INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?)", (database, record_id, dump(record), time.time()))
+
+    def apply(self, database: str, op: str, record_id: str, data: dict = None):
+        """Keeps the cached record in line with a write that went through."""
+
+        def apply():
+            with self.open():
+                self._apply(database, op, record_id, data or {})
+
+        self.later(apply)
+
+    def _queue(self, database: str, op: str, record_id: str, data: dict):
+        with self.open():
+            self.db.execute("INSERT INTO writes (database, op, id, data) VALUES (?, ?, ?, ?)", (database, op, record_id, dump(data)))
+            self._apply(database, op, record_id, data)
+
+    async def queue(self, database: str, op: str, record_id: str, data: dict = None):
+        """Queues a write to replay once the database is back, and applies it to the cached record so reads see it meanwhile."""
+        await self.run(self._queue, database, op, record_id, data or {})
+
+    def _pending(self, database: str, limit: int) -> List[Tuple[int, str, str, dict]]:
+        rows = self.open().execute("SELECT seq, op, id, data FROM writes WHERE database = ? ORDER BY seq LIMIT ?", (database, limit))
+        return [(seq, op, record_id, json.loads(data)) for seq, op, record_id, data in rows]
+
+    async def pending(self, database: str, limit: int = 100) -> List[Tuple[int, str, str, dict]]:
+        """The oldest queued writes for a database, as (sequence number, op, record ID, data)."""
+        return await self.run(self._pending, database, limit)
+
+    def _done(self, seq: int):
+        with self.open():
+            self.db.execute("DELETE FROM writes WHERE seq = ?", (seq,))
+
+    async def done(self, seq: int):
+        """Drops a queued write once it has been replayed."""
+        await self.run(self._done, seq)
+
+    def _close(self):
+        if self.db:
+            self.db.close()
+            self.db = None
+
+    async def close(self):
+        await self.run(self._close)
+        self.executor.shutdown()
+
+
+read_cache = RecordCache()
@@ -0,0 +1,515 @@
+"""Drives the real cogs with a fake gateway and a mocked REST layer, so they can be load tested without a live guild.
+
+Events are fed straight into py-cord's gateway parsers, so they take the same path as real ones (including `Kolkra`'s guild scoping).
+Every REST call, whether through the bot's HTTP client or the webhook adapter that interaction responses use, is answered by `FakeRest`
+after a simulated latency instead of reaching Discord.
+Event streams are either scripted (see `scenarios`) or recorded from the live bot with `Recorder`, as JSON lines of {"at", "event", "data"}.
+Run it with loadtest.py.
+"""
+import asyncio
+import collections
+import gzip
+import itertools
+import json
+import logging
+import random
+import re
+import time
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Callable, Dict, List, Tuple
+
+import discord
+from discord.webhook.async_ import AsyncWebhookAdapter
+
+from classes import ANY, ObservableState, guild_configs
+from helpers.cog_loader import load_cogs
+from helpers.metrics import Histogram
+from helpers.watchdog import LoopWatchdog
+
+log = logging.getLogger(__name__)
+
+Event = Tuple[str, dict, str]  # (gateway event name, payload, label to report it under)
+response_deadline = 3  # Seconds Discord waits for the first response to an interaction before showing it as failed
+
+ids = itertools.count(discord.utils.time_snowflake(discord.utils.utcnow()))  # Fake snowflakes, in creation order
+timestamp = lambda: discord.utils.utcnow().isoformat()
+
+
+def body(kwargs: dict) -> dict:
+    """The JSON payload of a REST call, whether it was sent as JSON or as multipart form data."""
+    if (payload := kwargs.get("json", kwargs.get("payload"))) is not None:
+        return payload
+    for part in kwargs.get("form") or kwargs.get("multipart") or ():
+        if part.get("name") == "payload_json":
+            return json.loads(part["value"])
+    return {}
+
+
+class FakeRest:
+    """Answers REST calls with plausible payloads, and keeps what was sent so scripted scenarios can click on it."""
+
+    def __init__(self, latency: float = 0.05, jitter: float = 0.5):
+        self.latency = latency
+        self.jitter = jitter  # Latency varies by up to this fraction either way
+        self.calls: collections.Counter[str] = collections.Counter()  # "METHOD /route/{template}" -> count
+        self.sent: Dict[int, dict] = {}  # message ID -> message payload as last sent or edited
+        self.messages = ObservableState()  # The same, but only once the simulated round trip is over, as users would see them
+        self.responses = ObservableState()  # interaction token -> perf_counter time its first response was sent
+        self.delivered = ObservableState()  # interaction token -> True once its first response made the round trip
+        self.publishing: List[Tuple[ObservableState, Any, Any]] = []  # Updates to the above to make when the current call returns
+        self.originals: Dict[str, int] = {}  # interaction token -> ID of the message it responded with
+        self.targets: Dict[str, int] = {}  # component interaction token -> ID of the message the component is on
+        self.channels: Dict[str, int] = {}  # interaction token -> channel ID
+        self.dm_channels: Dict[int, int] = {}  # user ID -> DM channel ID
+        self.roles: Dict[str, set[str]] = collections.defaultdict(set)  # user ID -> IDs of the roles the bot gave them
+        self.bot_user: dict = None
+        self.last_call = 0.0
+
+    def install(self, bot: discord.Bot):
+        rest = self
+
+        async def bot_request(route, **kwargs):
+            return await rest.handle(route, body(kwargs))
+
+        async def webhook_request(adapter, route, session, **kwargs):
+            return await rest.handle(route, body(kwargs))
+
+        bot.http.request = bot_request
+        AsyncWebhookAdapter.request = webhook_request
+
+    def message(self, message_id: int, channel_id: int, payload: dict) -> dict:
+        return {
+            "id": str(message_id),
+            "channel_id": str(channel_id),
+            "type": 0,
+            "author": self.bot_user,
+            "content": payload.get("content") or "",
+            "embeds": payload.get("embeds") or [],
+            "components": payload.get("components") or [],
+            "attachments": [],
+            "mentions": [],
+            "mention_roles": [],
+            "mention_everyone": False,
+            "pinned": False,
+            "tts": False,
+            "flags": payload.get("flags") or 0,
+            "timestamp": timestamp(),
+            "edited_timestamp": None,
+        }
+
+    def send(self, message_id: int, channel_id: int, payload: dict) -> dict:
+        message = self.sent[message_id] = self.message(message_id, channel_id, payload)
+        self.publishing.append((self.messages, message_id, message))
+        return message
+
+    def edit(self, message_id: int, payload: dict) -> dict:
+        old = self.sent.get(message_id) or self.message(message_id, 0, {})
+        return self.send(message_id, int(old["channel_id"]), {key: value for key, value in old.items() if key in ("content", "embeds", "components", "flags")} | payload)
+
+    def responded(self, token: str):
+        if self.responses.get(token) is None:
+            self.responses.set(token, time.perf_counter())
+            self.publishing.append((self.delivered, token, True))
+
+    async def handle(self, route: discord.http.Route, payload: dict) -> Any:
+        self.calls[f"{route.method} {route.path}"] += 1
+        self.last_call = time.perf_counter()
+        self.publishing = []
+        result = self.answer(route, payload)  # Before the wait, since the request counts as sent even if the caller gets cancelled
+        publishing = self.publishing
+        if self.latency:
+            await asyncio.sleep(self.latency * random.uniform(1 - self.jitter, 1 + self.jitter))
+        for state, key, value in publishing:
+            state.set(key, value)
+        return result
+
+    def answer(self, route: discord.http.Route, payload: dict) -> Any:
+        if match := re.search(r"/interactions/(\d+)/([^/]+)/callback", route.url):
+            interaction_id, token = match[1], match[2]
+            self.responded(token)
+            resource = {"type": payload.get("type")}
+            if payload.get("type") == 4:  # Message response
+                self.originals[token] = message_id = next(ids)
+                resource["message"] = self.send(message_id, self.channels.get(token, 0), payload.get("data") or {})
+            elif payload.get("type") == 7 and token in self.targets:  # Edit of the component's message
+                resource["message"] = self.edit(self.targets[token], payload.get("data") or {})
+            return {"interaction": {"id": interaction_id, "type": 2}, "resource": resource}
+        if route.webhook_token:  # Interaction follow-ups and edits, or a plain webhook
+            self.responded(route.webhook_token)
+            if match := re.search(r"/messages/(@original|\d+)", route.url):
+                target = match[1]
+                message_id = self.originals.setdefault(route.webhook_token, next(ids)) if target == "@original" else int(target)
+                return self.edit(message_id, payload) if route.method != "DELETE" else None
+            return self.send(next(ids), self.channels.get(route.webhook_token, 0), payload)
+        if route.path == "/channels/{channel_id}/messages" and route.method == "POST":
+            return self.send(next(ids), route.channel_id, payload)
+        if route.path == "/channels/{channel_id}/messages/{message_id}" and route.method == "PATCH":
+            return self.edit(int(route.url.rsplit("/", 1)[1]), payload)
+        if route.path == "/guilds/{guild_id}/members/{user_id}/roles/{role_id}":
+            *_, user_id, _, role_id = route.url.split("/")
+            if route.method == "PUT":
+                self.roles[user_id].add(role_id)
+            else:
+                self.roles[user_id].discard(role_id)
+            return None
+        if route.path == "/users/@me/channels":
+            recipient = int(payload["recipient_id"])
+            channel_id = self.dm_channels.setdefault(recipient, next(ids))
+            return {"id": str(channel_id), "type": 1, "recipients": [{"id": str(recipient), "username": f"user{recipient}", "discriminator": "0", "avatar": None}]}
+        return None
+
+    def find(self, predicate: Callable[[dict], bool]) -> dict | None:
+        """The newest message users can see matching a predicate."""
+        return next((message for message in reversed(self.messages.values.values()) if predicate(message)), None)
+
+
+def command_path(data: dict) -> str:
+    """The full name of the (sub)command an interaction's data is for, e.g. "fun tickoat2"."""
+    path = [data.get("name")]
+    options = data.get("options") or []
+    while options and options[0].get("type") in (1, 2):  # Subcommand (group)
+        path.append(options[0]["name"])
+        options = options[0].get("options") or []
+    return " ".join(map(str, path))
+
+
+def buttons(message: dict) -> List[dict]:
+    return [component for row in message.get("components", []) for component in row.get("components", []) if component.get("type") == 2]
+
+
+@dataclass
+class Report:
+    events: int
+    seconds: float  # Time spent dispatching
+    drained: float  # Time until the bot went quiet after the last event
+    rest: collections.Counter
+    latency: Dict[str, Histogram]  # label -> time from dispatch to first response, for interactions
+    unanswered: Dict[str, int]  # label -> interactions that got no response, or got it too late for Discord
+    lag: Histogram
+    worst_lag: float
+    stalls: list = field(default_factory=list)
+
+    def __str__(self) -> str:
+        ms = lambda seconds: f"{seconds * 1000:.0f}ms"
+        lines = [
+            f"{self.events} events in {self.seconds:.2f}s ({self.events / max(self.seconds, 1e-9):.0f}/s), drained after {self.drained:.2f}s "
+            f"({self.events / max(self.drained, 1e-9):.0f}/s end to end)",
+            f"Event loop lag: p50 {ms(self.lag.quantile(0.5))}, p99 {ms(self.lag.quantile(0.99))}, worst {ms(self.worst_lag)}",
+        ]
+        for stall in self.stalls:
+            lines.append(f"  stalled {stall.count}x ({ms(stall.total)} total) at {stall.site} in {stall.handler}")
+        if self.latency:
+            lines.append("First response latency:")
+        for label, histogram in sorted(self.latency.items()):
+            lines.append(
+                f"  {label}: {histogram.count} answered, {self.unanswered.get(label, 0)} unanswered, "
+                f"p50 {ms(histogram.quantile(0.5))}, p90 {ms(histogram.quantile(0.9))}, p99 {ms(histogram.quantile(0.99))}"
+            )
+        lines.append(f"REST calls: {sum(self.rest.values())} ({sum(self.rest.values()) / max(self.events, 1):.2f} per event)")
+        for route, count in self.rest.most_common():
+            lines.append(f"  {count:>6} {route}")
+        return "\n".join(lines)
+
+
+class Harness:
+    """A bot with a fake gateway. Build events with the helpers below and replay them, then read the report."""
+
+    def __init__(self, bot: discord.Bot, rest_latency: float = 0.05):
+        self.bot = bot
+        self.rest = FakeRest(rest_latency)
+        self.guild_id = guild_configs.home
+        self.bot_user = {"id": str(next(ids)), "username": "Kolkra", "discriminator": "0", "avatar": None, "bot": True}
+        self.command_ids: Dict[str, str] = {}  # top-level command name -> fake ID
+        self.dispatched: Dict[str, Tuple[str, float]] = {}  # interaction token -> (label, perf_counter time of dispatch)
+        self.events = 0
+
+    async def start(self, cogs: List[str]):
+        """Loads the cogs, then fakes what the gateway would have sent on connect: the bot user, the synced commands and the guilds."""
+        self.rest.bot_user = self.bot_user
+        self.rest.install(self.bot)
+        state = self.bot._connection
+        state.user = discord.ClientUser(state=state, data=self.bot_user)
+        state.application_id = int(self.bot_user["id"])
+        for name, result in (await load_cogs(self.bot, cogs)).items():
+            if result.error:
+                log.error("Cog %s failed to load: %s", name, result.error)
+        for command in self.bot.pending_application_commands:
+            command.id = self.command_ids.setdefault(command.name, str(next(ids)))
+            self.bot._application_commands[command.id] = command
+        for guild_id in guild_configs.ids:
+            self.dispatch("GUILD_CREATE", self.guild(guild_id))
+
+    def guild(self, guild_id: int) -> dict:
+        settings = guild_configs[guild_id]
+        roles = {guild_id, settings["admin_role"], settings["mod_role"], settings["captcha"]["unverified_role"]}
+        channels = {settings["log_channel"], settings["announcements_channel"], settings["captcha"]["verification_channel"]}
+        return {
+            "id": str(guild_id),
+            "name": f"Guild {guild_id}",
+            "owner_id": self.bot_user["id"],
+            "member_count": 1,
+            "roles": [{"id": str(role_id), "name": str(role_id), "permissions": "0", "position": 0, "color": 0, "colors": {"primary_color": 0}, "hoist": False, "managed": False, "mentionable": False} for role_id in roles],
+            "channels": [{"id": str(channel_id), "type": 0, "name": str(channel_id), "position": 0, "permission_overwrites": []} for channel_id in channels],
+            "members": [self.member(self.bot_user)],
+            "emojis": [],
+            "stickers": [],
+            "features": [],
+        }
+
+    def user(self) -> dict:
+        user_id = next(ids)
+        return {"id": str(user_id), "username": f"player{user_id % 100000}", "global_name": None, "discriminator": "0", "avatar": None}
+
+    def member(self, user: dict) -> dict:
+        return {"user": user, "roles": sorted(self.rest.roles[user["id"]]), "joined_at": timestamp(), "deaf": False, "mute": False, "permissions": "0"}
+
+    def join(self, user: dict) -> Event:
+        return "GUILD_MEMBER_ADD", self.member(user) | {"guild_id": str(self.guild_id)}, "join"
+
+    def leave(self, user: dict) -> Event:
+        return "GUILD_MEMBER_REMOVE", {"guild_id": str(self.guild_id), "user": user}, "leave"
+
+    def interaction(self, user: dict, kind: int, data: dict, channel_id: int = None, **extra) -> dict:
+        interaction = {
+            "id": str(next(ids)),
+            "application_id": self.bot_user["id"],
+            "type": kind,
+            "data": data,
+            "guild_id": str(self.guild_id),
+            "channel_id": str(channel_id or guild_configs[self.guild_id]["announcements_channel"]),
+            "member": self.member(user),
+            "token": f"token{next(ids)}",
+            "version": 1,
+            "locale": "en-US",
+            "guild_locale": "en-US",
+            "app_permissions": "0",
+        } | extra
+        self.rest.channels[interaction["token"]] = int(interaction["channel_id"])
+        return interaction
+
+    def options(self, path: List[str], values: dict) -> Tuple[dict, List[dict]]:
+        """The interaction data for a (sub)command and its option values. Users and members can be passed as user payloads."""
+        resolved: Dict[str, dict] = {"users": {}, "members": {}}
+        options = []
+        for name, value in values.items():
+            if isinstance(value, dict) and "username" in value:
+                resolved["users"][value["id"]] = value
+                resolved["members"][value["id"]] = {key: item for key, item in self.member(value).items() if key != "user"}
+                options.append({"type": 6, "name": name, "value": value["id"]})
+            else:
+                kind = 5 if isinstance(value, bool) else 4 if isinstance(value, int) else 10 if isinstance(value, float) else 3
+                options.append({"type": kind, "name": name, "value": value})
+        for name in reversed(path[1:]):
+            options = [{"type": 1, "name": name, "options": options}]
+        return {"id": self.command_ids[path[0]], "name": path[0], "type": 1, "options": options, "resolved": resolved}, options
+
+    def command(self, user: dict, name: str, **values) -> Event:
+        """A slash command, e.g. command(user, "fun tickoat2", opponent=other_user)."""
+        data, _ = self.options(name.split(), values)
+        return "INTERACTION_CREATE", self.interaction(user, 2, data), f"/{name}"
+
+    def autocomplete(self, user: dict, name: str, option: str, value: str, **values) -> Event:
+        """An autocomplete request for one option of a slash command."""
+        data, options = self.options(name.split(), values | {option: value})
+        while options and options[0]["type"] == 1:
+            options = options[0]["options"]
+        next(item for item in options if item["name"] == option)["focused"] = True
+        return "INTERACTION_CREATE", self.interaction(user, 4, data), f"/{name} autocomplete"
+
+    def click(self, user: dict, message: dict, custom_id: str, label: str = "button") -> Event:
+        interaction = self.interaction(
+            user, 3, {"custom_id": custom_id, "component_type": 2}, int(message["channel_id"]) or None, message=message
+        )
+        self.rest.targets[interaction["token"]] = int(message["id"])
+        return "INTERACTION_CREATE", interaction, label
+
+    def dm(self, user: dict, content: str) -> Event:
+        channel_id = self.rest.dm_channels.setdefault(int(user["id"]), next(ids))
+        message = self.rest.message(next(ids), channel_id, {"content": content}) | {"author": user}
+        return "MESSAGE_CREATE", message, "dm"
+
+    def dispatch(self, event: str, data: dict, label: str = None):
+        if event == "INTERACTION_CREATE":
+            if data["type"] in (2, 4) and data["data"]["name"] in self.command_ids:  # Recorded commands carry the live IDs
+                data["data"]["id"] = self.command_ids[data["data"]["name"]]
+            if not label:
+                name = command_path(data.get("data") or {})
+                label = {2: f"/{name}", 3: "component", 4: f"/{name} autocomplete", 5: "modal"}.get(data["type"], f"interaction type {data['type']}")
+            self.dispatched[data["token"]] = (label, time.perf_counter())
+        self.events += 1
+        self.bot._connection.parsers[event](data)
+
+    async def response(self, event: Event, timeout: float = 10) -> bool:
+        """Waits until the response to an interaction event made it back, so a user could act on it."""
+        return await self.rest.delivered.wait(event[1]["token"], timeout=timeout)
+
+    async def replay(self, stream: AsyncIterator[Event | Tuple[float, Event]], rate: float = None, speed: float = 1.0) -> Report:
+        """Dispatches a stream of events, then waits for the bot to settle and reports.
+
+        Args:
+            stream (AsyncIterator): Events, or (seconds since start, event) pairs for recorded streams.
+            rate (float, optional): Events per second, ignoring recorded times. Defaults to recorded times, or as fast as possible.
+            speed (float, optional): Speeds up (or slows down) recorded times. Defaults to real time.
+        """
+        watchdog = LoopWatchdog(report_every=float("inf"))
+        watchdog.start()
+        loop = asyncio.get_running_loop()
+        start, started = loop.time(), time.perf_counter()
+        count = 0
+        async for item in stream:
+            at, event = item if isinstance(item[0], (int, float)) else (None, item)
+            if rate:
+                at = count / rate
+            elif at is not None:
+                at /= speed
+            if at is not None and (wait := start + at - loop.time()) > 0:
+                await asyncio.sleep(wait)
+            self.dispatch(*event)
+            count += 1
+            if not count % 100:
+                await asyncio.sleep(0)  # Let handlers run even when dispatching as fast as possible
+        dispatched = loop.time() - start
+        await self.settle()
+        drained = max(self.rest.last_call - started, dispatched)
+        watchdog.stop()
+        return self.report(count, dispatched, drained, watchdog)
+
+    async def settle(self, quiet: float = 1.0, timeout: float = 60):
+        """Waits until no REST call happened for `quiet` seconds and every interaction got a response, or is past Discord's response deadline."""
+        deadline = time.perf_counter() + timeout
+        while (now := time.perf_counter()) < deadline:
+            idle = now - self.rest.last_call
+            if idle >= quiet and all(
+                self.rest.responses.get(token) is not None or now - at > response_deadline for token, (_, at) in self.dispatched.items()
+            ):
+                return
+            await asyncio.sleep(max(quiet - idle, 0.05))
+
+    def report(self, count: int, dispatched: float, drained: float, watchdog: LoopWatchdog) -> Report:
+        latency: Dict[str, Histogram] = collections.defaultdict(Histogram)
+        unanswered: collections.Counter[str] = collections.Counter()
+        for token, (label, at) in self.dispatched.items():
+            if (responded := self.rest.responses.get(token)) is None or responded - at > response_deadline:
+                unanswered[label] += 1
+                latency[label]  # Still listed
+            if responded is not None:
+                latency[label].observe(responded - at)
+        return Report(count, dispatched, drained, self.rest.calls, dict(latency), dict(unanswered), watchdog.lag, watchdog.worst_lag, watchdog.worst_sites(5))
+
+
+async def join_storm(harness: Harness, count: int) -> AsyncIterator[Event]:
+    """New members joining: welcome announcements and captcha prompts."""
+    for _ in range(count):
+        yield harness.join(harness.user())
+
+
+async def command_flood(harness: Harness, count: int) -> AsyncIterator[Event]:
+    """Members starting open TickoaTTwo challenges."""
+    for _ in range(count):
+        yield harness.command(harness.user(), "fun tickoat2")
+
+
+async def autocomplete_flood(harness: Harness, count: int) -> AsyncIterator[Event]:
+    """Members typing into /profile search, against an index of synthetic profiles.
+
+    py-cord drops an autocomplete request when a newer one for the same command comes in, like Discord does, so some go unanswered at high rates.
+    """
+    from cogs.profile import PlayerProfile
+    from helpers.profile_index import profile_index
+
+    names = [f"{random.choice(['Inkling', 'Octo', 'Squid', 'Salmon', 'Mahi'])}{i}" for i in range(5000)]
+    for i, name in enumerate(names):
+        profile_index.add(PlayerProfile(i, friend_code=f"{i:012d}", ign=name))
+    user = harness.user()
+    for _ in range(count):
+        name = random.choice(names)
+        yield harness.autocomplete(user, "profile search", "query", name[: random.randint(1, len(name))])
+
+
+async def captcha_start(harness: Harness, count: int) -> AsyncIterator[Event]:
+    """Members joining, then pressing "Start verification" on their prompt, which generates and DMs a captcha."""
+    users = [harness.user() for _ in range(count)]
+    for user in users:
+        yield harness.join(user)
+    for user in users:
+        mention = f"<@{user['id']}>"
+        find = lambda: harness.rest.find(lambda message: message["content"] == mention)
+        await harness.rest.messages.wait(ANY, lambda _: find() is not None, 10)
+        if prompt := find():
+            yield harness.click(user, prompt, buttons(prompt)[0]["custom_id"], "captcha start")
+
+
+async def button_spam(harness: Harness, count: int, games: int = 10) -> AsyncIterator[Event]:
+    """Pairs of players starting TickoaTTwo games, then mashing board buttons (legal or not) `count` times in total."""
+    boards = []
+    for _ in range(games):
+        challenger, opponent = harness.user(), harness.user()
+        challenge = harness.command(challenger, "fun tickoat2", opponent=opponent)
+        yield challenge
+        if not await harness.response(challenge):
+            continue
+        token = challenge[1]["token"]
+        message = harness.rest.messages.get(harness.rest.originals[token])
+        accept = next(button for button in buttons(message) if button.get("label") == "Accept challenge")
+        yield harness.click(opponent, message, accept["custom_id"], "challenge accept")
+        message_id = harness.rest.originals[token]
+        if await harness.rest.messages.wait(message_id, lambda message: len(buttons(message)) == 9, 10):
+            boards.append((harness.rest.messages.get(message_id), (challenger, opponent)))
+    for _ in range(count if boards else 0):
+        board, players = random.choice(boards)
+        board = harness.rest.messages.get(int(board["id"]))  # Latest state, so its components match
+        yield harness.click(random.choice(players), board, random.choice(buttons(board))["custom_id"], "To2Board click")
+
+
+scenarios: Dict[str, Callable[..., AsyncIterator[Event]]] = {
+    "join-storm": join_storm,
+    "command-flood": command_flood,
+    "autocomplete-flood": autocomplete_flood,
+    "captcha-start": captcha_start,
+    "button-spam": button_spam,
+}
+
+
+async def recorded(path: str) -> AsyncIterator[Tuple[float, Event]]:
+    """Replays a stream recorded by `Recorder`.
+
+    Commands are matched to the harness' commands by name. Component clicks only reach views with fixed custom IDs,
+    since other views get new ones every run; script those instead (see `button_spam`).
+    """
+    with (gzip.open if path.endswith(".gz") else open)(path, "rt") as file:
+        for line in file:
+            entry = json.loads(line)
+            yield entry["at"], (entry["event"], entry["data"], None)
+
+
+class Recorder:
+    """Records the live bot's gateway events into JSON lines that `recorded` can replay."""
+
+    def __init__(self, bot: discord.Bot, path: str, events: set[str] = None):
+        self.bot = bot
+        self.path = path
+        self.events = events  # Only these events, or all of them
+        self.count = 0
+        self.originals: Dict[str, Callable] = {}
+
+    def __enter__(self) -> "Recorder":
+        self.file = (gzip.open if self.path.endswith(".gz") else open)(self.path, "wt")
+        self.start = time.perf_counter()
+        parsers = self.bot._connection.parsers
+        for event, parser in parsers.items():
+            if self.events is None or event in self.events:
+                self.originals[event] = parser
+                parsers[event] = self.recording(event, parser)
+        return self
+
+    def recording(self, event: str, parser: Callable) -> Callable:
+        def parse(data):
+            self.file.write(json.dumps({"at": round(time.perf_counter() - self.start, 4), "event": event, "data": data}) + "\n")
+            self.count += 1
+            return parser(data)
+
+        return parse
+
+    def __exit__(self, *exc):
+        self.bot._connection.parsers.update(self.originals)
+        self.file.close()
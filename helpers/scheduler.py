@@ -0,0 +1,178 @@
+"""Persistent job scheduler, for anything that has to happen later and survive a restart (reminders, temporary roles, verification sweeps...).
+
+Jobs are stored in SurrealDB and kept in one in-memory min-heap ordered by due time, driven by a single timer task,
+so a thousand pending jobs cost a thousand small heap entries instead of a thousand sleeping tasks.
+On startup every stored job is loaded in one query, and jobs that came due while the bot was down are handled by their catch-up policy.
+
+Jobs live in the database of the guild they were scheduled for, and their handlers run as that guild's (see `classes.current_guild`).
+
+Cogs register a handler per job kind:
+
+    @scheduler.handler("reminder")
+    async def remind(bot, job):
+        ...
+
+    await scheduler.schedule("reminder", when, {"user": user.id, "text": text})
+"""
+import asyncio
+import datetime
+import enum
+import heapq
+import itertools
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+
+import discord
+
+from classes import background, current_guild, guild_configs
+from helpers.db_handling_sdb import Resource, connection
+
+log = logging.getLogger(__name__)
+
+
+class CatchUp(str, enum.Enum):
+    """What to do with a job that came due while the bot was down."""
+
+    RUN = "run"  # Run it as soon as possible (if it's not more than `grace` seconds late, when set)
+    SKIP = "skip"  # Drop it
+
+
+@dataclass(slots=True)
+class ScheduledJob(Resource):
+    kind: str  # Which handler runs it
+    run_at: datetime.datetime
+    payload: dict = field(default_factory=dict)
+    catch_up: CatchUp = CatchUp.RUN
+    grace: float = None  # Seconds a RUN job may be late by and still run. None means no limit.
+    guild_id: int = None  # The guild it was scheduled for
+
+
+Handler = Callable[[discord.Bot, ScheduledJob], Awaitable[Any]]
+
+
+class JobScheduler:
+    def __init__(self):
+        self.handlers: Dict[str, Handler] = {}
+        self.jobs: Dict[str, ScheduledJob] = {}  # ID -> job still pending
+        self.parked: Dict[str, ScheduledJob] = {}  # ID -> due job whose kind has no handler yet, e.g. because its cog failed to load
+        self.heap: List[Tuple[float, int, str]] = []  # (due timestamp, tiebreaker, job ID). Cancelled jobs are skipped when popped.
+        self._counter = itertools.count()
+        self._wakeup: asyncio.Event = None
+        self._timer: asyncio.Task = None
+        self.bot: discord.Bot = None
+
+    def handler(self, kind: str):
+        """Registers the coroutine function that runs jobs of a kind. Registering again (e.g. on cog reload) replaces it.
+        Jobs of that kind that came due while it had no handler are queued again."""
+
+        def decorator(func: Handler) -> Handler:
+            self.handlers[kind] = func
+            for job in [job for job in self.parked.values() if job.kind == kind]:
+                del self.parked[job.id]
+                self._push(job)
+            return func
+
+        return decorator
+
+    def _push(self, job: ScheduledJob):
+        self.jobs[job.id] = job
+        heapq.heappush(self.heap, (job.run_at.timestamp(), next(self._counter), job.id))
+        if self._wakeup and self.heap[0][2] == job.id:  # New earliest job, the timer is sleeping for too long
+            self._wakeup.set()
+
+    async def schedule(
+        self,
+        kind: str,
+        when: datetime.datetime | datetime.timedelta,
+        payload: dict = None,
+        catch_up: CatchUp = CatchUp.RUN,
+        grace: float = None,
+    ) -> ScheduledJob:
+        """Stores a job and queues it.
+
+        Args:
+            kind (str): The job kind, which picks the handler.
+            when (datetime | timedelta): When to run it, or how long from now.
+            payload (dict, optional): JSON-friendly data for the handler.
+            catch_up (CatchUp, optional): What to do if the bot is down when it comes due. Defaults to running it late.
+            grace (float, optional): Seconds a late job may still run within. Defaults to no limit.
+        """
+        if isinstance(when, datetime.timedelta):
+            when = datetime.datetime.now() + when
+        job = ScheduledJob(kind, when, payload or {}, catch_up, grace, current_guild.get())
+        await job.store()
+        self._push(job)
+        return job
+
+    async def cancel(self, job_id: str) -> bool:
+        """Cancels a pending job. Returns whether there was one to cancel."""
+        if not (job := self.jobs.pop(job_id, None) or self.parked.pop(job_id, None)):
+            return False
+        with guild_configs.use(job.guild_id):
+            await connection.delete(job_id)
+        return True
+
+    async def start(self, bot: discord.Bot):
+        """Loads every guild's stored jobs and starts the timer. Does nothing if already running."""
+        if self._timer and not self._timer.done():
+            return
+        self.bot = bot
+        now = datetime.datetime.now()
+        loaded = skipped = 0
+        for guild_id in guild_configs.ids:
+            with guild_configs.use(guild_id):
+                jobs: List[ScheduledJob] = await connection.run_query(ScheduledJob, "SELECT * FROM ScheduledJob")
+                for job in jobs:
+                    if getattr(job, "guild_id", None) is None:  # Stored before jobs knew their guild
+                        job.guild_id = guild_id
+                    late = (now - job.run_at).total_seconds()
+                    if late > 0 and (job.catch_up == CatchUp.SKIP or (job.grace is not None and late > job.grace)):
+                        await connection.delete(job.id)
+                        skipped += 1
+                    elif job.id not in self.jobs and job.id not in self.parked:
+                        self._push(job)
+                        loaded += 1
+        log.info("Loaded %d scheduled jobs, skipped %d missed ones", loaded, skipped)
+        self._wakeup = asyncio.Event()
+        self._timer = asyncio.create_task(self._run_timer())
+
+    def stop(self):
+        if self._timer:
+            self._timer.cancel()
+
+    async def _run_timer(self):
+        while True:
+            self._wakeup.clear()
+            while self.heap and self.heap[0][2] not in self.jobs:
+                heapq.heappop(self.heap)  # Cancelled
+            if not self.heap:
+                await self._wakeup.wait()
+                continue
+            if (wait := self.heap[0][0] - datetime.datetime.now().timestamp()) > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            _, _, job_id = heapq.heappop(self.heap)
+            background(self._run(self.jobs.pop(job_id)), f"scheduled job {job_id}")
+
+    async def _run(self, job: ScheduledJob):
+        if not (handler := self.handlers.get(job.kind)):
+            # Kept in the database and parked until a handler is registered, rather than lost to a cog that didn't load.
+            log.warning("No handler for scheduled job %s of kind %s, keeping it until one is registered", job.id, job.kind)
+            self.parked[job.id] = job
+            return
+        with guild_configs.use(job.guild_id):  # The timer runs as the home guild, the job as its own
+            try:
+                await handler(self.bot, job)
+            except Exception:
+                log.exception("Scheduled job %s (%s) failed", job.id, job.kind)
+            try:
+                await connection.delete(job.id)
+            except Exception:
+                log.exception("Failed to delete finished job %s, it will run again after a restart", job.id)
+
+
+scheduler = JobScheduler()
@@ -0,0 +1,104 @@
+"""Records where a cold start spends its time. Only uses the standard library, so it can be imported before anything heavy."""
+import contextlib
+import logging
+import sys
+import threading
+import time
+from typing import Dict, List, Tuple
+
+log = logging.getLogger(__name__)
+
+
+class _TimedLoader:
+    """Wraps a module loader to time its exec_module call. Everything else is passed through to the real loader."""
+
+    def __init__(self, loader, name: str, timeline: "StartupTimeline"):
+        self._loader = loader
+        self._name = name
+        self._timeline = timeline
+
+    def __getattr__(self, attr):
+        return getattr(self._loader, attr)
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        with self._timeline._import_span(self._name):
+            self._loader.exec_module(module)
+
+
+class StartupTimeline:
+    """Startup timeline recorder: per-module import time, per-cog setup time and time-to-READY.
+
+    All times are seconds, measured from when this module was first imported.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.imports: Dict[str, float] = {}  # module name -> self time (excluding nested imports)
+        self.cogs: Dict[str, float] = {}  # extension name -> setup time
+        self.marks: List[Tuple[str, float]] = []  # (label, seconds since start)
+        self.ready_after: float = None
+        self._local = threading.local()  # Imports can happen in worker threads too, each gets its own nesting stack.
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def install(self):
+        """Starts timing module imports."""
+        if self not in sys.meta_path:
+            sys.meta_path.insert(0, self)
+
+    def uninstall(self):
+        with contextlib.suppress(ValueError):
+            sys.meta_path.remove(self)
+
+    def find_spec(self, name, path, target=None):
+        # Delegate to the real finders, then wrap whatever loader they come up with.
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(name, path, target)
+            if spec is not None:
+                if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                    spec.loader = _TimedLoader(spec.loader, name, self)
+                return spec
+        return None
+
+    @contextlib.contextmanager
+    def _import_span(self, name: str):
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []  # Time spent in nested imports, per level
+        stack: List[float] = self._local.stack
+        stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            total = time.perf_counter() - start
+            nested = stack.pop()
+            self.imports[name] = total - nested
+            if stack:
+                stack[-1] += total
+
+    def record_cog(self, name: str, seconds: float):
+        self.cogs[name] = seconds
+
+    def mark(self, label: str):
+        self.marks.append((label, self.elapsed()))
+
+    def ready(self):
+        """Records time-to-READY. Only the first READY after a cold start counts, reconnects are ignored."""
+        if self.ready_after is not None:
+            return
+        self.ready_after = self.elapsed()
+        self.mark("READY")
+        self.uninstall()  # Anything imported from here on is a lazy import, not part of the cold start.
+        log.info("Ready %.2fs after startup", self.ready_after)
+
+    def slowest_imports(self, count: int = 10) -> List[Tuple[str, float]]:
+        return sorted(self.imports.items(), key=lambda item: item[1], reverse=True)[:count]
+
+
+timeline = StartupTimeline()
@@ -0,0 +1,132 @@
+"""Strikes: moderation points that fade over time and eventually expire.
+
+A strike's weight halves every `half_life`, and it stops counting entirely once it expires. Since every strike decays at the same rate,
+a member's total can be kept as one (score, as of) pair that's decayed on read, so checking it never means summing rows.
+Expirations come off a single min-heap timer, which subtracts each strike's (decayed) weight when its time comes.
+"""
+import asyncio
+import datetime
+import heapq
+import logging
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Tuple
+
+from helpers.db_handling_sdb import Resource
+
+log = logging.getLogger(__name__)
+
+half_life = datetime.timedelta(days=14)
+
+
+def decay(points: float, since: datetime.datetime, now: datetime.datetime) -> float:
+    return points * 0.5 ** ((now - since) / half_life)
+
+
+@dataclass(slots=True)
+class Strike(Resource):
+    member_id: int
+    moderator_id: int
+    points: float
+    reason: str
+    expires_at: datetime.datetime
+    pardoned: bool = False
+
+    def active(self, now: datetime.datetime) -> bool:
+        return not self.pardoned and self.expires_at > now
+
+
+class StrikeLedger:
+    def __init__(self):
+        self.scores: Dict[int, Tuple[float, datetime.datetime]] = {}  # member ID -> (score, as of)
+        self.strikes: Dict[str, Strike] = {}  # Active strikes by ID
+        self.by_member: Dict[int, set[str]] = {}  # member ID -> active strike IDs
+        self.heap: List[Tuple[datetime.datetime, str]] = []  # (expiry, strike ID). Pardoned strikes are skipped when popped.
+        self._wakeup: asyncio.Event = None
+        self._timer: asyncio.Task = None
+
+    def score(self, member_id: int, now: datetime.datetime = None) -> float:
+        """A member's current total, decayed to now."""
+        if member_id not in self.scores:
+            return 0.0
+        score, as_of = self.scores[member_id]
+        return decay(score, as_of, now or datetime.datetime.now())
+
+    def member_strikes(self, member_id: int) -> List[Strike]:
+        return sorted((self.strikes[strike_id] for strike_id in self.by_member.get(member_id, ())), key=lambda strike: strike.created_at)
+
+    def _apply(self, strike: Strike, sign: int, now: datetime.datetime) -> Tuple[float, float]:
+        """Adds (sign 1) or removes (sign -1) a strike's weight from its member's score. Returns the score before and after."""
+        before = self.score(strike.member_id, now)
+        if sign > 0:
+            self.strikes[strike.id] = strike
+            self.by_member.setdefault(strike.member_id, set()).add(strike.id)
+            heapq.heappush(self.heap, (strike.expires_at, strike.id))
+            if self._wakeup:
+                self._wakeup.set()
+        else:
+            del self.strikes[strike.id]
+            self.by_member[strike.member_id].discard(strike.id)
+        if not self.by_member[strike.member_id]:  # Nothing left, drop the float rounding leftovers too
+            del self.by_member[strike.member_id]
+            del self.scores[strike.member_id]
+            return before, 0.0
+        after = max(before + sign * decay(strike.points, strike.created_at, now), 0.0)
+        self.scores[strike.member_id] = (after, now)
+        return before, after
+
+    def load(self, strikes: Iterable[Strike]):
+        """Takes over stored strikes on startup, skipping the ones that expired or were pardoned."""
+        now = datetime.datetime.now()
+        for strike in strikes:
+            if strike.active(now) and strike.id not in self.strikes:
+                self._apply(strike, 1, now)
+
+    async def add(self, member_id: int, moderator_id: int, points: float, reason: str, duration: datetime.timedelta) -> Tuple[Strike, float, float]:
+        """Gives a member a strike.
+
+        Returns:
+            tuple[Strike, float, float]: The strike, and the member's score before and after it.
+        """
+        now = datetime.datetime.now()
+        strike = Strike(member_id, moderator_id, points, reason, now + duration)
+        await strike.store()
+        return (strike, *self._apply(strike, 1, now))
+
+    async def pardon(self, strike_id: str) -> Strike | None:
+        """Takes back an active strike early. Returns it, or None if there's no such active strike."""
+        if not (strike := self.strikes.get(strike_id)):
+            return None
+        self._apply(strike, -1, datetime.datetime.now())
+        strike.pardoned = True
+        await strike.store()
+        return strike
+
+    def start(self):
+        """Starts the expiry timer. Does nothing if it's already running."""
+        if self._timer and not self._timer.done():
+            return
+        self._wakeup = asyncio.Event()
+        self._timer = asyncio.create_task(self._run_timer())
+
+    def stop(self):
+        if self._timer:
+            self._timer.cancel()
+
+    async def _run_timer(self):
+        while True:
+            self._wakeup.clear()
+            now = datetime.datetime.now()
+            while self.heap and (self.heap[0][1] not in self.strikes or self.heap[0][0] <= now):
+                _, strike_id = heapq.heappop(self.heap)
+                if strike := self.strikes.get(strike_id):
+                    self._apply(strike, -1, now)
+                    log.debug("Strike %s expired", strike_id)
+            try:
+                # Not wait_for(): it can swallow a cancellation that lands just as the event is set, and the timer would never stop.
+                async with asyncio.timeout((self.heap[0][0] - now).total_seconds() if self.heap else None):
+                    await self._wakeup.wait()
+            except TimeoutError:
+                pass
+
+
+ledger = StrikeLedger()
@@ -0,0 +1,140 @@
+"""Event loop watchdog: measures loop lag continuously and catches whatever is blocking the loop.
+
+A heartbeat task notes every time it gets to run. A helper thread keeps an eye on it, and when the heartbeat is late by more than
+`threshold`, grabs the loop thread's stack right away, while the blocking call is still on it.
+Stalls are grouped by the line of our code that was running, and each site is logged (so it also lands in the log channel) at most once per `report_every` seconds.
+"""
+import asyncio
+import inspect
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from dataclasses import dataclass
+from typing import Dict, Tuple
+
+from helpers.metrics import Histogram
+from helpers.profiler import task_label
+
+log = logging.getLogger(__name__)
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def in_project(filename: str) -> bool:
+    filename = os.path.abspath(filename)
+    return filename.startswith(root + os.sep) and "site-packages" not in filename
+
+
+def describe(frame) -> Tuple[str, str, str]:
+    """Works out (site, handler, formatted stack) for a stack, innermost frame given.
+
+    The site is the innermost line of our own code, the handler is the innermost coroutine of ours it was called from.
+    """
+    frames = []
+    while frame is not None:
+        frames.append(frame)
+        frame = frame.f_back
+    ours = [frame for frame in frames if in_project(frame.f_code.co_filename)]
+    site_frame = ours[0] if ours else frames[0]
+    coroutines = [frame for frame in ours if frame.f_code.co_flags & inspect.CO_COROUTINE]
+    handler = coroutines[0].f_code.co_qualname if coroutines else site_frame.f_code.co_qualname
+    site = f"{os.path.relpath(site_frame.f_code.co_filename, root)}:{site_frame.f_lineno} in {site_frame.f_code.co_qualname}"
+    stack = "".join(traceback.format_list(traceback.extract_stack(frames[0])[-12:]))
+    return site, handler, stack
+
+
+@dataclass
+class Stall:
+    site: str
+    handler: str
+    task: str
+    stack: str  # Of the latest stall at this site
+    count: int = 0
+    total: float = 0.0
+    worst: float = 0.0
+    reported_at: float = None
+
+
+class LoopWatchdog:
+    def __init__(self, interval: float = 0.1, threshold: float = 0.25, report_every: float = 3600):
+        self.interval = interval
+        self.threshold = threshold
+        self.report_every = report_every
+        self.lag = Histogram()
+        self.worst_lag = 0.0
+        self.stalls: Dict[str, Stall] = {}  # site -> stall
+        self._beat = time.monotonic()
+        self._captured: tuple = None  # (beat, site, handler, task, stack) of the stall in progress
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._heartbeat: asyncio.Task = None
+
+    def start(self):
+        """Starts watching the running event loop. Does nothing if already watching."""
+        if self._heartbeat and not self._heartbeat.done():
+            return
+        loop = asyncio.get_running_loop()
+        self._stop.clear()
+        self._beat = time.monotonic()
+        self._heartbeat = loop.create_task(self._beat_forever())
+        threading.Thread(target=self._watch, args=(threading.get_ident(), loop), name="loop-watchdog", daemon=True).start()
+        log.info("Watching the event loop for stalls over %dms", self.threshold * 1000)
+
+    def stop(self):
+        self._stop.set()
+        if self._heartbeat:
+            self._heartbeat.cancel()
+
+    async def _beat_forever(self):
+        while True:
+            before = self._beat
+            await asyncio.sleep(self.interval)
+            self._beat = now = time.monotonic()
+            lag = max(now - before - self.interval, 0)
+            self.lag.observe(lag)
+            self.worst_lag = max(self.worst_lag, lag)
+            if lag < self.threshold:
+                continue
+            with self._lock:
+                captured, self._captured = self._captured, None
+            if captured and captured[0] == before:
+                self._record(lag, *captured[1:])
+
+    def _watch(self, thread_id: int, loop: asyncio.AbstractEventLoop):
+        while not self._stop.wait(self.interval / 2):
+            beat = self._beat
+            if time.monotonic() - beat < self.interval + self.threshold:
+                continue
+            with self._lock:
+                if self._captured and self._captured[0] == beat:
+                    continue  # Already caught this one
+            if (frame := sys._current_frames().get(thread_id)) is None:
+                continue
+            task = asyncio.current_task(loop)
+            site, handler, stack = describe(frame)
+            with self._lock:
+                self._captured = (beat, site, handler, task_label(task) if task else "<callbacks outside of tasks>", stack)
+
+    def _record(self, seconds: float, site: str, handler: str, task: str, stack: str):
+        if not (stall := self.stalls.get(site)):
+            stall = self.stalls[site] = Stall(site, handler, task, stack)
+        stall.handler, stall.task, stall.stack = handler, task, stack
+        stall.count += 1
+        stall.total += seconds
+        stall.worst = max(stall.worst, seconds)
+        now = time.monotonic()
+        if stall.reported_at is None or now - stall.reported_at >= self.report_every:
+            stall.reported_at = now
+            log.warning(
+                "Event loop blocked for %dms at %s, in %s (task %s). Seen %d times, worst %dms.\n%s",
+                seconds * 1000, site, handler, task, stall.count, stall.worst * 1000, stack,
+            )
+
+    def worst_sites(self, count: int = 10) -> list[Stall]:
+        return sorted(self.stalls.values(), key=lambda stall: stall.total, reverse=True)[:count]
+
+
+watchdog = LoopWatchdog()
@@ -0,0 +1,45 @@
+"""Load tests the cogs without a live guild, by replaying gateway events against a fake gateway and a mocked REST layer (see helpers.replay).
+
+    python loadtest.py join-storm --count 500 --rate 100
+    python loadtest.py button-spam --count 2000 --rate 200 --rest-latency 0.1
+    python loadtest.py recording.jsonl --speed 10
+
+Prints throughput, first response latency percentiles, REST call counts and event loop lag.
+"""
+import argparse
+import logging
+
+from bot import bot
+from classes import guild_configs
+from helpers.replay import Harness, recorded, scenarios
+
+default_cogs = ["cogs.captcha", "cogs.fun", "cogs.profile", "cogs.welcome"]
+
+
+async def run(args: argparse.Namespace):
+    harness = Harness(bot, args.rest_latency)
+    await harness.start(args.cogs)
+    if args.scenario in scenarios:
+        stream = scenarios[args.scenario](harness, args.count)
+    else:
+        stream = recorded(args.scenario)
+    print(await harness.replay(stream, args.rate, args.speed))
+    await bot.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the cogs against a fake gateway.")
+    parser.add_argument("scenario", help=f"A scripted scenario ({', '.join(scenarios)}) or a recorded .jsonl(.gz) stream, e.g. from /dev record.")
+    parser.add_argument("--count", type=int, default=500, help="How many events the scenario generates.")
+    parser.add_argument("--rate", type=float, default=None, help="Events per second. Defaults to recorded times, or as fast as possible.")
+    parser.add_argument("--speed", type=float, default=1.0, help="Speeds up recorded streams by this factor.")
+    parser.add_argument("--rest-latency", type=float, default=0.05, help="Simulated REST round trip in seconds.")
+    parser.add_argument("--cogs", nargs="+", default=default_cogs, help="The cogs to load.")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING, format="[%(asctime)s] %(levelname)s %(module)s:%(lineno)d   %(message)s")
+    guild_configs[guild_configs.home]["database"] = "loadtest"  # Keep whatever the cogs store away from real data
+    bot.loop.run_until_complete(run(args))
+
+
+if __name__ == "__main__":
+    main()
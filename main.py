@@ -1,3 +1,7 @@
+from helpers.startup import timeline
+
+timeline.install()  # Must happen before anything else is imported so every module gets timed.
+
 import logging
 import os
 
@@ -5,6 +9,7 @@ from discord.ext import tasks
 
 from bot import bot
 from classes import *
+from helpers.cog_loader import discover_cogs, load_cogs
 from helpers.discord_logger import DiscordLogHandler
 
 logging.basicConfig(level=logging.INFO, format="[%(asctime)s] %(levelname)s %(module)s:%(lineno)d   %(message)s")
@@ -12,9 +17,8 @@ logging.getLogger().addHandler(DiscordLogHandler(bot, config['log_channel'], lev
 log = logging.getLogger(__name__)
 
 
-for cog in os.listdir("cogs"):
-    if cog.startswith("."): # Exclude incomplete modules (filenames starting with .), these modules are also gitignore'd.
-        continue
-    bot.load_extension(f'cogs.{cog.removesuffix(".py")}')
+for result in bot.loop.run_until_complete(load_cogs(bot, discover_cogs())).values():
+    timeline.record_cog(result.name, result.seconds)
+timeline.mark("Cogs loaded")
 
 bot.run(secrets["bot_token"])
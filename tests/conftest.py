@@ -0,0 +1,69 @@
+"""Runs the tests from a scratch directory holding the files the bot reads at import time (secrets.json, cache/...)."""
+import json
+import os
+import sys
+import tempfile
+
+import pytest
+
+repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo)
+
+scratch = tempfile.mkdtemp(prefix="kolkra-tests-")
+with open(os.path.join(scratch, "secrets.json"), "w") as file:
+    json.dump(
+        {
+            "config_file": os.path.join(repo, "config_beta.json"),
+            "bot_token": "token",
+            "db_username": "user",
+            "db_password": "password",
+            "welcome_webhook": "https://discord.com/api/webhooks/1/token",
+            "hastebin_token": "token",
+        },
+        file,
+    )
+os.chdir(scratch)
+
+
+class MemoryDatabase:
+    """Stands in for the SurrealDB connection, with records kept per guild database like the real one."""
+
+    def __init__(self):
+        self.records = {}  # (database, record ID) -> serialized record
+
+    def key(self, record_id: str):
+        from classes import guild_configs
+
+        return guild_configs.current()["database"], record_id
+
+    async def get(self, obj_type, obj_id):
+        from helpers.db_handling_sdb import deser
+
+        return deser(obj_type, record) if (record := self.records.get(self.key(obj_id))) else None
+
+    async def create(self, record_id, data):
+        self.records[self.key(record_id)] = data
+
+    async def update(self, record_id, data):
+        self.records[self.key(record_id)] |= data
+
+    async def delete(self, record_id):
+        self.records.pop(self.key(record_id), None)
+
+    async def run_query(self, obj_type, query, **params):
+        from helpers.db_handling_sdb import deser
+
+        database, _ = self.key(None)
+        return [deser(obj_type, record) for (db, record_id), record in self.records.items() if db == database and record_id.startswith(f"{obj_type.__name__}:")]
+
+
+@pytest.fixture
+def database(monkeypatch):
+    """Swaps the database connection for a `MemoryDatabase` in every module that imported it."""
+    import helpers.db_handling_sdb
+
+    real, memory = helpers.db_handling_sdb.connection, MemoryDatabase()
+    for module in list(sys.modules.values()):
+        if getattr(module, "connection", None) is real:
+            monkeypatch.setattr(module, "connection", memory)
+    return memory
@@ -0,0 +1,54 @@
+import base64
+import datetime
+
+import pytest
+
+from cogs.admin import imported_datetime, imported_profile
+
+
+def pickled(state: bytes) -> dict:
+    return {"py/object": "datetime.datetime", "__reduce__": [{"py/type": "datetime.datetime"}, [base64.b64encode(state).decode()]]}
+
+
+def record(**values) -> dict:
+    return {"py/object": "cogs.profile.PlayerProfile", "id": "PlayerProfile:abc", "owner_id": 1234} | values
+
+
+def test_datetime_formats():
+    when = datetime.datetime(2024, 5, 1, 12, 30)
+    assert imported_datetime(None) is None
+    assert imported_datetime(when.isoformat()) == when
+    assert imported_datetime(pickled(when.__reduce__()[1][0])) == when
+
+
+@pytest.mark.parametrize("state", ["AAAA", "/////////////w==", base64.b64encode(b"\xff" * 10).decode()])
+def test_malformed_datetime_is_a_value_error(state):
+    value = {"py/object": "datetime.datetime", "__reduce__": [{"py/type": "datetime.datetime"}, [state]]}
+    with pytest.raises(ValueError):
+        imported_datetime(value)
+
+
+def test_profile_with_malformed_created_at_is_skipped():
+    with pytest.raises(ValueError):
+        imported_profile(record(created_at=pickled(b"\xff" * 10)))
+
+
+def test_profile():
+    profile = imported_profile(record(ign="Alpha", created_at="2024-05-01T12:30:00", updated_at="2024-05-02T12:30:00"))
+    assert (profile.owner_id, profile.ign) == (1234, "Alpha")
+    assert profile.updated_at == datetime.datetime(2024, 5, 2, 12, 30)  # Not bumped by the import
+
+
+@pytest.mark.parametrize(
+    "bad",
+    [
+        {"py/object": "builtins.eval"},
+        {"py/reduce": [{"py/function": "os.system"}, ["true"]]},
+        {"ign": {"py/object": "os.system"}},
+        {"owner_id": True},
+        {"id": "Other:abc"},
+    ],
+)
+def test_rejects_anything_but_profile_fields(bad):
+    with pytest.raises(ValueError):
+        imported_profile(record() | bad)
@@ -0,0 +1,21 @@
+import asyncio
+import logging
+
+from classes import background, background_tasks
+
+
+def test_background_tasks_are_kept_until_done(caplog):
+    async def fail():
+        await asyncio.sleep(0)
+        raise RuntimeError("boom")
+
+    async def main():
+        task = background(fail(), "failing job")
+        assert task in background_tasks
+        await asyncio.sleep(0.01)
+        assert task not in background_tasks
+
+    with caplog.at_level(logging.ERROR, "classes"):
+        asyncio.run(main())
+    assert "Background task failing job failed" in caplog.text
+    assert "boom" in caplog.text
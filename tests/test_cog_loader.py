@@ -0,0 +1,108 @@
+import asyncio
+import sys
+import textwrap
+from types import SimpleNamespace
+
+import discord
+import pytest
+
+from helpers.cog_loader import DependencyError, dependents, find_cycles, load_cogs, load_order
+
+
+def loaded(**requires) -> SimpleNamespace:
+    """A stand-in bot with the given extensions loaded, each requiring the listed ones."""
+    return SimpleNamespace(extensions={name: SimpleNamespace(requires=deps) for name, deps in requires.items()})
+
+
+def test_load_order_puts_dependencies_first():
+    bot = loaded(a=[], b=["a"], c=["b"], d=["a", "c"])
+    order = load_order(bot, ["d", "c", "b", "a"])
+    assert sorted(order) == ["a", "b", "c", "d"]
+    assert order.index("a") < order.index("b") < order.index("c") < order.index("d")
+    assert load_order(bot, ["d", "a"]) == ["a", "d"]  # Only orders what it's given
+
+
+def test_load_order_survives_cycles():
+    bot = loaded(a=["b"], b=["a"])
+    assert sorted(load_order(bot, ["a", "b"])) == ["a", "b"]
+
+
+def test_dependents_are_transitive():
+    bot = loaded(a=[], b=["a"], c=["b"], d=[])
+    assert dependents(bot, ["a"]) == {"b", "c"}
+    assert dependents(bot, ["d"]) == set()
+
+
+def test_find_cycles():
+    assert find_cycles({"a": [], "b": ["a"]}) == set()
+    assert find_cycles({"a": ["a"]}) == {"a"}
+    assert find_cycles({"a": ["b"], "b": ["c"], "c": ["a"], "d": ["c"], "e": ["d"], "f": []}) == {"a", "b", "c", "d", "e"}
+    assert find_cycles({"a": ["missing"]}) == set()
+
+
+@pytest.fixture
+def cogs(tmp_path, monkeypatch):
+    """Writes cog modules into a throwaway package, named by a dict of name -> (requires, asetup body)."""
+    package = tmp_path / "scratchcogs"
+    package.mkdir()
+    monkeypatch.syspath_prepend(str(tmp_path))
+
+    def write(**modules):
+        for name, (requires, body) in modules.items():
+            (package / f"{name}.py").write_text(
+                textwrap.dedent(
+                    f"""
+                    requires = {[f"scratchcogs.{dep}" for dep in requires]!r}
+                    def setup(bot):
+                        pass
+                    async def asetup(bot):
+                        {body}
+                    """
+                )
+            )
+
+    yield write
+    for name in [name for name in sys.modules if name.startswith("scratchcogs")]:
+        del sys.modules[name]
+
+
+def test_load_cogs_in_dependency_order(cogs):
+    cogs(
+        base=([], "import asyncio; await asyncio.sleep(0.05); bot.order.append('base')"),
+        needs_base=(["base"], "bot.order.append('needs_base')"),
+        alone=([], "bot.order.append('alone')"),
+    )
+
+    async def main():
+        bot = discord.Bot()
+        bot.order = []
+        results = await load_cogs(bot, ["scratchcogs.needs_base", "scratchcogs.alone", "scratchcogs.base"])
+        assert not any(result.error for result in results.values())
+        assert bot.order == ["alone", "base", "needs_base"]  # alone didn't wait for base
+
+    asyncio.run(main())
+
+
+def test_failures_and_cycles_only_take_down_their_dependents(cogs):
+    cogs(
+        broken=([], "raise RuntimeError('broken')"),
+        needs_broken=(["broken"], "pass"),
+        loop_a=(["loop_b"], "pass"),
+        loop_b=(["loop_a"], "pass"),
+        fine=([], "pass"),
+    )
+
+    async def main():
+        bot = discord.Bot()
+        results = await load_cogs(bot, [f"scratchcogs.{name}" for name in ("broken", "needs_broken", "loop_a", "loop_b", "fine")])
+        errors = {name.split(".")[1]: type(result.error) for name, result in results.items()}
+        assert errors == {
+            "broken": RuntimeError,
+            "needs_broken": DependencyError,
+            "loop_a": DependencyError,
+            "loop_b": DependencyError,
+            "fine": type(None),
+        }
+        assert list(bot.extensions) == ["scratchcogs.fine"]
+
+    asyncio.run(main())
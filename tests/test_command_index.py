@@ -0,0 +1,62 @@
+import asyncio
+
+import discord
+
+from helpers.command_index import MAX_CHOICES, CommandIndex
+
+
+loop = asyncio.new_event_loop()  # Other tests' asyncio.run() leave no current loop for the bots to pick up
+
+
+async def callback(ctx):
+    """Does something."""
+
+
+def bot_with(*names: str) -> discord.Bot:
+    """A bot with a slash command for each qualified name, e.g. "profile edit" (a command in a group)."""
+    bot = discord.Bot(loop=loop)
+    groups = {}
+    for name in names:
+        *group, command = name.split(" ")
+        if group:
+            if group[0] not in groups:
+                groups[group[0]] = bot.create_group(group[0], "A group.")
+            groups[group[0]].command(name=command, description="A command.")(callback)
+        else:
+            bot.slash_command(name=command, description="A command.")(callback)
+    return bot
+
+
+def index_of(*names: str) -> CommandIndex:
+    index = CommandIndex()
+    index.rebuild(bot_with(*names))
+    return index
+
+
+def test_completes_every_word_boundary():
+    index = index_of("ping", "profile edit", "profile get", "tools lan-ip")
+    assert index.complete("pro") == ["profile edit", "profile get"]
+    assert index.complete("EDIT") == ["profile edit"]
+    assert index.complete("lan") == ["tools lan-ip"]
+    assert index.complete("nothing") == []
+    assert index.complete("") == ["ping", "profile edit", "profile get", "tools lan-ip"]
+    assert index.embed("profile edit").description == "Does something."
+    assert index.embed("profile") is None  # Groups aren't commands
+
+
+def test_completions_are_capped_at_25_keeping_the_first_alphabetically():
+    names = [f"c{i:02}" for i in range(40)]
+    index = index_of(*reversed(names))  # Worst case order for the cap
+    assert len(index.complete("c")) == MAX_CHOICES == 25
+    assert index.complete("c") == names[:MAX_CHOICES]
+    assert index.complete("") == names[:MAX_CHOICES]
+    assert index.complete("c3") == names[30:40]
+
+
+def test_rebuild_drops_removed_commands():
+    index = CommandIndex()
+    bot = bot_with("ping", "pong")
+    index.rebuild(bot)
+    bot.remove_application_command(next(command for command in bot.pending_application_commands if command.name == "pong"))
+    index.rebuild(bot)
+    assert index.complete("p") == ["ping"]
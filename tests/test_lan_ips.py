@@ -0,0 +1,68 @@
+import asyncio
+import datetime
+from array import array
+
+import pytest
+
+from helpers.lan_ips import LanIPAllocator, LanLease, NoFreeAddressError, address, full_word, reserved
+
+
+def test_skips_network_broadcast_and_reserved_addresses():
+    allocator = LanIPAllocator()
+    assert allocator.find_free() == 1  # 10.13.0.0 is the network address
+    for index in [0, 255, 256, 511, *reserved]:
+        assert allocator.words[index >> 6] & 1 << (index & 63), f"{address(index)} is free"
+
+
+def test_wraps_around_to_addresses_freed_before_the_hint():
+    allocator = LanIPAllocator()
+    allocator.words = array("Q", [full_word]) * len(allocator.words)
+    allocator.hint = len(allocator.words) - 1
+    allocator.words[2] = full_word & ~(1 << 5)  # Freed without unmark(), so the hint stays at the end
+    assert allocator.find_free() == 2 * 64 + 5
+    assert allocator.hint == 2
+
+
+def test_unmark_moves_the_hint_back():
+    allocator = LanIPAllocator()
+    for _ in range(200):
+        allocator.mark(allocator.find_free())
+    assert allocator.hint == 3
+    allocator.unmark(10)
+    assert allocator.find_free() == 10
+
+
+def test_raises_when_every_address_is_leased():
+    allocator = LanIPAllocator()
+    allocator.words = array("Q", [full_word]) * len(allocator.words)
+    with pytest.raises(NoFreeAddressError):
+        allocator.find_free()
+
+
+def test_lease_is_kept_per_owner_and_stored(database):
+    async def main():
+        allocator = LanIPAllocator()
+        first, second, again = await allocator.lease(1), await allocator.lease(2), await allocator.lease(1)
+        return first, second, again
+
+    first, second, again = asyncio.run(main())
+    assert (first, second, again) == ("10.13.0.1", "10.13.0.2", "10.13.0.1")
+    assert sorted(record_id for _, record_id in database.records) == ["LanLease:1", "LanLease:2"]
+
+
+def test_expired_leases_are_freed_and_deleted(database):
+    async def main():
+        allocator = LanIPAllocator(ttl=datetime.timedelta(0))
+        await allocator.lease(1)
+        assert len(database.records) == 1
+        return await allocator.lease(2)  # 1's lease ran out the moment it was made
+
+    assert asyncio.run(main()) == "10.13.0.1"
+    assert [record_id for _, record_id in database.records] == ["LanLease:2"]
+
+
+def test_load_takes_over_stored_leases():
+    allocator = LanIPAllocator()
+    allocator.load([LanLease(7, 1, datetime.datetime.max, id="LanLease:7")])
+    assert allocator.leases[7].index == 1
+    assert allocator.find_free() == 2
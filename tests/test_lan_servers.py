@@ -0,0 +1,94 @@
+import asyncio
+import socket
+
+from aiohttp import web
+
+from helpers.http_client import http_client
+from helpers.lan_servers import LanServerProber, normalize_server
+
+
+async def stand_in(routes) -> tuple[web.AppRunner, int]:
+    """A local stand-in relay server, on a free port."""
+    app = web.Application()
+    app.add_routes(routes)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    await web.SockSite(runner, sock).start()
+    return runner, sock.getsockname()[1]
+
+
+def test_normalize_server():
+    assert normalize_server(" JoinSG.net:11453/ ") == "joinsg.net:11453"
+    assert normalize_server("http://relay.example") == "relay.example:11451"
+    assert normalize_server("relay.example:22") is None
+    assert normalize_server("relay.example:8080", ports={8080}) == "relay.example:8080"
+    assert normalize_server("two words") is None
+
+
+def test_probe_stand_in_server():
+    async def main():
+        seen_hosts = []
+
+        async def info(request):
+            seen_hosts.append(request.host)
+            return web.json_response({"online": 3})
+
+        runner, port = await stand_in([web.get("/info", info)])
+        try:
+            prober = LanServerProber(ports={port}, allow=lambda address: address.is_loopback)
+            status = await prober.probe(f"localhost:{port}")
+            assert status.online and status.players == 3 and status.latency > 0
+            assert seen_hosts == ["localhost"]
+            # The default prober only goes to public addresses on relay ports
+            assert not (await LanServerProber().probe(f"localhost:{port}")).online
+            assert not (await LanServerProber(allow=lambda address: address.is_loopback).probe(f"localhost:{port}")).online
+        finally:
+            await runner.cleanup()
+            await http_client.close()
+
+    asyncio.run(main())
+
+
+def test_probe_does_not_follow_redirects():
+    async def main():
+        followed = []
+
+        async def redirect(request):
+            raise web.HTTPFound("/elsewhere")
+
+        async def elsewhere(request):
+            followed.append(True)
+            return web.json_response({"online": 1})
+
+        runner, port = await stand_in([web.get("/info", redirect), web.get("/elsewhere", elsewhere)])
+        try:
+            status = await LanServerProber(ports={port}, allow=lambda address: address.is_loopback).probe(f"127.0.0.1:{port}")
+            assert not status.online and not followed
+        finally:
+            await runner.cleanup()
+            await http_client.close()
+
+    asyncio.run(main())
+
+
+def test_probe_all_tracks_statuses():
+    async def main():
+        async def info(request):
+            return web.json_response({"online": 7})
+
+        runner, port = await stand_in([web.get("/info", info)])
+        try:
+            prober = LanServerProber(ports={port}, allow=lambda address: address.is_loopback)
+            prober.track(1, f"127.0.0.1:{port}")
+            prober.track(2, f"127.0.0.1:{port}")
+            prober.track(3, "127.0.0.1:1")  # Not an allowed port, so never tracked
+            await prober.probe_all()
+            assert prober.status(f"127.0.0.1:{port}").players == 7
+            assert [server for server, mains, status in prober.best_server([1, 2, 3])] == [f"127.0.0.1:{port}"]
+        finally:
+            await runner.cleanup()
+            await http_client.close()
+
+    asyncio.run(main())
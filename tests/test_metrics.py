@@ -0,0 +1,55 @@
+import pytest
+
+from helpers.metrics import Histogram, InteractionMetrics
+
+
+def test_quantiles_never_exceed_the_largest_value():
+    histogram = Histogram()
+    for _ in range(100):
+        histogram.observe(0.001)  # All in the first, 5ms wide bucket
+    assert histogram.quantile(0.5) <= 0.001
+    assert histogram.quantile(0.99) <= 0.001
+
+
+def test_empty_histogram():
+    assert Histogram().quantile(0.5) == 0.0
+
+
+def test_interpolates_inside_a_bucket_and_skips_empty_ones():
+    histogram = Histogram()
+    for _ in range(10):
+        histogram.observe(0.003)  # 0-5ms
+    for _ in range(10):
+        histogram.observe(0.4)  # 250-500ms, with empty buckets in between
+    assert histogram.quantile(0.25) == pytest.approx(0.0025)  # Halfway through the first bucket
+    assert histogram.quantile(0.5) == pytest.approx(0.005)  # Its end
+    assert 0.25 < histogram.quantile(0.75) <= 0.4
+    assert histogram.quantile(1) == pytest.approx(0.4)
+
+
+def test_bounds_belong_to_the_bucket_they_close():
+    histogram = Histogram()
+    histogram.observe(0.005)
+    assert histogram.counts[0] == 1  # Like Prometheus' "le"
+
+
+def test_overflow_bucket_reports_the_largest_value():
+    histogram = Histogram()
+    histogram.observe(1)
+    histogram.observe(30)
+    histogram.observe(12)
+    assert histogram.counts[-1] == 2
+    assert histogram.quantile(0.99) == 30
+    assert histogram.sum == 43 and histogram.count == 3
+
+
+def test_prometheus_buckets_are_cumulative():
+    metrics = InteractionMetrics()
+    metrics.observe("command", 'say "hi"', "total", 0.003)
+    metrics.observe("command", 'say "hi"', "total", 20)
+    text = metrics.prometheus()
+    labels = 'kind="command",name="say \\"hi\\"",phase="total"'
+    assert f'kolkra_interaction_seconds_bucket{{{labels},le="0.005"}} 1' in text
+    assert f'kolkra_interaction_seconds_bucket{{{labels},le="10"}} 1' in text
+    assert f'kolkra_interaction_seconds_bucket{{{labels},le="+Inf"}} 2' in text
+    assert f"kolkra_interaction_seconds_count{{{labels}}} 2" in text
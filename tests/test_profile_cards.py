@@ -0,0 +1,41 @@
+import asyncio
+import datetime
+import io
+from types import SimpleNamespace
+
+from PIL import Image
+
+from helpers.profile_cards import CardCache
+
+
+class Avatar:
+    key = "avatar-hash"
+
+    def with_size(self, size):
+        return self
+
+    async def read(self) -> bytes:
+        out = io.BytesIO()
+        Image.new("RGB", (8, 8), (255, 0, 0)).save(out, "PNG")
+        return out.getvalue()
+
+
+def profile(**values):
+    fields = {"id": "PlayerProfile:abc", "ign": "Alpha", "friend_code": "1234-5678-9012", "xtag": None, "updated_at": datetime.datetime.now()}
+    return SimpleNamespace(**(fields | values))
+
+
+def test_cards_are_cached_by_what_they_show():
+    member = SimpleNamespace(display_avatar=Avatar(), display_name="Player")
+
+    async def main():
+        cache = CardCache()
+        first = await cache.card(profile(), member)
+        assert first.startswith(b"\x89PNG")
+        # Loaded again later, so updated_at differs, but the card looks the same
+        assert await cache.card(profile(updated_at=datetime.datetime.now() + datetime.timedelta(days=1)), member) == first
+        assert cache.hits == {"rendered": 1, "memory": 1}
+        await cache.card(profile(ign="Beta"), member)
+        assert cache.hits["rendered"] == 2
+
+    asyncio.run(main())
@@ -0,0 +1,66 @@
+from types import SimpleNamespace
+
+from helpers.profile_index import ProfileIndex, normalize_friend_code, trigrams
+
+
+def profile(owner_id: int, ign: str = None, xtag: str = None, friend_code: str = None):
+    return SimpleNamespace(owner_id=owner_id, ign=ign, xtag=xtag, friend_code=friend_code)
+
+
+def index_of(*profiles) -> ProfileIndex:
+    index = ProfileIndex()
+    for p in profiles:
+        index.add(p)
+    return index
+
+
+def test_normalize_friend_code():
+    assert normalize_friend_code("SW-1234-5678-9012") == "123456789012"
+    assert normalize_friend_code("1234 5678") is None
+    assert normalize_friend_code(None) is None
+
+
+def test_trigrams_of_short_names():
+    assert trigrams("a") == {"  a", " a "}
+
+
+def test_friend_codes_match_exactly():
+    index = index_of(profile(1, friend_code="SW-1234-5678-9012"))
+    [match] = index.search("123456789012")
+    assert (match.owner_id, match.field, match.value, match.score) == (1, "friend_code", "SW-1234-5678-9012", 1)
+    assert index.search("1234-5678-9013") == []
+
+
+def test_exact_then_prefix_then_fuzzy():
+    index = index_of(profile(1, ign="Splat"), profile(2, ign="Splatoon Fan"), profile(3, ign="Splattt"), profile(4, ign="Inkling"))
+    matches = index.search("splat")
+    assert matches[0].owner_id == 1 and matches[0].score == 1
+    assert {match.owner_id for match in matches[1:3]} == {2, 3} and all(match.score == 0.99 for match in matches[1:3])
+    fuzzy = index.search("Inkleng")  # Misspelt
+    assert [match.owner_id for match in fuzzy] == [4] and fuzzy[0].score < 0.99
+    assert index.search("zzzz") == []
+    assert index.search("   ") == []
+
+
+def test_one_match_per_owner_and_limit():
+    index = index_of(*(profile(owner_id, ign=f"Player{owner_id}", xtag=f"player{owner_id}x") for owner_id in range(30)))
+    matches = index.search("player", limit=10)
+    assert len(matches) == 10
+    assert len({match.owner_id for match in matches}) == 10
+
+
+def test_update_and_remove_leave_nothing_behind():
+    index = index_of(profile(1, ign="Old Name", friend_code="123456789012"))
+    index.add(profile(1, ign="New Name"))
+    assert index.search("old name") == []
+    assert index.search("123456789012") == []
+    assert [match.owner_id for match in index.search("new")] == [1]
+    index.remove(1)
+    index.remove(1)  # Already gone
+    assert len(index) == 0 and not index.names and not index.grams and not index.friend_codes
+
+
+def test_shared_friend_code_keeps_the_latest_owner():
+    index = index_of(profile(1, friend_code="123456789012"), profile(2, friend_code="123456789012"))
+    index.remove(1)  # Doesn't take owner 2's code with it
+    assert [match.owner_id for match in index.search("123456789012")] == [2]
@@ -0,0 +1,54 @@
+import asyncio
+import datetime
+
+from classes import current_guild, guild_configs
+from helpers.scheduler import JobScheduler
+
+
+def test_job_survives_a_restart_and_fires(database):
+    ran = []
+
+    async def main():
+        before = JobScheduler()
+        await before.start(None)
+        job = await before.schedule("test", datetime.timedelta(seconds=0.2), {"number": 1})
+        before.stop()  # The bot goes down before it's due
+        assert len(database.records) == 1
+
+        after = JobScheduler()
+
+        @after.handler("test")
+        async def run(bot, job):
+            ran.append((bot, job.id, job.payload, current_guild.get()))
+
+        await after.start("bot")
+        await asyncio.sleep(0.5)
+        after.stop()
+        return job
+
+    job = asyncio.run(main())
+    assert ran == [("bot", job.id, {"number": 1}, guild_configs.home)]
+    assert not database.records  # Done, so it won't run again after the next restart
+
+
+def test_job_without_handler_waits_for_one(database):
+    ran = []
+
+    async def main():
+        scheduler = JobScheduler()
+        await scheduler.start(None)
+        job = await scheduler.schedule("later", datetime.timedelta(0))
+        await asyncio.sleep(0.1)
+        assert job.id in scheduler.parked and len(database.records) == 1  # Not dropped
+
+        @scheduler.handler("later")
+        async def run(bot, job):
+            ran.append(job.id)
+
+        await asyncio.sleep(0.1)
+        scheduler.stop()
+        return job
+
+    job = asyncio.run(main())
+    assert ran == [job.id]
+    assert not database.records
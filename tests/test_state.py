@@ -0,0 +1,48 @@
+import asyncio
+
+import pytest
+
+from classes import ANY, ObservableState, wait_for
+
+
+def test_wait_wakes_on_set():
+    async def main():
+        state = ObservableState()
+        asyncio.get_running_loop().call_later(0.01, state.set, "key", 3)
+        assert await state.wait("key", lambda value: value == 3, 1)
+        assert not await state.wait("key", lambda value: value == 4, 0.01)
+        assert not state.waiters
+
+    asyncio.run(main())
+
+
+def test_failing_predicate_only_fails_its_waiter():
+    calls = []
+
+    def broken(value):
+        calls.append(value)
+        if len(calls) > 1:  # The first check is made by wait() itself
+            raise KeyError(value)
+
+    async def main():
+        state = ObservableState()
+        failing = asyncio.create_task(state.wait(ANY, broken))
+        other = asyncio.create_task(state.wait("key", lambda value: value == 2, 1))
+        await asyncio.sleep(0)
+        state.set("key", 1)  # Doesn't raise into the writer
+        with pytest.raises(KeyError):
+            await failing
+        state.set("key", 2)
+        assert await other
+        assert not state.waiters
+
+    asyncio.run(main())
+
+
+def test_wait_for_still_polls_by_default():
+    async def main():
+        flag = []  # Not kept in state, so only polling can notice it
+        asyncio.get_running_loop().call_later(0.05, flag.append, True)
+        assert await wait_for(lambda: bool(flag), 1)
+
+    asyncio.run(main())
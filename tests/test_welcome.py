@@ -0,0 +1,13 @@
+from cogs.welcome import who
+
+
+def test_who():
+    assert who(["A"]) == "A"
+    assert who(["A", "B", "C"]) == "A, B and C"
+    assert who(["A", "B", "C"], 4) == "A, B, C and 4 others"
+    assert who(["A"], 1) == "A and 1 other"
+
+
+def test_who_without_names():
+    assert who([], 7) == "7 members"
+    assert who([], 1) == "1 member"